@@ -0,0 +1,95 @@
+"""
+Remembers the last successful API Key Check, so the Plugin does not have to wait for the Server on every Startup.
+Only a Hash of the Key is stored, never the Key itself. A different Key never matches a cached Check.
+
+The cached Result is trusted right away and checked again in the Background (see event_handling.check_api_key).
+It is thrown away as soon as the Key is changed in the Settings, or the Server rejects the Key (401).
+"""
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Optional
+
+from classes.logger_factory import logger
+
+
+def _hash_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf8")).hexdigest()
+
+
+class AuthCache:
+
+    def __init__(self, cache_file: pathlib.Path):
+        self.__cache_file = cache_file
+        self.__mutex = threading.Lock()
+        self.__entry = self.__load()
+
+    def __load(self) -> dict:
+        try:
+            with self.__cache_file.open("r", encoding="utf8") as file:
+                entry = json.load(file)
+            if isinstance(entry, dict):
+                return entry
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def __save(self):
+        try:
+            if len(self.__entry) == 0:
+                self.__cache_file.unlink(missing_ok=True)
+                return
+            temp_file = self.__cache_file.with_suffix(".tmp")
+            with temp_file.open("w", encoding="utf8") as file:
+                json.dump(self.__entry, file)
+            os.replace(temp_file, self.__cache_file)
+        except OSError as e:
+            logger.warning(f"Could not save the API Key Cache: {e}")
+
+    def is_valid(self, api_key: str, max_age_seconds: float) -> bool:
+        """
+        True if this Key was accepted by the Server less than max_age_seconds ago
+        """
+        with self.__mutex:
+            if self.__entry.get("key_hash") != _hash_key(api_key):
+                return False
+            age = time.time() - self.__entry.get("validated_at", 0)
+            return 0 <= age < max_age_seconds
+
+    @property
+    def formats_header(self) -> Optional[str]:
+        """
+        The Bulk Formats the Server announced with the cached Check
+        """
+        with self.__mutex:
+            return self.__entry.get("formats_header")
+
+    def remember(self, api_key: str, formats_header: Optional[str]):
+        with self.__mutex:
+            self.__entry = {"key_hash": _hash_key(api_key), "validated_at": time.time(),
+                            "formats_header": formats_header}
+            self.__save()
+
+    def invalidate(self):
+        with self.__mutex:
+            if len(self.__entry) == 0:
+                return
+            logger.info("Dropping the cached API Key Check")
+            self.__entry = {}
+            self.__save()
+
+
+_auth_cache: Optional[AuthCache] = None
+_auth_cache_mutex = threading.Lock()
+
+
+def get_auth_cache() -> AuthCache:
+    global _auth_cache
+    with _auth_cache_mutex:
+        if _auth_cache is None:
+            from classes.plugin_settings import configuration
+            _auth_cache = AuthCache(configuration.data_dir / "auth_cache.json")
+        return _auth_cache
@@ -0,0 +1,168 @@
+"""
+Keeps the historic Aggregation (the "Backfill") from getting in the Way of the Game. While the Game is being played
+(live Journal Events arrived recently), the Backfill
+ - only works for a Share of the Time (Duty Cycle) and sleeps for the Rest
+ - reads at most a certain Number of Bytes per Second from Disk
+ - or, in "only while idle"-Mode, waits entirely until the Game is quiet again.
+Once no Journal Events arrived for a while, the Backfill runs at full Speed.
+
+The Backfill Thread itself runs with a lower Priority where the OS allows it. It can also be paused, resumed and
+cancelled from the UI.
+"""
+import os
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+from classes.logger_factory import logger
+
+IDLE_AFTER_SECONDS = 120.0
+"""
+The Game counts as idle if no live Journal Event arrived for this long
+"""
+_SLICE_SECONDS = 0.05
+
+_last_live_activity: Optional[float] = None
+
+
+def notify_live_activity():
+    """
+    Called for every live Journal Event. Cheap enough for the Main Thread.
+    """
+    global _last_live_activity
+    _last_live_activity = time.monotonic()
+
+
+def is_game_active() -> bool:
+    last_activity = _last_live_activity
+    return last_activity is not None and time.monotonic() - last_activity < IDLE_AFTER_SECONDS
+
+
+class BackfillCancelled(Exception):
+    pass
+
+
+class BackfillGovernor:
+
+    def __init__(self, duty_cycle: float = 1.0, max_bytes_per_second: Optional[float] = None,
+                 only_while_idle: bool = False):
+        """
+        duty_cycle and max_bytes_per_second only apply while the Game is active
+        """
+        self.duty_cycle = min(max(duty_cycle, 0.01), 1.0)
+        self.max_bytes_per_second = max_bytes_per_second
+        self.only_while_idle = only_while_idle
+        self.__condition = threading.Condition()
+        self.__paused = False
+        self.__cancelled = False
+        self.__waiting_for_idle = False
+        self.__slice_start = time.monotonic()
+        self.__slice_bytes = 0
+        self.on_waiting_changed: Optional[Callable[[], None]] = None
+        """
+        Called (from the Backfill Thread) when the Backfill starts or stops waiting for the Game to become idle
+        """
+
+    @staticmethod
+    def from_configuration() -> "BackfillGovernor":
+        from classes.plugin_settings import configuration
+        return BackfillGovernor(configuration.backfill_cpu_percent / 100,
+                                configuration.backfill_max_mb_per_second * 1_000_000,
+                                configuration.backfill_only_while_idle)
+
+    @property
+    def is_paused(self) -> bool:
+        return self.__paused
+
+    @property
+    def is_waiting_for_idle(self) -> bool:
+        return self.__waiting_for_idle
+
+    def pause(self):
+        with self.__condition:
+            self.__paused = True
+            self.__condition.notify_all()
+
+    def resume(self):
+        with self.__condition:
+            self.__paused = False
+            self.__condition.notify_all()
+
+    def cancel(self, _deadline: Optional[float] = None):
+        """
+        The Backfill stops at its next Checkpoint. Takes a Deadline so it can be used as a Stop Hook of the Lifecycle.
+        """
+        with self.__condition:
+            self.__cancelled = True
+            self.__condition.notify_all()
+
+    def __wait(self, seconds: Optional[float]):
+        # Waits on the Condition, so pause/resume/cancel take effect right away. Call with the Condition held.
+        self.__condition.wait(seconds)
+        if self.__cancelled:
+            raise BackfillCancelled()
+
+    def checkpoint(self, bytes_read: int = 0):
+        """
+        Called by the Backfill every now and then. Blocks as long as the Backfill should not go on.
+        Raises BackfillCancelled once the Backfill was cancelled.
+        """
+        with self.__condition:
+            if self.__cancelled:
+                raise BackfillCancelled()
+            while self.__paused:
+                self.__wait(None)
+
+        if self.only_while_idle and is_game_active():
+            self.__set_waiting_for_idle(True)
+            try:
+                with self.__condition:
+                    while self.__paused or is_game_active():
+                        self.__wait(1.0)
+            finally:
+                self.__set_waiting_for_idle(False)
+
+        with self.__condition:
+            if not is_game_active():
+                # Nobody is playing. Full Speed.
+                self.__slice_start = time.monotonic()
+                self.__slice_bytes = 0
+                return
+
+            self.__slice_bytes += bytes_read
+            worked = time.monotonic() - self.__slice_start
+            byte_limit = None if self.max_bytes_per_second is None else self.max_bytes_per_second * _SLICE_SECONDS
+            if worked < _SLICE_SECONDS and (byte_limit is None or self.__slice_bytes < byte_limit):
+                return
+            sleep_for = worked * (1 - self.duty_cycle) / self.duty_cycle
+            if self.max_bytes_per_second is not None:
+                sleep_for = max(sleep_for, self.__slice_bytes / self.max_bytes_per_second - worked)
+            if sleep_for > 0:
+                self.__wait(sleep_for)
+            self.__slice_start = time.monotonic()
+            self.__slice_bytes = 0
+
+    def __set_waiting_for_idle(self, waiting: bool):
+        # Not called with the Condition held, the Callback may have to wait for the Main Thread
+        self.__waiting_for_idle = waiting
+        if self.on_waiting_changed is not None:
+            self.on_waiting_changed()
+
+    @staticmethod
+    def lower_thread_priority():
+        """
+        Lowers the Priority of the calling Thread only, so EDMC and the Game are not affected
+        """
+        try:
+            if sys.platform == "win32":
+                import ctypes
+                thread_mode_background_begin = 0x00010000  # Lowers CPU and I/O Priority
+                kernel32 = ctypes.windll.kernel32  # type: ignore
+                kernel32.SetThreadPriority(kernel32.GetCurrentThread(), thread_mode_background_begin)
+            elif sys.platform.startswith("linux"):
+                # On Linux, the Nice Value of a Thread ID only applies to that Thread
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+            # Elsewhere Priorities are per Process. Lowering them would slow down EDMC as a whole.
+        except (OSError, AttributeError) as e:
+            logger.info(f"Could not lower the Priority of the Backfill Thread: {e}")
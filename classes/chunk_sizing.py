@@ -0,0 +1,76 @@
+"""
+Decides how many Events go into the next Chunk of a Bulk Upload. Instead of a fixed 100 Events, the Size follows
+how the Upload is going, AIMD-style like TCP does with its Window:
+ - every Chunk the Server took quickly lets the next Chunk grow by a fixed Step (additive increase)
+ - a slow or failed Chunk halves the Size (multiplicative decrease)
+
+On top of that, a Chunk never gets bigger than the Byte Budget, using the average Size of an Event seen so far.
+Fast Connections end up with big Chunks (less Overhead per Event), a struggling Server gets small ones.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class ChunkSizeBounds:
+    min_events: int = 10
+    max_events: int = 1000
+    target_bytes: int = 256_000
+    """
+    Chunks are kept below this many Bytes of Request Body
+    """
+    target_latency_seconds: float = 2.0
+    """
+    Chunks that take longer than this to be answered count as "slow"
+    """
+
+
+class AdaptiveChunkSizer:
+    _INCREASE_STEP_EVENTS = 50
+    _BYTES_PER_EVENT_SMOOTHING = 0.2
+
+    def __init__(self, bounds: ChunkSizeBounds, initial_events: int = 100):
+        self.bounds = bounds
+        self.__size = self.__clamp(initial_events)
+        self.__bytes_per_event: Optional[float] = None
+        self.__mutex = threading.Lock()
+
+    def __clamp(self, size: float) -> int:
+        return int(max(self.bounds.min_events, min(self.bounds.max_events, size)))
+
+    def next_size(self) -> int:
+        """
+        How many Events to put into the next Chunk
+        """
+        with self.__mutex:
+            size = self.__size
+            if self.__bytes_per_event is not None:
+                size = min(size, self.bounds.target_bytes / self.__bytes_per_event)
+            return self.__clamp(size)
+
+    def record(self, events: int, body_bytes: int, latency_seconds: Optional[float], ok: bool):
+        """
+        Tell the Sizer how a Chunk went. latency_seconds is None if there was no Response at all.
+        """
+        with self.__mutex:
+            if events > 0 and body_bytes > 0:
+                sample = body_bytes / events
+                if self.__bytes_per_event is None:
+                    self.__bytes_per_event = sample
+                else:
+                    self.__bytes_per_event += self._BYTES_PER_EVENT_SMOOTHING * (sample - self.__bytes_per_event)
+
+            is_slow = latency_seconds is None or latency_seconds > self.bounds.target_latency_seconds
+            if ok and not is_slow:
+                # Do not grow past the Byte Budget, it would only have to be halved down again after a slow Chunk
+                byte_limit = self.bounds.target_bytes / (self.__bytes_per_event or 1)
+                if self.__size < byte_limit:
+                    self.__size = self.__clamp(self.__size + self._INCREASE_STEP_EVENTS)
+            else:
+                self.__size = self.__clamp(self.__size / 2)
+
+    @property
+    def bytes_per_event(self) -> Optional[float]:
+        with self.__mutex:
+            return self.__bytes_per_event
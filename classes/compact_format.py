@@ -0,0 +1,128 @@
+"""
+A compact Format for Bulk Uploads. In a historic Upload the own CMDR Name and a handful of Ships show up in nearly
+every Event, so instead of repeating {"name", "ship", "rank"}-Objects, every distinct String is stored once in a
+String Table, and the Events become parallel Arrays of Indices into that Table, Timestamps and Ranks.
+
+Example for two Kills of WDX:
+{
+  "format": "compact-v1",
+  "strings": ["WDX", "fdl", "Victim1", "Victim2"],
+  "timestamp": [1672567500, 1672567560],
+  "killer_name": [0, 0], "killer_ship": [1, 1], "killer_rank": [3, 3],
+  "victim_name": [2, 3], "victim_ship": [-1, -1], "victim_rank": [4, 2]
+}
+A "location"-Array is only present if any Event has a Location. -1 means "not present".
+
+The Server announces that it understands this Format with the X-PvpBot-Bulk-Formats Header.
+decode() is the reference Decoder, it turns the compact Body back into the plain List of Events.
+"""
+from typing import Optional
+
+COMPACT_FORMAT_NAME = "compact-v1"
+FORMATS_HEADER = "X-PvpBot-Bulk-Formats"
+"""
+Response Header in which the Server lists the Bulk Formats it understands, comma-separated
+"""
+FORMAT_REQUEST_HEADER = "X-PvpBot-Bulk-Format"
+"""
+Request Header telling the Server which Format the Body of a Bulk Request has
+"""
+
+
+class _StringTable:
+    def __init__(self):
+        self.strings: list[str] = []
+        self.__indices: dict[str, int] = {}
+
+    def index_of(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        index = self.__indices.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(value)
+            self.__indices[value] = index
+        return index
+
+
+def encode(events: list[dict]) -> dict:
+    """
+    Encodes Events (in the Format of PvpKillEventData.as_dict) into the compact Format
+    """
+    table = _StringTable()
+    body: dict = {
+        "format": COMPACT_FORMAT_NAME,
+        "strings": table.strings,
+        "timestamp": [],
+        "killer_name": [], "killer_ship": [], "killer_rank": [],
+        "victim_name": [], "victim_ship": [], "victim_rank": [],
+    }
+    locations = []
+    has_location = False
+    for event in events:
+        killer = event["killer"]
+        victim = event["victim"]
+        body["timestamp"].append(event["timestamp"])
+        body["killer_name"].append(table.index_of(killer["name"]))
+        body["killer_ship"].append(table.index_of(killer.get("ship")))
+        body["killer_rank"].append(killer["rank"])
+        body["victim_name"].append(table.index_of(victim["name"]))
+        body["victim_ship"].append(table.index_of(victim.get("ship")))
+        body["victim_rank"].append(victim["rank"])
+        location = event.get("location")
+        has_location = has_location or location is not None
+        locations.append(table.index_of(location))
+    if has_location:
+        body["location"] = locations
+    return body
+
+
+def decode(body: dict) -> list[dict]:
+    """
+    Reference Decoder. Turns a compact Body back into a List of Events as they would be sent in the plain Format.
+    Raises a ValueError if the Body is malformed.
+    """
+    if body.get("format") != COMPACT_FORMAT_NAME:
+        raise ValueError(f"Unknown Bulk Format {body.get('format')}")
+    strings: list[str] = body["strings"]
+    columns = ["timestamp", "killer_name", "killer_ship", "killer_rank", "victim_name", "victim_ship", "victim_rank"]
+    length = len(body["timestamp"])
+    for column in columns:
+        if len(body[column]) != length:
+            raise ValueError(f"Column {column} has {len(body[column])} Entries, expected {length}")
+    locations = body.get("location")
+    if locations is not None and len(locations) != length:
+        raise ValueError(f"Column location has {len(locations)} Entries, expected {length}")
+
+    def lookup(index: int) -> Optional[str]:
+        if index == -1:
+            return None
+        if index < 0 or index >= len(strings):
+            raise ValueError(f"String Index {index} is out of range")
+        return strings[index]
+
+    def commander(name_index: int, ship_index: int, rank: int) -> dict:
+        entry = {"name": lookup(name_index)}
+        ship = lookup(ship_index)
+        if ship is not None:
+            entry["ship"] = ship
+        entry["rank"] = rank
+        return entry
+
+    events = []
+    for i in range(length):
+        event = {
+            "timestamp": body["timestamp"][i],
+            "victim": commander(body["victim_name"][i], body["victim_ship"][i], body["victim_rank"][i]),
+            "killer": commander(body["killer_name"][i], body["killer_ship"][i], body["killer_rank"][i]),
+        }
+        if locations is not None and locations[i] != -1:
+            event["location"] = lookup(locations[i])
+        events.append(event)
+    return events
+
+
+def supports_compact_format(formats_header: Optional[str]) -> bool:
+    if formats_header is None:
+        return False
+    return COMPACT_FORMAT_NAME in map(str.strip, formats_header.split(","))
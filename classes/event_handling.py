@@ -1,31 +1,79 @@
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+import functools
+import itertools
+import json
 from enum import Enum
-import queue
 import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import requests
 from classes.plugin_settings import configuration
-from classes.logger_factory import logger
-from typing import Callable, Optional
+from classes.logger_factory import log_payload, logger
+from classes.rate_limiter import TokenBucket
+from classes.send_queue import SendPriority, SendQueue
+from classes.spool import Spool
+from classes.transport import DEFAULT_TIMEOUT_SECONDS, transport
+from typing import Any, Callable, Iterable, Optional
+from classes import compact_format
+from classes.auth_cache import get_auth_cache
+from classes.chunk_sizing import AdaptiveChunkSizer, ChunkSizeBounds
+from classes.instance_coordination import InstanceCoordinator, get_coordinator
+from classes.latency_trace import EventTrace, get_latency_tracer
+from classes.lifecycle import lifecycle
+from classes.quarantine import get_quarantine
+from classes.killboard import get_killboard
 from classes.data import create_kill_from_died_event, create_pvpkill_event, PvpKillEventData
-from config import Any
-
-__PVP_BOT_SERVER_URL = "http://api.gankers.org"
 
 
 class MessageIntent(Enum):
     CHECK_API_KEY = 0
     SEND_NEW_EVENT = 1
+    SEND_HISTORIC_DATA = 2
+    NEGOTIATE_BULK_FORMAT = 3
+    REVALIDATE_API_KEY = 4
+    """
+    Checks a cached API Key Check again, without bothering the User unless the Key was rejected
+    """
 
 
+_priority_by_intent = {
+    MessageIntent.CHECK_API_KEY: SendPriority.AUTH_CHECK,
+    MessageIntent.NEGOTIATE_BULK_FORMAT: SendPriority.AUTH_CHECK,
+    MessageIntent.SEND_NEW_EVENT: SendPriority.LIVE_EVENT,
+    MessageIntent.SEND_HISTORIC_DATA: SendPriority.HISTORIC_BULK,
+    MessageIntent.REVALIDATE_API_KEY: SendPriority.BACKGROUND,
+}
 
-@dataclass
+
+@dataclass(eq=False)
 class _HttpCommand:
     endpoint: str
-    body: dict | list[dict]
+    body: dict | list[dict] | bytes
+    """
+    bytes are sent as they are, everything else is encoded as JSON
+    """
     intent: MessageIntent
     method: str = "post"
     extra: Optional[dict] = None
+    """
+    Additional Headers for this Request
+    """
+    timeout: float = DEFAULT_TIMEOUT_SECONDS
+    result: Future = field(default_factory=Future)
+    """
+    Completed with the Response once the Server answered (with anything but a 429), or with the Exception
+    if the Request could not be sent. 
+    """
+    trace: Optional[EventTrace] = None
+    """
+    Only set for live Events
+    """
+
+    @property
+    def priority(self) -> SendPriority:
+        return _priority_by_intent[self.intent]
 
 def build_headers():
     auth = configuration.api_key
@@ -37,183 +85,693 @@ def build_headers():
         "Accept": "application/json"
     }
 
+
+# None until the first Message. Outside of EDMC the Import of classes.ui fails, and a failed Import is not cached by
+# Python, so it would be tried again (and searched for on Disk) for every Message.
+_ui_available: Optional[bool] = None
+
+
+def write_ui_message(msg: str, message_type_name: str, duration_millis: int):
+    """
+    Shows the Message in EDMC, or only logs it when running outside of EDMC (e.g. cli.py)
+    """
+    global _ui_available
+    if _ui_available is not False:
+        try:
+            from classes.ui import ui, GenericUiMessage, GenericUiMessageType
+            _ui_available = True
+        except ImportError:
+            _ui_available = False
+    if not _ui_available:
+        logger.info(f"{message_type_name}: {msg}")
+        return
+    message = GenericUiMessage(msg, GenericUiMessageType[message_type_name], duration_millis)
+    ui.notify_about_new_message(message, True)
+
+
 class HttpThread:
     """
     Messages to the Backend are done here to not block the Main Thread. If there was an issue here,
     the listeners (self.__callbacks) will get invoked - one of these Callbacks should be the UI. It can
     then display the error on the UI.
+    All Requests, including the Chunks of a historic Upload, are taken from one SendQueue in order of their Priority.
+    They are then handed to the Transport, which keeps several of them in flight at once.
     """
 
     @staticmethod
     def __write_ui_error_message(msg: str, duration_millis = 5000):
-        from classes.ui import ui, GenericUiMessage, GenericUiMessageType
-        message = GenericUiMessage(msg, GenericUiMessageType.ERROR, duration_millis)
-        ui.notify_about_new_message(message, True)
+        write_ui_message(msg, "ERROR", duration_millis)
 
     @staticmethod
     def __write_ui_warning_message(msg: str, duration_millis = 5000):
-        from classes.ui import ui, GenericUiMessage, GenericUiMessageType
-        message = GenericUiMessage(msg, GenericUiMessageType.WARNING ,duration_millis)
-        ui.notify_about_new_message(message, True)
+        write_ui_message(msg, "WARNING", duration_millis)
 
     @staticmethod
     def __write_ui_info_message(msg: str, duration_millis = 5000):
-        from classes.ui import ui, GenericUiMessage, GenericUiMessageType
-        message = GenericUiMessage(msg, GenericUiMessageType.INFO, duration_millis)
-        ui.notify_about_new_message(message, True)
+        write_ui_message(msg, "INFO", duration_millis)
 
     # This is not run in the main thread
     def __thread_loop(self):
-        wait_next_loop_because_of_timeout = False
-        while True:
-            if wait_next_loop_because_of_timeout:
-                logger.info("HTTP Thread is sleeping for 1 Minute because Server rejects with 429")
-                time.sleep(60)
-                wait_next_loop_because_of_timeout = False
-            logger.info("Awaiting new HTTP POST Job in Thread...")
-            # Blocking
-            entry = self.__message_queue.get()
-            logger.info("Received new HTTP Post Job in Thread.")
-
+        while not self.__stopping.is_set():
+            # Only take the next Job once there is Room for it in the Transport. Until then it stays in the Queue,
+            # where more important Jobs can still overtake it.
+            self.__in_flight.acquire()
+            logger.debug("Awaiting new HTTP POST Job in Thread...")
+            # Blocking, but wakes up now and then to see if the Plugin is stopping
+            entry = self.__message_queue.get(timeout=0.5)
+            if entry is None:
+                self.__in_flight.release()
+                continue
+            logger.debug("Received new HTTP Post Job in Thread.")
+            # Blocking until the Rate Limit allows the next Request
+            while not self.__rate_limiter.acquire(timeout=0.5):
+                if self.__stopping.is_set():
+                    break
+            if self.__stopping.is_set():
+                self.__message_queue.put_front(entry, entry.priority)
+                self.__in_flight.release()
+                return
+
+            logger.info("Sending Request to %s", entry.endpoint)
+            if entry.trace is not None:
+                entry.trace.sent = time.time()
+            with self.__mutex:
+                self.__in_flight_entries.add(entry)
             try:
-                logger.info(f"Sending Request to {entry.endpoint}")
-                response = None
-                if entry.method == "post":
-                    response = requests.post(entry.endpoint, json=entry.body, headers=build_headers())
-                if entry.method == "get":
-                    response = requests.get(entry.endpoint, headers=build_headers())
-                if response is None:
-                    return
-
-                status_code = response.status_code
-                
-                if status_code == 200:
-                    if entry.intent == MessageIntent.CHECK_API_KEY:
-                        HttpThread.__write_ui_info_message("PvpBot: API Key is valid")
-                    elif entry.intent == MessageIntent.SEND_NEW_EVENT:
-                        HttpThread.__write_ui_info_message("PvpBot: Server acknowledged Event.")
-                    continue  # Server is Happy w/ Response. New Kill/Died-Entry has been created
-                elif status_code == 400:
-                    # Server complains about something where the client is at fault.
-                    error_message = f"PvpBot Backend rejected an event for the following reason:\n{response.text}" # type: ignore
-                    HttpThread.__write_ui_error_message(error_message)
-                elif status_code == 401:
-                    # Server complains about bad Auth
-                    HttpThread.__write_ui_error_message("PvpBot rejected your API Key. Make sure it is correct.", -1)
-                elif status_code == 404:
-                    HttpThread.__write_ui_error_message("PvpBot doesnt know this API Endpoint. This should not happen.")
-                elif status_code == 429:
-                    # Too many requests. Block this thread for a minute and retry
-                    HttpThread.__write_ui_warning_message("PvpBot complains about too many requests. "
-                                                  "Waiting a minute and retrying.")
-                    self.__message_queue.put(entry)
-                    wait_next_loop_because_of_timeout = True
-                elif status_code == 500:
-                    # Internal Server Error
-                    HttpThread.__write_ui_error_message("PvpBots Backend shit the bed :). Your Request is dropped.")
-                else:
-                    HttpThread.__write_ui_warning_message(f"PvpBot Responded w/ {str(status_code)} unexpectedly.")
-
-            except requests.exceptions.ConnectionError as ex:
-                logger.exception(ex)
-                HttpThread.__write_ui_error_message("Error connecting to Server. See logs for more infos.")
+                headers = build_headers()
+                if entry.extra is not None:
+                    headers.update(entry.extra)
+                future = transport.submit(entry.method, entry.endpoint, entry.body, headers, entry.timeout)
             except Exception as ex:
-                error_str = str(ex)
-                logger.exception(ex)
-                HttpThread.__write_ui_error_message(f"Pvp Bot Plugin Failed with the following Error:\n{error_str}")
-
-    def __init__(self, baseurl: str):
-        self.__baseurl = baseurl
-        self.__message_queue: queue.Queue[_HttpCommand] = queue.Queue()
-
-        self.__thread = threading.Thread(
-            name="pvpbot-http-sender-thread", target=self.__thread_loop, daemon=True)
-        self.__thread.start()
-    
+                self.__request_finished(entry)
+                self.__handle_exception(entry, ex)
+                continue
+            future.add_done_callback(functools.partial(self.__on_request_done, entry))
+
+    def __request_finished(self, entry: _HttpCommand):
+        with self.__mutex:
+            self.__in_flight_entries.discard(entry)
+        self.__in_flight.release()
+
+    # This is run in the Transport's Thread
+    def __on_request_done(self, entry: _HttpCommand, future: Future):
+        self.__request_finished(entry)
+        try:
+            response = future.result()
+        except Exception as ex:
+            self.__handle_exception(entry, ex)
+            return
+        try:
+            self.__handle_response(entry, response)
+        except Exception as ex:
+            self.__handle_exception(entry, ex)
+
+    def __handle_response(self, entry: _HttpCommand, response: requests.Response):
+        status_code = response.status_code
+        pause_seconds = self.__rate_limiter.update_from_response(status_code, response.headers)
+        coordinator = _get_coordinator()
+        if pause_seconds > 0 and coordinator is not None:
+            # Other Instances (and the next Leader) use the same Key. They should not run into it either.
+            coordinator.remember_pause(pause_seconds)
+        if entry.trace is not None:
+            if status_code == 429:
+                entry.trace.retries += 1
+            else:
+                entry.trace.responded = time.time()
+                get_latency_tracer().finish(entry.trace, str(status_code))
+
+        if status_code == 200 and entry.intent in (MessageIntent.CHECK_API_KEY, MessageIntent.NEGOTIATE_BULK_FORMAT,
+                                                   MessageIntent.REVALIDATE_API_KEY):
+            formats_header = response.headers.get(compact_format.FORMATS_HEADER)
+            _remember_bulk_formats(formats_header)
+            if configuration.api_key is not None:
+                get_auth_cache().remember(configuration.api_key, formats_header)
+        elif status_code == 401:
+            get_auth_cache().invalidate()
+
+        if status_code != 429:
+            if not entry.result.done():
+                entry.result.set_result(response)
+            if entry.intent in (MessageIntent.SEND_HISTORIC_DATA, MessageIntent.NEGOTIATE_BULK_FORMAT):
+                # Whoever sent this waits for the Result and handles the Response itself
+                return
+            if entry.intent == MessageIntent.REVALIDATE_API_KEY and status_code != 401:
+                # The cached Check was already trusted on Startup. Only a rejected Key is worth a Message.
+                return
+
+        if status_code == 200:
+            if entry.intent == MessageIntent.CHECK_API_KEY:
+                HttpThread.__write_ui_info_message("PvpBot: API Key is valid")
+                if not configuration.offline_mode:
+                    # The Server is reachable. Upload what could not be sent last time.
+                    flush_spool_in_background()
+            elif entry.intent == MessageIntent.SEND_NEW_EVENT:
+                HttpThread.__write_ui_info_message("PvpBot: Server acknowledged Event.")
+            # Server is Happy w/ Response. New Kill/Died-Entry has been created
+        elif status_code == 400:
+            # Server complains about something where the client is at fault.
+            error_message = f"PvpBot Backend rejected an event for the following reason:\n{response.text}" # type: ignore
+            HttpThread.__write_ui_error_message(error_message)
+        elif status_code == 401:
+            # Server complains about bad Auth
+            HttpThread.__write_ui_error_message("PvpBot rejected your API Key. Make sure it is correct.", -1)
+        elif status_code == 404:
+            HttpThread.__write_ui_error_message("PvpBot doesnt know this API Endpoint. This should not happen.")
+        elif status_code == 429:
+            # Too many requests. The Rate Limiter now pauses until the Server accepts Requests again. Retry then.
+            HttpThread.__write_ui_warning_message("PvpBot complains about too many requests. "
+                                          f"Waiting {int(pause_seconds)}s and retrying.")
+            self.__message_queue.put_front(entry, entry.priority)
+        elif status_code == 500:
+            # Internal Server Error
+            HttpThread.__write_ui_error_message("PvpBots Backend shit the bed :). Your Request is dropped.")
+        else:
+            HttpThread.__write_ui_warning_message(f"PvpBot Responded w/ {str(status_code)} unexpectedly.")
 
-    def push_new_post_message(self, endpoint: str, post_body: list[dict] | dict, intent: MessageIntent):
-        command = _HttpCommand(endpoint, post_body, intent)
-        self.push_raw(command)
+    @staticmethod
+    def __handle_exception(entry: _HttpCommand, ex: BaseException):
+        if not entry.result.done():
+            entry.result.set_exception(ex)
+        is_unreachable = isinstance(ex, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                         asyncio.TimeoutError))
+        if is_unreachable and entry.intent == MessageIntent.SEND_NEW_EVENT and isinstance(entry.body, dict):
+            # The Server is not reachable right now. Keep the Event and upload it later.
+            logger.warning(f"Could not reach {entry.endpoint} ({type(ex).__name__}). Event was saved to the Spool.")
+            get_spool().append(entry.body)
+            if entry.trace is not None:
+                get_latency_tracer().finish(entry.trace, "spooled")
+            HttpThread.__write_ui_warning_message("PvpBot Server is not reachable.\n"
+                                                  "The Event was saved and will be uploaded later.")
+            return
+        if entry.trace is not None:
+            get_latency_tracer().finish(entry.trace, "error")
+        if isinstance(ex, requests.exceptions.ConnectionError):
+            logger.exception(ex)
+            HttpThread.__write_ui_error_message("Error connecting to Server. See logs for more infos.")
+        elif isinstance(ex, (requests.exceptions.Timeout, asyncio.TimeoutError)):
+            logger.error(f"Request to {entry.endpoint} timed out")
+            HttpThread.__write_ui_error_message("PvpBot Server did not answer in time. Your Request is dropped.")
+        else:
+            error_str = str(ex)
+            logger.exception(ex)
+            HttpThread.__write_ui_error_message(f"Pvp Bot Plugin Failed with the following Error:\n{error_str}")
+
+    def __init__(self):
+        self.__message_queue: SendQueue[_HttpCommand] = SendQueue()
+        self.__rate_limiter = TokenBucket(configuration.rate_limit_per_minute, configuration.rate_limit_burst)
+        coordinator = _get_coordinator()
+        if coordinator is not None and coordinator.remaining_pause() > 0:
+            self.__rate_limiter.pause(coordinator.remaining_pause())
+        self.__in_flight = threading.BoundedSemaphore(transport.max_in_flight)
+        self.__in_flight_entries: set[_HttpCommand] = set()
+        self.__mutex = threading.Lock()
+        self.__stopping = threading.Event()
+
+        self.__thread = lifecycle.start_thread("http-sender-thread", self.__thread_loop)
+        lifecycle.on_stop("HTTP Thread", self.stop)
+
+    def stop(self, deadline: float):
+        """
+        Keeps sending until the Queue is empty or the Deadline is reached. Live Events that could not be sent by then
+        (queued or still in flight) are saved to the Spool, everything else is cancelled.
+        """
+        while time.monotonic() < deadline:
+            with self.__mutex:
+                in_flight = len(self.__in_flight_entries)
+            if in_flight == 0 and self.__message_queue.qsize() == 0:
+                break
+            time.sleep(0.05)
+        self.__stopping.set()
+        # The Loop only waits 0.5s at a Time. It has to be gone before the Queue is emptied below, otherwise it could
+        # still put back the Request it was holding, and that Request would be lost.
+        self.__thread.join(max(0.6, deadline - time.monotonic()))
 
-    def push_raw(self, cmd: _HttpCommand):
-        cmd.endpoint = f"{self.__baseurl}{cmd.endpoint}"
-        self.__message_queue.put(cmd)
+        left_over: list[_HttpCommand] = []
+        while True:
+            entry = self.__message_queue.get(timeout=0)
+            if entry is None:
+                break
+            left_over.append(entry)
+        with self.__mutex:
+            # A Request still in flight may or may not reach the Server. Rather send an Event twice than never.
+            left_over.extend(entry for entry in self.__in_flight_entries if not entry.result.done())
+
+        saved = 0
+        for entry in left_over:
+            if entry.intent == MessageIntent.SEND_NEW_EVENT and isinstance(entry.body, dict):
+                get_spool().append(entry.body)
+                saved += 1
+                if entry.trace is not None:
+                    get_latency_tracer().finish(entry.trace, "spooled")
+            if not entry.result.done():
+                entry.result.set_exception(RuntimeError("PvpBot is shutting down"))
+        get_spool().rotate()
+        logger.info(f"HTTP Thread stopped. {saved} unsent Events were saved to the Spool, "
+                    f"{len(left_over) - saved} other Requests were dropped.")
+        transport.stop()
+
+
+    def pending_requests(self) -> int:
+        """
+        Requests waiting in the Queue, not counting the ones in flight
+        """
+        return self.__message_queue.qsize()
+
+    def in_flight_requests(self) -> int:
+        """
+        Requests sent to the Server that have not been answered yet
+        """
+        with self.__mutex:
+            return len(self.__in_flight_entries)
+
+    def push_new_post_message(self, endpoint: str, post_body: list[dict] | dict, intent: MessageIntent,
+                              trace: Optional[EventTrace] = None) -> bool:
+        command = _HttpCommand(endpoint, post_body, intent, trace=trace)
+        return self.push_raw(command)
+
+    def push_raw(self, cmd: _HttpCommand, block: bool = False) -> bool:
+        """
+        Queues the Command. If the Queue for this kind of Command is full, this either blocks until there is
+        space again, or returns False right away if block is False. Never block from the Main Thread!
+        """
+        cmd.endpoint = f"{configuration.server_url}{cmd.endpoint}"
+        if cmd.trace is not None:
+            # Before it is queued, the HTTP Thread may pick it up right away
+            cmd.trace.enqueued = time.time()
+        was_queued = self.__message_queue.put(cmd, cmd.priority, block)
+        if not was_queued:
+            logger.error(f"Send Queue for {cmd.priority.name} is full. Dropping Request to {cmd.endpoint}")
+        return was_queued
+
+
+_http_handler: Optional[HttpThread] = None
+_http_handler_mutex = threading.Lock()
+
+
+def _get_http_handler() -> HttpThread:
+    """
+    The HTTP Thread is only started once something is actually sent, so loading the Plugin stays fast.
+    """
+    global _http_handler
+    with _http_handler_mutex:
+        if _http_handler is None:
+            _http_handler = HttpThread()
+        return _http_handler
 
 
-_http_handler = HttpThread(__PVP_BOT_SERVER_URL)
+def _get_coordinator() -> Optional[InstanceCoordinator]:
+    """
+    None if Instances should not be coordinated. Otherwise started on first Use.
+    """
+    if not configuration.coordinate_instances:
+        return None
+    coordinator = get_coordinator()
+    coordinator.start()
+    return coordinator
 
 
-def handle_died_event(own_cmdr_name: str, own_rank: int, event: dict[str, Any], current_ship: str | None, location: str):
+def handle_died_event(own_cmdr_name: str, own_rank: int, event: dict[str, Any], current_ship: str | None, location: str,
+                      trace: Optional[EventTrace] = None):
     post_body = create_kill_from_died_event(event, own_cmdr_name, current_ship, own_rank, location)
     if post_body is not None:
-        push_kill_event(post_body)
+        _add_to_killboard(post_body, False)
+        push_kill_event(post_body, trace)
 
 
-def handle_kill_event(own_cmdr_name: str, own_rank: int, event: dict[str, Any], current_ship: str | None,  location: str):
+def handle_kill_event(own_cmdr_name: str, own_rank: int, event: dict[str, Any], current_ship: str | None,  location: str,
+                      trace: Optional[EventTrace] = None):
     post_body = create_pvpkill_event(event, own_cmdr_name, current_ship or "unknown", own_rank, location)
     if post_body is not None:
-        push_kill_event(post_body)
+        _add_to_killboard(post_body, True)
+        push_kill_event(post_body, trace)
+
+
+def _add_to_killboard(data: PvpKillEventData, is_kill: bool):
+    try:
+        killboard = get_killboard()
+        if killboard is not None:
+            killboard.add(data, is_kill)
+    except Exception as e:
+        # The local Killboard is a nice-to-have. Never let it stop the Event from being sent.
+        logger.error(f"Could not add Event to the local Killboard: {e}")
+
+
+def push_kill_event(data: PvpKillEventData, trace: Optional[EventTrace] = None):
+    payload = data.as_dict()
+    if configuration.offline_mode:
+        # Not traced. Nothing about the Send Path can be learned from it.
+        get_spool().append(payload)
+        write_ui_message("PvpBot: Offline Mode. Event was saved for later.", "INFO", 5000)
+        return
+    coordinator = _get_coordinator()
+    if coordinator is not None and coordinator.should_forward(configuration.api_key):
+        coordinator.forward([payload])
+        if trace is not None:
+            get_latency_tracer().finish(trace, "forwarded")
+        write_ui_message("PvpBot: Event was handed to the PvpBot Instance that sends for all.", "INFO", 5000)
+        return
+    was_queued = _get_http_handler().push_new_post_message("/api/killboard/add/kill", payload,
+                                                     MessageIntent.SEND_NEW_EVENT, trace)
+    if not was_queued:
+        get_spool().append(payload)
+        if trace is not None:
+            get_latency_tracer().finish(trace, "spooled")
+        write_ui_message("PvpBot: Too many Events are waiting to be sent.\nThis Event was saved for later.",
+                         "WARNING", 10_000)
 
 
-def push_kill_event(data: PvpKillEventData):
-    _http_handler.push_new_post_message("/api/killboard/add/kill", data.as_dict(), MessageIntent.SEND_NEW_EVENT)
+def check_api_key():
+    """
+    If the Key was accepted recently, that Result is trusted right away and the Key is only checked again in the
+    Background, behind everything else. Otherwise the Key is checked before anything else is sent.
+    Not done at all while another Instance sends for this one with the same Key.
+    """
+    api_key = configuration.api_key
+    coordinator = _get_coordinator()
+    if coordinator is not None and coordinator.should_forward(api_key):
+        # The Leader sends with the same Key and has checked it already
+        logger.info("Another PvpBot Instance sends for this one with the same API Key. Not checking it again.")
+        return
+    auth_cache = get_auth_cache()
+    if api_key is not None and auth_cache.is_valid(api_key, configuration.api_key_cache_hours * 3600):
+        logger.info("API Key was accepted recently. Checking it again in the Background.")
+        _remember_bulk_formats(auth_cache.formats_header)
+        if not configuration.offline_mode:
+            flush_spool_in_background()
+        cmd = _HttpCommand("/api/user", {}, MessageIntent.REVALIDATE_API_KEY, "get")
+    else:
+        cmd = _HttpCommand("/api/user", {}, MessageIntent.CHECK_API_KEY, "get" )
+    _get_http_handler().push_raw(cmd)
+
+
+_supports_compact_bulk_format: Optional[bool] = None
+"""
+None as long as the Server was not asked yet
+"""
+
+
+def _remember_bulk_formats(formats_header: Optional[str]):
+    global _supports_compact_bulk_format
+    _supports_compact_bulk_format = compact_format.supports_compact_format(formats_header)
+    logger.info(f"Server supports the compact Bulk Format: {_supports_compact_bulk_format}")
+
+
+def _use_compact_bulk_format() -> bool:
+    """
+    Asks the Server which Bulk Formats it understands, unless that is already known.
+    Blocking - only call this from the Thread doing the Bulk Upload.
+    """
+    if not configuration.compact_bulk_format:
+        return False
+    if _supports_compact_bulk_format is None:
+        cmd = _HttpCommand("/api/user", {}, MessageIntent.NEGOTIATE_BULK_FORMAT, "get")
+        _get_http_handler().push_raw(cmd, block=True)
+        try:
+            cmd.result.result(timeout=2 * DEFAULT_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.warning(f"Could not ask the Server for its Bulk Formats ({e}). Using the plain Format.")
+            return False
+    return bool(_supports_compact_bulk_format)
 
 
-def check_api_key():
-    cmd = _HttpCommand("/api/user", {}, MessageIntent.CHECK_API_KEY, "get" )
-    _http_handler.push_raw(cmd)
+_chunk_sizer: Optional[AdaptiveChunkSizer] = None
 
 
-def handle_historic_data(data: list[PvpKillEventData], callback: Callable[[bool], None]):
+def _get_chunk_sizer() -> AdaptiveChunkSizer:
     """
-    NOTE: This is supposed to run from the Event Aggregation Thread.
-    DO NOT RUN THIS FROM ANOTHER THREAD.
-    This call is blocking.
+    One Sizer for all Bulk Uploads, so what was learned about the Server carries over to the next Upload
     """
-    import json
-    def isvalid_kill(entry: PvpKillEventData):
-        return len(entry.killer.name.strip()) > 0 and len(entry.victim.name.strip()) > 0
+    global _chunk_sizer
+    if _chunk_sizer is None:
+        _chunk_sizer = AdaptiveChunkSizer(ChunkSizeBounds(configuration.bulk_chunk_min_events,
+                                                          configuration.bulk_chunk_max_events,
+                                                          configuration.bulk_chunk_target_bytes))
+    return _chunk_sizer
 
-    valid_kills = filter(lambda x: isvalid_kill(x), data)
-    as_list = list(map(lambda x: x.as_dict(), valid_kills))
-
-    def chunks(lst, n):
-        """Yield successive n-sized chunks from lst."""
-        for i in range(0, len(lst), n):
-            yield lst[i:i + n]
-
-    for chunk in chunks(as_list, 100):
-        post_body = {
-            "kills": chunk
-        }
-        logger.info("Next Line contains Post Body sent as the Aggregate event. POST_BODY_AGGREGATE")
-        logger.info(json.dumps(post_body))
 
+def upload_bulk(payloads: Iterable[dict], chunk_callback: Optional[Callable[[int, int, int], None]] = None,
+                total: Optional[int] = None, in_order: bool = False) -> bool:
+    """
+    Sends the Events (already converted with as_dict) through the Bulk Endpoint. payloads is only read once, Chunk
+    by Chunk, so it can be a Generator.
+    If the Server rejects a Chunk with a 400, the bad Events in it are searched (see isolate_rejected) and
+    quarantined, and the Upload goes on. Returns False as soon as any Chunk failed otherwise.
+    This call is blocking. DO NOT RUN THIS FROM THE MAIN THREAD.
+
+    Several Chunks are in flight at once, so the Server may get them out of Order. With in_order, the next Chunk is
+    only sent once the previous one (including the Search for bad Events in it) is done.
+
+    chunk_callback is invoked after every handled chunk with (events accepted so far, total events,
+    events quarantined so far). If total is not given and payloads is not a List, the Events read from it so far
+    are reported as the total.
+    """
+    def send_chunk(chunk: list[dict], compact: bool) -> tuple[Future, int]:
+        """
+        Returns the Future of the Response and the Size of the Body in Bytes
+        """
+        # vvv Blocking if the HTTP Thread has not caught up with the previous Chunks vvv
+        extra_headers = {"Content-Type": "application/json"}
+        if compact:
+            post_body = compact_format.encode(chunk)
+            extra_headers[compact_format.FORMAT_REQUEST_HEADER] = compact_format.COMPACT_FORMAT_NAME
+        else:
+            post_body = {
+                "kills": chunk
+            }
+        log_payload("Post Body sent as the Aggregate event. POST_BODY_AGGREGATE", post_body)
+        # Encoded here (and not by requests) so the Size is known to the Chunk Sizer without encoding twice
+        encoded_body = json.dumps(post_body).encode("utf8")
+        command = _HttpCommand("/api/killboard/add/kill/bulk", encoded_body, MessageIntent.SEND_HISTORIC_DATA,
+                               extra=extra_headers, timeout=2 * DEFAULT_TIMEOUT_SECONDS)
+        _get_http_handler().push_raw(command, block=True)
+        return command.result, len(encoded_body)
+
+    if total is None and isinstance(payloads, list):
+        total = len(payloads)
+    events_read = 0
+    use_compact = _use_compact_bulk_format()
+    accepted_events = 0
+    quarantined_events = 0
+    pending: deque[tuple[Future, list[dict], bool, int]] = deque()
+    chunk_sizer = _get_chunk_sizer()
+
+    def isolate_rejected(chunk: list[dict], compact: bool, response: requests.Response) -> bool:
+        """
+        The Server rejected the whole Chunk, usually because of only a few bad Events in it. Send both Halves again,
+        and keep splitting the rejected ones until the bad Events are found. Those go to the Quarantine, everything
+        else is uploaded. With k bad Events this takes about 2k*log2(n) Requests.
+        Returns False if something else than a 400 came back.
+        """
+        nonlocal quarantined_events
+        if len(chunk) == 1:
+            get_quarantine().add(chunk[0], response.status_code, response.text)
+            quarantined_events += 1
+            return True
+        middle = len(chunk) // 2
+        for half in (chunk[:middle], chunk[middle:]):
+            try:
+                half_response = send_chunk(half, compact)[0].result()
+            except Exception as e:
+                logger.error(f"Sending Historic Data threw an exception: {e}")
+                return False
+            if half_response.status_code == 400:
+                if not isolate_rejected(half, compact, half_response):
+                    return False
+            elif not half_response.ok:
+                logger.error(f"Status: {half_response.status_code}; {str(half_response.text)}")
+                return False
+        return True
+
+    def collect_finished_chunks(wait: bool) -> bool:
+        """
+        Looks at the Responses of the Chunks sent so far, oldest first. Returns False once any Chunk failed.
+        """
+        global _supports_compact_bulk_format
+        nonlocal accepted_events, use_compact
+        while len(pending) > 0 and (wait or pending[0][0].done()):
+            future, chunk, was_compact, body_bytes = pending.popleft()
+            try:
+                response = future.result()
+                if was_compact and response.status_code == 415:
+                    # The Server changed its Mind about the compact Format. Send this Chunk again the plain way.
+                    logger.warning("Server rejected the compact Bulk Format. Falling back to the plain Format.")
+                    _supports_compact_bulk_format = False
+                    use_compact = False
+                    future, body_bytes = send_chunk(chunk, False)
+                    response = future.result()
+            except Exception as e:
+                chunk_sizer.record(len(chunk), body_bytes, None, False)
+                logger.error("Sending Historic Data threw an exception.")
+                logger.error(e)
+                return False
+            # A rejected Chunk says nothing about its Size. Server Errors and slow Answers do.
+            # response.elapsed is measured by requests for this one Request, from sending it until the Headers came
+            # back, so Time spent in the Send Queue or waiting for the Rate Limit is not part of it. With several
+            # Chunks in flight the Server answers each of them a bit slower than a lone one. That is the Load it
+            # really sees, so Chunks end up somewhat smaller than when sending one at a Time.
+            chunk_sizer.record(len(chunk), body_bytes, response.elapsed.total_seconds(), response.status_code < 500)
+            if response.status_code == 400 and len(chunk) > 0:
+                logger.warning(f"Server rejected a Chunk of {len(chunk)} Events ({response.text}). "
+                               f"Searching for the bad Events.")
+                quarantined_before = quarantined_events
+                if not isolate_rejected(chunk, was_compact, response):
+                    return False
+                accepted_events += len(chunk) - (quarantined_events - quarantined_before)
+            elif not response.ok:
+                # Bad Status Code
+                logger.error(f"Status: {response.status_code}; {str(response.text)}")
+                return False
+            else:
+                logger.info("Historic Data was accepted by %s", configuration.server_url)
+                accepted_events += len(chunk)
+            if chunk_callback is not None:
+                chunk_callback(accepted_events, total if total is not None else events_read, quarantined_events)
+        return True
+
+    success = True
+    remaining_payloads = iter(payloads)
+    while True:
+        chunk = list(itertools.islice(remaining_payloads, chunk_sizer.next_size()))
+        if len(chunk) == 0:
+            break
+        events_read += len(chunk)
         # Used for debugging to not spam the Server
         DEBUG_REDIRECT_COMMAND = False
 
         if DEBUG_REDIRECT_COMMAND:
             time.sleep(1)
-            callback(True)
-            return
+            return True
 
-        from classes.ui import ui, GenericUiMessage, GenericUiMessageType
-        ui.notify_about_new_message(GenericUiMessage("Uploading to Server... if you have\nmany logs this can take longer.", GenericUiMessageType.INFO, -1))
+        future, body_bytes = send_chunk(chunk, use_compact)
+        pending.append((future, chunk, use_compact, body_bytes))
 
-        # vvv Blocking vvv
-        success = False
-        try:
-            response = requests.post(f"{__PVP_BOT_SERVER_URL}/api/killboard/add/kill/bulk", json=post_body, headers=build_headers())
-            success = response.ok
-            if success:
-                logger.info(f"Historic Data was accepted by {__PVP_BOT_SERVER_URL}")
-                logger.info(response.raw)
-            else:
-                # Bad Status Code
-                logger.error(f"Status: {response.status_code}; {str(response.text)}")
-                break
-        except Exception as e:
-            logger.error("Sending Historic Data threw an exception.")
-            logger.error(e)
+        success = collect_finished_chunks(wait=in_order)
+        if not success:
             break
-    callback(success)
+
+    if success:
+        success = collect_finished_chunks(wait=True)
+    return success
+
+
+def is_valid_kill(entry: PvpKillEventData) -> bool:
+    return len(entry.killer.name.strip()) > 0 and len(entry.victim.name.strip()) > 0
+
+
+def handle_historic_data(data: Iterable[PvpKillEventData], callback: Callable[[bool], None],
+                         chunk_callback: Optional[Callable[[int, int, int], None]] = None,
+                         total: Optional[int] = None):
+    """
+    NOTE: This is supposed to run from the Event Aggregation Thread.
+    DO NOT RUN THIS FROM ANOTHER THREAD.
+    This call is blocking.
+
+    data is only read once and can be a Generator. total is how many valid Kills (see is_valid_kill) are in it,
+    if that is known up front.
+    chunk_callback is invoked after every handled chunk, see upload_bulk
+    The Chunks are sent one after the other, so the Server gets the Events in the Order of data.
+    If another Instance sends for this one, the Events are handed to it instead, in Batches.
+    """
+    valid_kills = filter(is_valid_kill, data)
+    payloads = map(lambda x: x.as_dict(), valid_kills)
+    coordinator = _get_coordinator()
+    if coordinator is not None and coordinator.should_forward(configuration.api_key):
+        callback(_forward_bulk(coordinator, payloads, total, chunk_callback))
+        return
+    callback(upload_bulk(payloads, chunk_callback, total, in_order=True))
+
+
+def _forward_bulk(coordinator: InstanceCoordinator, payloads: Iterable[dict], total: Optional[int],
+                  chunk_callback: Optional[Callable[[int, int, int], None]]) -> bool:
+    logger.info("Another PvpBot Instance sends for this one. Handing the historic Events to it.")
+    forwarded = 0
+    remaining_payloads = iter(payloads)
+    while True:
+        batch = list(itertools.islice(remaining_payloads, _SPOOL_EVENTS_PER_FLUSH))
+        if len(batch) == 0:
+            return True
+        try:
+            coordinator.forward(batch)
+        except OSError as e:
+            logger.error(f"Could not hand historic Events to the Leader: {e}")
+            return False
+        forwarded += len(batch)
+        if chunk_callback is not None:
+            chunk_callback(forwarded, total if total is not None else forwarded, 0)
+
+
+_spool: Optional[Spool] = None
+_spool_flush_mutex = threading.Lock()
+_SPOOL_EVENTS_PER_FLUSH = 1000
+
+
+def get_spool() -> Spool:
+    global _spool
+    if _spool is None:
+        _spool = Spool(configuration.data_dir / "spool")
+    return _spool
+
+
+def flush_spool(spool: Optional[Spool] = None,
+                chunk_callback: Optional[Callable[[int, int, int], None]] = None,
+                in_order: bool = False) -> Optional[bool]:
+    """
+    Uploads all Events in the Spool through the Bulk Endpoint. Many small Spool Files are combined into
+    large Uploads. A Spool File is deleted once all its Events were accepted.
+    Returns None if another Flush is already running.
+    in_order is passed on to upload_bulk.
+    This call is blocking. DO NOT RUN THIS FROM THE MAIN THREAD.
+    """
+    if not _spool_flush_mutex.acquire(blocking=False):
+        return None
+    try:
+        spool = spool or get_spool()
+        spool.rotate()
+        files = spool.closed_files()
+        if len(files) == 0:
+            return True
+        logger.info(f"Flushing {len(files)} Spool Files")
+
+        batch_files = []
+        batch_payloads = []
+        for index, file in enumerate(files):
+            batch_files.append(file)
+            batch_payloads.extend(Spool.read_file(file))
+            is_last_file = index == len(files) - 1
+            if len(batch_payloads) < _SPOOL_EVENTS_PER_FLUSH and not is_last_file:
+                continue
+            if len(batch_payloads) > 0 and not upload_bulk(batch_payloads, chunk_callback, in_order=in_order):
+                logger.error("Flushing the Spool failed. The remaining Spool Files are kept.")
+                return False
+            for done_file in batch_files:
+                done_file.unlink()
+            batch_files.clear()
+            batch_payloads.clear()
+        return True
+    finally:
+        _spool_flush_mutex.release()
+
+
+def flush_spool_in_background():
+    """
+    Starts flush_spool in the Background and tells the User about the Result.
+    When Instances are coordinated, this does nothing unless this Instance is the Leader.
+    """
+    def worker():
+        coordinator = _get_coordinator()
+        if coordinator is not None and not coordinator.is_leader:
+            # The Spool is shared with the other Instances. Only the Leader flushes it, on its own.
+            logger.info("Not the Leader. The Spool is flushed by the PvpBot Instance that sends for all.")
+            return
+        if not get_spool().has_pending_events():
+            return
+        write_ui_message("PvpBot: Uploading saved Events...", "INFO", -1)
+        success = flush_spool()
+        if success is None:
+            return
+        if success:
+            write_ui_message("PvpBot: Uploaded all saved Events.", "INFO", 5000)
+        else:
+            write_ui_message("PvpBot: Could not upload saved Events.\nThey are kept for the next Try.", "ERROR", 10_000)
+
+    lifecycle.submit(worker)
@@ -0,0 +1,23 @@
+"""
+Exclusive Locks on open Files, held until the File is closed. The OS releases them when the Process ends, however
+it ends, so a Lock that can be taken tells that its previous Owner is gone.
+"""
+import sys
+from typing import IO
+
+
+def try_lock(file: IO) -> bool:
+    """
+    Does not block. True if the Lock was taken.
+    """
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)  # type: ignore
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
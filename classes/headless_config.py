@@ -0,0 +1,55 @@
+"""
+A small in-memory Stand-In for EDMCs config. It is used when the Plugin runs without EDMC, e.g. from cli.py.
+Only the parts of EDMCs config that this Plugin actually uses are provided.
+"""
+import os
+import pathlib
+import sys
+from typing import Any, Optional
+
+
+def _default_app_dir() -> pathlib.Path:
+    # Mirrors where EDMC itself puts its App Directory, so the CLI and EDMC share the same Plugin Files
+    if sys.platform == "win32":
+        return pathlib.Path(os.environ.get("LOCALAPPDATA", pathlib.Path.home())) / "EDMarketConnector"
+    if sys.platform == "darwin":
+        return pathlib.Path.home() / "Library" / "Application Support" / "EDMarketConnector"
+    data_home = os.environ.get("XDG_DATA_HOME") or pathlib.Path.home() / ".local" / "share"
+    return pathlib.Path(data_home) / "EDMarketConnector"
+
+
+def _default_journal_dir() -> Optional[str]:
+    if sys.platform == "win32":
+        return str(pathlib.Path.home() / "Saved Games" / "Frontier Developments" / "Elite Dangerous")
+    return None
+
+
+class HeadlessConfig:
+    appname = "EDMarketConnector"
+
+    def __init__(self):
+        self.__values: dict[str, Any] = {}
+        self.app_dir_path = _default_app_dir()
+        self.app_dir = str(self.app_dir_path)
+        self.default_journal_dir = _default_journal_dir()
+
+    def get_str(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        value = self.__values.get(key)
+        if value is None:
+            return default
+        return str(value)
+
+    def get_bool(self, key: str, default: bool = False) -> bool:
+        return bool(self.__values.get(key, default))
+
+    def get_int(self, key: str, default: int = 0) -> int:
+        return int(self.__values.get(key, default))
+
+    def set(self, key: str, val: Any):
+        self.__values[key] = val
+
+    def delete(self, key: str, suppress=False):
+        self.__values.pop(key, None)
+
+
+config = HeadlessConfig()
@@ -1,25 +1,117 @@
 """
 The "root" of the entire historic_data part
 """
+import heapq
 import json
-import pathlib
-import threading
 import time
 import datetime as dt
-from typing import Callable, Optional
+from typing import TYPE_CHECKING, Callable, Generator, Iterator, Optional
 from classes.logger_factory import logger
-from classes.data import create_pvpkill_event, create_kill_from_died_event
+from classes.data import PvpKillEventData, create_pvpkill_event, create_kill_from_died_event
 from classes.plugin_settings import configuration
+from classes.journal_catalog import JournalCatalog
+from classes.journal_state import JournalStateTracker
+from classes.killboard import get_killboard
+from classes.lifecycle import lifecycle
+from classes.backfill_governor import BackfillCancelled, BackfillGovernor
+from classes.journal_sources import JournalSource, find_journal_sources
+
+if TYPE_CHECKING:
+    from classes.ui import HistoryAggregatorUI
+
+_LINES_PER_CHECKPOINT = 256
+_SAMPLE_LINES_PER_FILE = 3
+_SAMPLE_LINE_LENGTH = 200
+
+
+class _LineErrors:
+    """
+    Everything that went wrong while parsing the Lines of one Journal. Logged once for the whole File, a Journal that
+    was cut off or overwritten with Zeros by a Crash can have thousands of broken Lines.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.by_kind: dict[str, int] = {}
+        self.samples: list[str] = []
+
+    @staticmethod
+    def __kind(e: Exception) -> str:
+        if isinstance(e, json.JSONDecodeError):
+            return "invalid JSON"
+        if isinstance(e, KeyError):
+            return f"missing Field {e}"
+        return type(e).__name__
+
+    def add(self, line: str, e: Exception):
+        kind = self.__kind(e)
+        self.count += 1
+        seen = self.by_kind.get(kind, 0)
+        self.by_kind[kind] = seen + 1
+        if seen == 0:
+            # Only the first Traceback of each Kind, and only in the Debug Log
+            logger.debug("First Line with %s", kind, exc_info=e)
+        if len(self.samples) < _SAMPLE_LINES_PER_FILE:
+            self.samples.append(line.strip()[:_SAMPLE_LINE_LENGTH])
+
+    def summary(self) -> str:
+        kinds = ", ".join(f"{count}x {kind}" for kind, count in self.by_kind.items())
+        samples = "".join(f"\n    {sample!r}" for sample in self.samples)
+        return f"{self.count} Lines could not be parsed ({kinds}). First Lines:{samples}"
+
+
+def merge_in_time_order(streams: list[tuple[int, Callable[[], Generator[PvpKillEventData, None, None]]]]) \
+        -> Iterator[PvpKillEventData]:
+    """
+    Journals are written in Order, so the Events of every File are sorted already. Each Stream is given as the Time
+    its File starts at and a Function that starts reading it.
+    A Stream is only started once the Merge got to the Time its File starts at, because nothing before that can come
+    from it. So only Files that overlap in Time are read at once, and the Heap holds the next Event of each of them.
+    """
+    pending = sorted(streams, key=lambda stream: stream[0])
+    # (Timestamp, Number of the Stream, Event, Stream). The Number breaks Ties, so Events are never compared.
+    heap: list[tuple[int, int, PvpKillEventData, Generator[PvpKillEventData, None, None]]] = []
+    started = 0
+
+    def push_next(number: int, stream: Generator[PvpKillEventData, None, None]):
+        event = next(stream, None)
+        if event is not None:
+            heapq.heappush(heap, (event.timestamp, number, event, stream))
+
+    try:
+        while started < len(pending) or len(heap) > 0:
+            if started < len(pending) and (len(heap) == 0 or pending[started][0] <= heap[0][0]):
+                push_next(started, pending[started][1]())
+                started += 1
+                continue
+            _, number, event, stream = heapq.heappop(heap)
+            yield event
+            push_next(number, stream)
+    finally:
+        # Only left with Streams if the Merge was not read to the End (cancelled or failed). Close their Files.
+        for _, _, _, stream in heap:
+            stream.close()
+
+
+def _first_timestamp(source: JournalSource) -> int:
+    """
+    Unix Time of the first Line (the Fileheader). 0 if that cannot be read, then the File is simply read early.
+    """
+    try:
+        with source.open() as file:
+            return int(dt.datetime.strptime(json.loads(file.readline())["timestamp"], "%Y-%m-%dT%H:%M:%SZ")
+                       .replace(tzinfo=dt.timezone.utc).timestamp())
+    except Exception:
+        return 0
+
 
 class HistoricDataManager:
 
-    def _filter_logs_by_timestamp(self) -> list[pathlib.Path]:
+    def _filter_logs_by_timestamp(self) -> list[JournalSource]:
         filtered_logs = []
-        logs_directory = configuration.journal_dir
-        for log_file in pathlib.Path(logs_directory).glob("*.log"):
-            if not log_file.is_file():
-                continue
-            file_timestamp = int(log_file.stat().st_mtime)
+        all_logs = find_journal_sources(self._journal_dir or configuration.journal_dir)
+        for log_file in all_logs:
+            file_timestamp = log_file.mtime
             # Check lower bound
             lower, upper = self._bounds
             if lower is not None and lower > file_timestamp:
@@ -29,6 +121,7 @@ class HistoricDataManager:
                 # [lower, ... , upper]      [file]
                 continue
             filtered_logs.append(log_file)
+        self._catalog.prune(all_logs)
         return filtered_logs
 
     def __is_cmdr_relevant(self, name: str):
@@ -42,120 +135,210 @@ class HistoricDataManager:
                 return True
         return False
 
-    def __handle_log_file(self, file, filename) -> Optional[tuple[list, list]]:
-        died_events_in_this_file = []
-        pvpkill_events_in_this_file = []
-        location: Optional[str] = None
-        cmdr_name: Optional[str] = None
-        current_ship: Optional[str] = 'unknown'
-        current_rank: Optional[int] = None
+    def __handle_log_file(self, file, source: JournalSource) -> Iterator[tuple[PvpKillEventData, bool]]:
+        """
+        Yields the PVPKill and Died Events of the File as they are read, each with True for a PVPKill. Once all Lines
+        are read (or the CMDR turns out not to be relevant), the File is recorded in the Catalog.
+        """
+        filename = source.display_name
+        tracker = JournalStateTracker()
+        has_pvp_events = False
+        governor = self.governor
+        lines_since_checkpoint = 0
+        bytes_since_checkpoint = 0
+        # Only created once a Line fails, most Files never need it
+        errors: Optional[_LineErrors] = None
 
         line = file.readline()
         while line != "":
+            lines_since_checkpoint += 1
+            bytes_since_checkpoint += len(line)
+            if lines_since_checkpoint == _LINES_PER_CHECKPOINT:
+                governor.checkpoint(bytes_since_checkpoint)
+                lines_since_checkpoint = 0
+                bytes_since_checkpoint = 0
+            data = None
+            is_kill = False
             try:
                 line_as_json = json.loads(line)
-                if line_as_json["event"] == "LoadGame":
-                    cmdr_name = str(line_as_json["Commander"])
-                    if not self.__is_cmdr_relevant(cmdr_name):
-                        return None
-                elif line_as_json["event"] == "Location" or line_as_json["event"] == "FSDJump":
-                    location = line_as_json["StarSystem"]
-                elif line_as_json["event"] == "Rank":
-                    current_rank = line_as_json["Combat"]
-                elif line_as_json["event"] == "Loadout":
-                    current_ship = line_as_json["Ship"]
-                elif line_as_json["event"] == "SuitLoadout":
-                    current_ship = "on_foot"
-                    # current_ship = line_as_json["SuitName"] # Can be reactivated later.
-                    # For now, all on-foot kills are just treated as "on_foot"
-                elif line_as_json["event"] == "Died":
+                event = tracker.feed(line_as_json)
+                state = tracker.state
+                if event == "LoadGame":
+                    if not self.__is_cmdr_relevant(state.commander):
+                        # The rest of the File is never read, so it is unknown if it has any PVP Events
+                        self._catalog.record(source, state.commander, state.game_version, None)
+                        self.__report_line_errors(source, errors)
+                        return
+                elif event == "Died":
+                    has_pvp_events = True
                     # handle Died
-                    data = create_kill_from_died_event(line_as_json, cmdr_name, current_ship, current_rank, location)
-                    if data is not None:
-                        data.log_origin = filename
-                        died_events_in_this_file.append(data)
-                elif line_as_json["event"] == "PVPKill":
+                    data = create_kill_from_died_event(line_as_json, state.commander, state.ship or "unknown",
+                                                       state.combat_rank, state.location)
+                elif event == "PVPKill":
+                    has_pvp_events = True
+                    is_kill = True
                     # handle PVP Kill
-                    data = create_pvpkill_event(line_as_json, cmdr_name, current_ship, current_rank, location)
-                    if data is not None:
-                        data.log_origin = filename
-                        pvpkill_events_in_this_file.append(data)
+                    data = create_pvpkill_event(line_as_json, state.commander, state.ship or "unknown",
+                                                state.combat_rank, state.location)
+                if data is not None:
+                    data.log_origin = filename
             except Exception as e:
                 # Do nothing and hope the line wasn't *that* important :D
-                logger.warning(f"Failed to parse Line as json (exception on next line): '{line}'")
-                logger.exception(e)
-            finally:
-                line = file.readline()
+                if errors is None:
+                    errors = _LineErrors()
+                errors.add(line, e)
+            # Without a LoadGame it is unknown whose Events these are
+            if data is not None and tracker.state.commander is not None:
+                yield data, is_kill
+            line = file.readline()
 
         # All Lines were Read
-        if cmdr_name is None:
-            return None
+        self.__report_line_errors(source, errors)
+        self._catalog.record(source, tracker.state.commander, tracker.state.game_version, has_pvp_events)
 
-        if len(pvpkill_events_in_this_file) == 0 and len(died_events_in_this_file) == 0:
-            return None
-
-        return pvpkill_events_in_this_file, died_events_in_this_file
+    def __report_line_errors(self, source: JournalSource, errors: Optional[_LineErrors]):
+        if errors is None:
+            return
+        logger.warning(f"{source.display_name}: {errors.summary()}")
+        self.ui_handler.notify_failed_log_file(source.display_name, errors.count)
 
-    def __parse_logs_and_filter_cmdrs(self, paths: list[pathlib.Path], currentStatusCallback: Optional[Callable[[int, int], None]]):
+    def __read_file(self, source: JournalSource) -> Generator[PvpKillEventData, None, None]:
+        """
+        One Stream of merge_in_time_order. The File is read while the Merge asks for its Events. Once it is done, its
+        Events are added to the local Killboard.
+        """
         pvp_events = []
         died_events = []
-        counter: int = 0
-        total: int = len(paths)
-        last_ui_update_time = dt.datetime.now()
-        for path in paths:
-            with open(path, "r", encoding="utf8") as current_file:
-                response = self.__handle_log_file(current_file, current_file.name)
-                if response is None:
-                    logger.info(f"Parsed file {path.name} - No relevant events")
-                else:
-                    pvp_from_file, died_from_file = response
-                    logger.info(f"Parsed file {path.name} - {len(pvp_from_file)} PVPKills and {len(died_from_file)} "
-                                f"Died Events")
-                    pvp_events.extend(pvp_from_file)
-                    died_events.extend(died_from_file)
-            counter+=1
-            if currentStatusCallback is not None:
-                duration_since_last_update = dt.datetime.now() - last_ui_update_time
-                if duration_since_last_update.total_seconds() > 3:
-                    last_ui_update_time = dt.datetime.now()
-                    currentStatusCallback(counter, total)
-                    
-        return pvp_events, died_events
+        try:
+            with source.open() as current_file:
+                for data, is_kill in self.__handle_log_file(current_file, source):
+                    (pvp_events if is_kill else died_events).append(data)
+                    yield data
+            self.__bytes_read += source.size
+        except BackfillCancelled:
+            raise
+        except Exception as e:
+            logger.warning(f"Failed to read {source.display_name}")
+            logger.exception(e)
+            self.ui_handler.notify_failed_log_file(source.display_name)
+        self.__file_done(source, pvp_events, died_events)
+
+    def __file_done(self, source: JournalSource, pvp_events: list, died_events: list):
+        if len(pvp_events) == 0 and len(died_events) == 0:
+            logger.debug("Parsed file %s - No relevant events", source.name)
+        else:
+            logger.info("Parsed file %s - %d PVPKills and %d Died Events", source.name, len(pvp_events),
+                        len(died_events))
+            self.__add_to_killboard(pvp_events, died_events)
+        self.__files_done += 1
+        if (dt.datetime.now() - self.__last_ui_update_time).total_seconds() > 3:
+            self.__last_ui_update_time = dt.datetime.now()
+            self.ui_handler.notify_progress(self.__files_done, self.__total_files)
+
+    def __streams(self, sources: list[JournalSource]) \
+            -> list[tuple[int, Callable[[], Generator[PvpKillEventData, None, None]]]]:
+        """
+        One Stream for every File the Catalog cannot skip, for merge_in_time_order
+        """
+        streams = []
+        for source in sources:
+            self.governor.checkpoint()
+            # size and mtime were taken before reading. If the File grows while it is read,
+            # the Catalog Entry will simply not match next time.
+            if self._catalog.can_skip(source, self.__is_cmdr_relevant):
+                self.__skipped_by_catalog += 1
+                self.__files_done += 1
+                continue
+            streams.append((_first_timestamp(source), lambda source=source: self.__read_file(source)))
+        return streams
+
+    def __events_in_time_order(self, sources: list[JournalSource]) -> Iterator[PvpKillEventData]:
+        """
+        Files come in whatever Order they were found. Their Events are merged into Order of Time instead, so every
+        Chunk covers one Stretch of Time. The Files are read while the Merge is uploaded, Chunk by Chunk.
+        """
+        yield from merge_in_time_order(self.__streams(sources))
+        self.ui_handler.notify_progress(self.__total_files, self.__total_files)
+        logger.info(f"Skipped {self.__skipped_by_catalog} of {self.__total_files} files using the Journal Catalog. "
+                    f"Read {self.__bytes_read / 1_000_000:.1f} MB from Disk.")
+        try:
+            self._catalog.save()
+        except Exception as e:
+            logger.warning("Failed to save the Journal Catalog")
+            logger.exception(e)
+
+    @staticmethod
+    def __add_to_killboard(pvp_events: list, died_events: list):
+        try:
+            killboard = get_killboard()
+            if killboard is not None:
+                killboard.add_many(pvp_events, True)
+                killboard.add_many(died_events, False)
+        except Exception as e:
+            logger.error(f"Could not add historic Events to the local Killboard: {e}")
 
     def __thread(self):
+        self.governor.lower_thread_priority()
+        self.ui_handler.notify_governor(self.governor)
+        try:
+            self.__aggregate()
+        except BackfillCancelled:
+            if lifecycle.is_stopping:
+                # EDMC is shutting down. The Job runs again on the next Startup.
+                logger.info("Historic Data Job was interrupted by Shutdown.")
+                return
+            logger.info("Historic Data Job was cancelled. Turning off again.")
+            configuration.run_historic_aggregation_on_next_startup = False
+            self.ui_handler.notify_cancelled()
+
+    def __aggregate(self):
         self.ui_handler.notify_start()
+        self._catalog = JournalCatalog.for_journal_dir(configuration.data_dir, self._journal_dir or configuration.journal_dir)
         time.sleep(1)  # Small delay so the user can actually read what is written here
         relevant_log_paths = self._filter_logs_by_timestamp()
-        self.ui_handler.notify_progress(0, len(relevant_log_paths))
-        pvp_events, died_events_as_pvp_events = self.__parse_logs_and_filter_cmdrs(relevant_log_paths, self.ui_handler.notify_progress)
-
-        self.ui_handler.notify_progress(len(relevant_log_paths), len(relevant_log_paths))
-        pvp_events.extend(died_events_as_pvp_events)
-
-        
-        if len(pvp_events) == 0:
-            self.ui_handler.notify_finished(True)
-            configuration.run_historic_aggregation_on_next_startup = False
-            return
-        
+        self.__total_files = len(relevant_log_paths)
+        self.ui_handler.notify_progress(0, self.__total_files)
         self.ui_handler.notify_submitting()
-        
 
-   
         def handle_callback(success: bool) -> None:
             self.ui_handler.notify_finished(success)
             logger.info("Historic Data Job is complete. Turning off again.")
             configuration.run_historic_aggregation_on_next_startup = False
-        
+
+        def handle_chunk_callback(uploaded: int, total: int, quarantined: int) -> None:
+            self.ui_handler.notify_uploaded(uploaded, total, quarantined)
+            # Pausing here holds back the next Chunks
+            self.governor.checkpoint()
+
         from classes.event_handling import handle_historic_data
-        handle_historic_data(pvp_events, handle_callback)
+        handle_historic_data(self.__events_in_time_order(relevant_log_paths), handle_callback, handle_chunk_callback)
 
 
     def __init__(self, only_cmdrs: Optional[list[str]], lower_unix_bound: Optional[int],
-                 upper_unix_bound: Optional[int], ui_handler):
+                 upper_unix_bound: Optional[int], ui_handler, journal_dir: Optional[str] = None,
+                 governor: Optional[BackfillGovernor] = None):
+        """
+        ui_handler is usually the HistoryAggregatorUI. Outside of EDMC anything with the same notify_*-Methods
+        can be passed in instead (see cli.py).
+        journal_dir defaults to the Journal Directory configured in EDMC.
+        governor defaults to one built from the Configuration.
+        """
         self._cmdrs = only_cmdrs
         self._bounds = (lower_unix_bound, upper_unix_bound)
+        self._journal_dir = journal_dir
+
+        self.ui_handler: "HistoryAggregatorUI" = ui_handler
+        self.__total_files = 0
+        self.__files_done = 0
+        self.__skipped_by_catalog = 0
+        self.__bytes_read = 0
+        self.__last_ui_update_time = dt.datetime.now()
+        self.governor = governor or BackfillGovernor.from_configuration()
+        lifecycle.on_stop("Historic Data", self.governor.cancel)
+        self._thread = lifecycle.start_thread("historic-worker", self.__thread)
 
-        from classes.ui import HistoryAggregatorUI
-        self.ui_handler: HistoryAggregatorUI = ui_handler
-        threading.Thread(name="pvpbot-historic-worker", target=self.__thread, daemon=True).start()
+    def join(self, timeout: Optional[float] = None):
+        """
+        Blocks until the historic Aggregation is done. Only useful outside of EDMC.
+        """
+        self._thread.join(timeout)
@@ -0,0 +1,179 @@
+"""
+Some People run several EDMC Instances at once (one per Account), all with this Plugin, the same App Directory and
+usually the same API Key. If every Instance sent on its own, together they would run into the Server's Rate Limit.
+Instead, one of them is elected Leader and sends for all of them:
+
+ - Whoever holds the Lock on EDMC-PvPBot/leader.lock is the Leader. The OS releases the Lock when the Process ends,
+   however it ends, and the other Instances try to take it every Second. That is the Failover.
+ - The Leader writes a Hash of its API Key to EDMC-PvPBot/leader.json, along with a Heartbeat on every Tick. Followers
+   with the same Key do not send live Events themselves, they put them into the shared Inbox (EDMC-PvPBot/inbox, a
+   Spool). So do they with historic Uploads. The Leader uploads the Inbox in Batches through the Bulk Endpoint. Followers with a different Key send on
+   their own, like before. So do all Followers while the Heartbeat is stale: leader.json outlives the Leader, and
+   nobody should forward to an Instance that is gone or stuck.
+ - The Spool (Events that could not be sent yet) is shared as well. Only the Leader flushes it, so a File is never
+   uploaded twice.
+ - A Leader in Offline Mode does not send, so it takes no Events from the others.
+ - A Pause the Server asked for (429, Retry-After) is kept in EDMC-PvPBot/rate_limit.json, so the next HTTP Thread to
+   start (e.g. of a new Leader) does not run into it again.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import IO, Optional
+
+from classes.file_lock import try_lock
+from classes.lifecycle import ScheduledCall, lifecycle
+from classes.logger_factory import logger
+from classes.spool import Spool
+
+_TICK_SECONDS = 1.0
+_HEARTBEAT_STALE_AFTER_SECONDS = 3 * _TICK_SECONDS
+_RETRY_FLUSH_AFTER_SECONDS = 30.0
+
+
+def _hash_key(api_key: Optional[str]) -> Optional[str]:
+    if api_key is None:
+        return None
+    return hashlib.sha256(api_key.encode("utf8")).hexdigest()
+
+
+def _write_json(path: pathlib.Path, content: dict):
+    # Several Processes may write at once. Each uses its own temporary File.
+    temp_file = path.with_suffix(f".{os.getpid()}.tmp")
+    with temp_file.open("w", encoding="utf8") as file:
+        json.dump(content, file)
+    os.replace(temp_file, path)
+
+
+def _read_json(path: pathlib.Path) -> dict:
+    try:
+        with path.open("r", encoding="utf8") as file:
+            content = json.load(file)
+        if isinstance(content, dict):
+            return content
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+class InstanceCoordinator:
+
+    def __init__(self, data_dir: pathlib.Path):
+        self.__lock_path = data_dir / "leader.lock"
+        self.__leader_path = data_dir / "leader.json"
+        self.__rate_limit_path = data_dir / "rate_limit.json"
+        self.inbox = Spool(data_dir / "inbox")
+        self.__lock_file: Optional[IO] = None
+        self.__scheduled: Optional[ScheduledCall] = None
+        self.__next_flush = 0.0
+        self.__mutex = threading.Lock()
+
+    @property
+    def is_leader(self) -> bool:
+        return self.__lock_file is not None
+
+    def start(self):
+        """
+        Tries to become Leader right away, then keeps trying (or, as Leader, uploads the Inbox) every Second
+        """
+        with self.__mutex:
+            if self.__scheduled is not None:
+                return
+            self.__scheduled = lifecycle.call_later(0, self.__tick)
+        lifecycle.on_stop("Instance Coordination", self.stop)
+
+    def __try_become_leader(self) -> bool:
+        file = self.__lock_path.open("a+")
+        if not try_lock(file):
+            file.close()
+            return False
+        self.__lock_file = file
+        logger.info(f"This Instance (PID {os.getpid()}) now sends for all PvpBot Instances")
+        return True
+
+    def __tick(self):
+        from classes.event_handling import get_spool
+        from classes.plugin_settings import configuration
+        try:
+            if not self.is_leader and not self.__try_become_leader():
+                return
+            key_hash = None if configuration.offline_mode else _hash_key(configuration.api_key)
+            _write_json(self.__leader_path, {"pid": os.getpid(), "key_hash": key_hash, "heartbeat": time.time()})
+            if key_hash is not None and time.monotonic() >= self.__next_flush \
+                    and (len(self.inbox.closed_files()) > 0 or len(get_spool().closed_files()) > 0):
+                lifecycle.submit(self.__flush_inbox)
+        except OSError as e:
+            logger.warning(f"Instance Coordination failed: {e}")
+        finally:
+            with self.__mutex:
+                if self.__scheduled is not None:
+                    self.__scheduled = lifecycle.call_later(_TICK_SECONDS, self.__tick)
+
+    def __flush_inbox(self):
+        """
+        Uploads the Inbox, then the Spool. Both are shared by all Instances.
+        """
+        from classes.event_handling import flush_spool
+        # The Inbox holds historic Uploads of the Followers, which are sent in Order like the Leader's own
+        if flush_spool(self.inbox, in_order=True) is False or flush_spool() is False:
+            # Most likely the Server is not reachable. Do not try again every Second.
+            self.__next_flush = time.monotonic() + _RETRY_FLUSH_AFTER_SECONDS
+
+    def should_forward(self, api_key: Optional[str]) -> bool:
+        """
+        True if another Instance is Leader, is still alive and sends with the same Key
+        """
+        if self.is_leader or api_key is None:
+            return False
+        leader = _read_json(self.__leader_path)
+        try:
+            heartbeat = float(leader.get("heartbeat", 0))
+        except (TypeError, ValueError):
+            return False
+        if abs(time.time() - heartbeat) > _HEARTBEAT_STALE_AFTER_SECONDS:
+            return False
+        return leader.get("key_hash") == _hash_key(api_key)
+
+    def forward(self, payloads: list[dict]):
+        """
+        Hands Events (a live one, or a Batch of a historic Upload) to the Leader
+        """
+        self.inbox.append_closed(payloads)
+
+    def remember_pause(self, seconds: float):
+        try:
+            _write_json(self.__rate_limit_path, {"paused_until": time.time() + seconds})
+        except OSError as e:
+            logger.warning(f"Could not save the Rate Limit Pause: {e}")
+
+    def remaining_pause(self) -> float:
+        paused_until = _read_json(self.__rate_limit_path).get("paused_until", 0)
+        return max(float(paused_until) - time.time(), 0.0)
+
+    def stop(self, _deadline: float):
+        """
+        Gives up the Lead right away, so another Instance takes over without waiting for this Process to end
+        """
+        with self.__mutex:
+            if self.__scheduled is not None:
+                self.__scheduled.cancel()
+                self.__scheduled = None
+        if self.__lock_file is not None:
+            self.__lock_file.close()
+            self.__lock_file = None
+
+
+_coordinator: Optional[InstanceCoordinator] = None
+_coordinator_mutex = threading.Lock()
+
+
+def get_coordinator() -> InstanceCoordinator:
+    global _coordinator
+    with _coordinator_mutex:
+        if _coordinator is None:
+            from classes.plugin_settings import configuration
+            _coordinator = InstanceCoordinator(configuration.data_dir)
+        return _coordinator
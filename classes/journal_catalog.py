@@ -0,0 +1,139 @@
+"""
+This Module keeps a persistent Catalog of Journal Files.
+For every File it remembers the CMDR, the Game Version, the Size and mtime, and if the File contains any
+Died- or PVPKill-Events at all. This way the historic aggregation can skip Files belonging to other CMDRs, or Files
+without any relevant Events, without opening them again.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import threading
+from dataclasses import dataclass, asdict
+from typing import Callable, Optional
+
+from classes.logger_factory import logger
+from classes.journal_sources import JournalSource
+
+_CATALOG_VERSION = 1
+
+
+@dataclass
+class CatalogEntry:
+    size: int
+    mtime_ns: int
+    commander: Optional[str] = None
+    game_version: Optional[str] = None
+    has_pvp_events: Optional[bool] = None
+    """
+    None means the File was never read up to the end (e.g. because the CMDR was filtered out)
+    """
+
+    def as_dict(self):
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(data: dict) -> "CatalogEntry":
+        return CatalogEntry(
+            int(data["size"]),
+            int(data["mtime_ns"]),
+            data.get("commander"),
+            data.get("game_version"),
+            data.get("has_pvp_events")
+        )
+
+
+class JournalCatalog:
+    """
+    Maps the Name of a Journal to a CatalogEntry. An Entry is only trusted as long as the size and mtime of the
+    File on Disk still match. Journals of the current Session grow - these will simply be re-read.
+    For compressed Journals, size is the compressed Size.
+    """
+
+    def __init__(self, catalog_file: pathlib.Path):
+        self.__catalog_file = catalog_file
+        self.__entries: dict[str, CatalogEntry] = {}
+        self.__is_dirty = False
+        self.__mutex = threading.Lock()
+        self.__load()
+
+    def __load(self):
+        if not self.__catalog_file.is_file():
+            return
+        try:
+            with self.__catalog_file.open("r", encoding="utf8") as file:
+                content = json.load(file)
+            if content.get("version") != _CATALOG_VERSION:
+                logger.info("Journal Catalog has an old Format. Starting with an empty Catalog.")
+                return
+            for name, entry in content["files"].items():
+                self.__entries[name] = CatalogEntry.from_dict(entry)
+        except Exception as e:
+            logger.warning(f"Failed to read Journal Catalog at {self.__catalog_file}. Starting with an empty one.")
+            logger.exception(e)
+            self.__entries.clear()
+
+    @staticmethod
+    def for_journal_dir(data_dir: pathlib.Path, journal_dir: str) -> "JournalCatalog":
+        """
+        Every Journal Directory gets its own Catalog, so e.g. the CLI can be used on many different Directories.
+        """
+        dir_hash = hashlib.sha1(str(pathlib.Path(journal_dir).resolve()).encode("utf8")).hexdigest()[:12]
+        return JournalCatalog(data_dir / f"journal_catalog_{dir_hash}.json")
+
+    def save(self):
+        with self.__mutex:
+            if not self.__is_dirty:
+                return
+            content = {
+                "version": _CATALOG_VERSION,
+                "files": {name: entry.as_dict() for name, entry in self.__entries.items()}
+            }
+            # Write to a temporary File first so a crash never leaves a half-written Catalog behind
+            temp_file = self.__catalog_file.with_suffix(".tmp")
+            with temp_file.open("w", encoding="utf8") as file:
+                json.dump(content, file, separators=(",", ":"))
+            os.replace(temp_file, self.__catalog_file)
+            self.__is_dirty = False
+
+    def lookup(self, source: JournalSource) -> Optional[CatalogEntry]:
+        """
+        Returns the Entry for this Journal, or None if the Journal is unknown or has changed since it was cataloged.
+        """
+        entry = self.__entries.get(source.name)
+        if entry is None:
+            return None
+        if entry.size != source.size or entry.mtime_ns != source.mtime_ns:
+            return None
+        return entry
+
+    def record(self, source: JournalSource, commander: Optional[str], game_version: Optional[str],
+               has_pvp_events: Optional[bool]):
+        entry = CatalogEntry(source.size, source.mtime_ns, commander, game_version, has_pvp_events)
+        with self.__mutex:
+            self.__entries[source.name] = entry
+            self.__is_dirty = True
+
+    def can_skip(self, source: JournalSource, is_cmdr_relevant: Callable[[str], bool]) -> bool:
+        """
+        Returns True if the Catalog knows for sure that this Journal does not contain anything relevant.
+        """
+        entry = self.lookup(source)
+        if entry is None:
+            return False
+        if entry.has_pvp_events is False:
+            return True
+        if entry.commander is not None and not is_cmdr_relevant(entry.commander):
+            return True
+        return False
+
+    def prune(self, existing_sources: list[JournalSource]):
+        """
+        Removes all Entries for Journals that no longer exist in the Journal Directory
+        """
+        names = set(map(lambda x: x.name, existing_sources))
+        with self.__mutex:
+            for name in list(self.__entries.keys()):
+                if name not in names:
+                    del self.__entries[name]
+                    self.__is_dirty = True
@@ -0,0 +1,218 @@
+"""
+Follows the newest Journal in a Directory, like EDMC does, but without EDMC. Used by "cli.py follow" on Machines
+the Journal Folder is synced to.
+
+ - On Linux, the Directory is watched through inotify, so a new Line is seen right after it was written and nothing
+   runs in between. Elsewhere (or with use_inotify=False) the Journal is polled, which is one stat() per Interval.
+ - A Line is only handled once its Newline arrived. The Rest is kept until the Game (or the Sync Tool) wrote it.
+ - When a newer Journal shows up, the old one is read to its End first. A Journal that was replaced by a new File
+   of the same Name (some Sync Tools do that) is reopened at the same Position.
+ - On Start, the newest Journal is read up to its End only for the Events that change the State (see journal_state.py),
+   so Kills that happened before the Start are not sent again.
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import pathlib
+import select
+import struct
+import sys
+import threading
+import time
+from typing import IO, Callable, Optional
+
+from classes.journal_state import STATE_EVENTS
+from classes.logger_factory import logger
+
+_JOURNAL_PREFIX = "Journal."
+_JOURNAL_SUFFIX = ".log"
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_journal_name(name: str) -> bool:
+    return name.startswith(_JOURNAL_PREFIX) and name.endswith(_JOURNAL_SUFFIX)
+
+
+def newest_journal(journal_dir: pathlib.Path) -> Optional[pathlib.Path]:
+    newest: Optional[tuple[float, str, pathlib.Path]] = None
+    for path in journal_dir.glob(f"{_JOURNAL_PREFIX}*{_JOURNAL_SUFFIX}"):
+        try:
+            key = (path.stat().st_mtime, path.name, path)
+        except OSError:
+            continue
+        if newest is None or key[:2] > newest[:2]:
+            newest = key
+    return newest[2] if newest is not None else None
+
+
+class _Inotify:
+    """
+    Watches a Directory through the inotify API of Linux, called through ctypes so no extra Package is needed
+    """
+
+    def __init__(self, directory: pathlib.Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.__fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(self.__fd, os.fsencode(directory), mask) < 0:
+            os.close(self.__fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: float) -> tuple[bool, bool]:
+        """
+        Returns if anything changed, and if a Journal was created (or moved into the Directory)
+        """
+        ready, _, _ = select.select([self.__fd], [], [], timeout)
+        if len(ready) == 0:
+            return False, False
+        new_journal = False
+        while True:
+            try:
+                data = os.read(self.__fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset + _INOTIFY_EVENT_HEADER.size <= len(data):
+                _, mask, _, name_length = _INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+                offset += _INOTIFY_EVENT_HEADER.size
+                name = data[offset:offset + name_length].rstrip(b"\0").decode("utf8", "replace")
+                offset += name_length
+                if mask & (_IN_CREATE | _IN_MOVED_TO) and _is_journal_name(name):
+                    new_journal = True
+        return True, new_journal
+
+    def close(self):
+        os.close(self.__fd)
+
+
+class _Poller:
+    """
+    Stands in for _Inotify where it is not available. Only looks for new Journals every few Polls, listing the
+    Directory costs more than one stat() of the current Journal.
+    """
+    _POLLS_PER_DIRECTORY_SCAN = 10
+
+    def __init__(self, poll_seconds: float):
+        self.__poll_seconds = poll_seconds
+        self.__polls = 0
+
+    def wait(self, timeout: float) -> tuple[bool, bool]:
+        time.sleep(min(timeout, self.__poll_seconds))
+        self.__polls += 1
+        return True, self.__polls % _Poller._POLLS_PER_DIRECTORY_SCAN == 0
+
+    def close(self):
+        pass
+
+
+class JournalFollower:
+
+    def __init__(self, journal_dir: str | pathlib.Path, on_entry: Callable[[dict], None], poll_seconds: float = 0.5,
+                 use_inotify: bool = True, from_start: bool = False):
+        """
+        on_entry is called on the Follower's Thread for every Journal Event, in Order.
+        With from_start, the newest Journal is handed over completely instead of only its State Events.
+        """
+        self.journal_dir = pathlib.Path(journal_dir)
+        self.__on_entry = on_entry
+        self.__poll_seconds = poll_seconds
+        self.__use_inotify = use_inotify
+        self.__from_start = from_start
+        self.__path: Optional[pathlib.Path] = None
+        self.__file: Optional[IO[bytes]] = None
+        self.__partial = b""
+        self.__followed: set[pathlib.Path] = set()
+        """
+        Never gone back to, even if a Sync Tool touches them again later. Their Kills were sent already.
+        """
+
+    def __open_watcher(self):
+        if self.__use_inotify and sys.platform.startswith("linux"):
+            try:
+                return _Inotify(self.journal_dir)
+            except (OSError, AttributeError) as e:
+                logger.warning(f"inotify is not available ({e}). Polling the Journal instead.")
+        return _Poller(self.__poll_seconds)
+
+    def __handle_line(self, line: bytes, only_state: bool):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            logger.warning("Skipping a Line of %s that is not valid JSON", self.__path)
+            return
+        if only_state and entry.get("event") not in STATE_EVENTS:
+            return
+        try:
+            self.__on_entry(entry)
+        except Exception as e:
+            logger.exception(e)
+
+    def __read_new_lines(self, only_state: bool = False):
+        if self.__file is None or self.__path is None:
+            return
+        try:
+            if os.stat(self.__path).st_ino != os.fstat(self.__file.fileno()).st_ino:
+                # Replaced by a new File of the same Name. It starts with what was already read.
+                position = self.__file.tell()
+                self.__file.close()
+                self.__file = self.__path.open("rb")
+                self.__file.seek(position)
+        except OSError:
+            # Gone for now, e.g. in the middle of being replaced. Try again next Time.
+            return
+        data = self.__file.read()
+        if len(data) == 0:
+            return
+        lines = (self.__partial + data).split(b"\n")
+        # The last Piece has no Newline yet (or is empty)
+        self.__partial = lines.pop()
+        for line in lines:
+            if len(line.strip()) > 0:
+                self.__handle_line(line, only_state)
+
+    def __switch_to(self, path: pathlib.Path, catch_up: bool):
+        if self.__file is not None:
+            self.__read_new_lines()
+            if len(self.__partial.strip()) > 0:
+                # The Game never finished this Line (e.g. it crashed)
+                self.__handle_line(self.__partial, False)
+            self.__file.close()
+        logger.info(f"Following {path}")
+        self.__followed.add(path)
+        self.__path = path
+        self.__file = path.open("rb")
+        self.__partial = b""
+        # Whatever is in there already would not be announced again
+        self.__read_new_lines(only_state=catch_up)
+
+    def run(self, stop: threading.Event):
+        """
+        Blocks until stop is set
+        """
+        watcher = self.__open_watcher()
+        try:
+            newest = newest_journal(self.journal_dir)
+            if newest is not None:
+                self.__switch_to(newest, catch_up=not self.__from_start)
+            else:
+                logger.info(f"No Journal in {self.journal_dir} yet. Waiting for one.")
+            while not stop.is_set():
+                changed, maybe_new_journal = watcher.wait(1.0)
+                if changed:
+                    self.__read_new_lines()
+                if maybe_new_journal or self.__path is None:
+                    newest = newest_journal(self.journal_dir)
+                    if newest is not None and newest not in self.__followed:
+                        self.__switch_to(newest, catch_up=False)
+        finally:
+            watcher.close()
+            if self.__file is not None:
+                self.__file.close()
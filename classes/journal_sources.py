@@ -0,0 +1,128 @@
+"""
+This Module finds Journal Files in a Directory and opens them for reading. Besides plain *.log Files, Journals that
+were compressed to save space are supported as well:
+* Journal.*.log.gz
+* Journal.*.log.zst (needs the optional zstandard Package)
+* *.zip Archives containing Journal.*.log Files
+
+Compressed Files are decompressed while reading. Nothing is extracted to Disk or loaded into Memory as a whole.
+"""
+import datetime as dt
+import gzip
+import io
+import pathlib
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import IO, Iterator, Optional
+
+from classes.logger_factory import logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_PLAIN_SUFFIX = ".log"
+_COMPRESSED_SUFFIXES = (".log.gz", ".log.zst")
+_ARCHIVE_SUFFIX = ".zip"
+
+
+@dataclass
+class JournalSource:
+    path: pathlib.Path
+    """
+    The File on Disk. For Archives this is the Archive itself.
+    """
+    size: int
+    """
+    Size on Disk. For compressed Files this is the compressed Size.
+    """
+    mtime_ns: int
+    member: Optional[str] = None
+    """
+    Name of the Journal inside the Archive, if this Journal is part of a zip Archive.
+    """
+
+    @property
+    def name(self) -> str:
+        """
+        A unique Name for this Journal inside the Journal Directory. Used as the Key in the Journal Catalog.
+        """
+        if self.member is not None:
+            return f"{self.path.name}/{self.member}"
+        return self.path.name
+
+    @property
+    def display_name(self) -> str:
+        if self.member is not None:
+            return f"{self.path}/{self.member}"
+        return str(self.path)
+
+    @property
+    def mtime(self) -> int:
+        return self.mtime_ns // 1_000_000_000
+
+    @contextmanager
+    def open(self) -> Iterator[IO[str]]:
+        """
+        Opens the Journal as a Text Stream. Compressed Journals are decompressed while reading.
+        """
+        if self.member is not None:
+            with zipfile.ZipFile(self.path) as archive:
+                with archive.open(self.member) as raw:
+                    yield io.TextIOWrapper(raw, encoding="utf8")
+        elif self.path.name.endswith(".log.gz"):
+            with gzip.open(self.path, "rt", encoding="utf8") as file:
+                yield file
+        elif self.path.name.endswith(".log.zst"):
+            if zstandard is None:
+                raise RuntimeError(f"Cannot read {self.path.name}, the zstandard Package is not installed")
+            with self.path.open("rb") as raw:
+                with zstandard.ZstdDecompressor().stream_reader(raw) as decompressed:
+                    yield io.TextIOWrapper(decompressed, encoding="utf8")
+        else:
+            with self.path.open("r", encoding="utf8") as file:
+                yield file
+
+
+def _sources_in_archive(path: pathlib.Path) -> list[JournalSource]:
+    sources = []
+    try:
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                member_name = pathlib.PurePosixPath(info.filename).name
+                if info.is_dir() or not member_name.endswith(_PLAIN_SUFFIX):
+                    continue
+                # Zip Files store the local Time without a Timezone
+                mtime = dt.datetime(*info.date_time).timestamp()
+                sources.append(JournalSource(path, info.compress_size, int(mtime * 1_000_000_000), info.filename))
+    except (zipfile.BadZipFile, OSError) as e:
+        logger.warning(f"Skipping {path.name}, it is not a readable zip Archive: {e}")
+    return sources
+
+
+def find_journal_sources(journal_dir: str | pathlib.Path) -> list[JournalSource]:
+    """
+    Returns all Journals in the Directory, including compressed ones and the ones inside zip Archives.
+    """
+    sources: list[JournalSource] = []
+    warned_about_zstandard = False
+    for path in pathlib.Path(journal_dir).iterdir():
+        name = path.name
+        if name.endswith(_ARCHIVE_SUFFIX):
+            if path.is_file():
+                sources.extend(_sources_in_archive(path))
+            continue
+        if not (name.endswith(_PLAIN_SUFFIX) or name.endswith(_COMPRESSED_SUFFIXES)):
+            continue
+        if name.endswith(".log.zst") and zstandard is None:
+            if not warned_about_zstandard:
+                logger.warning("Found *.log.zst Journals, but the zstandard Package is not installed. Skipping them.")
+                warned_about_zstandard = True
+            continue
+        if not path.is_file():
+            continue
+        stat = path.stat()
+        sources.append(JournalSource(path, stat.st_size, stat.st_mtime_ns))
+    return sources
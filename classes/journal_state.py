@@ -0,0 +1,102 @@
+"""
+Keeps track of who is playing, in which Ship, with which Combat Rank and where, while going through Journal Events.
+The live Path (load.py::journal_entry) and the historic Path (historic_data.py) both use this, so they always agree
+on what is sent along with a Kill.
+
+Events are dispatched through a Table built once (Event Name -> Handler), so an Event that does not change the State
+costs one Set Lookup.
+"""
+import dataclasses
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+
+@dataclass
+class JournalState:
+    commander: Optional[str] = None
+    ship: Optional[str] = None
+    combat_rank: Optional[int] = None
+    location: Optional[str] = None
+    game_version: Optional[str] = None
+
+
+def _on_fileheader(state: JournalState, entry: dict[str, Any]):
+    state.game_version = entry.get("gameversion")
+
+
+def _on_load_game(state: JournalState, entry: dict[str, Any]):
+    state.commander = str(entry["Commander"])
+
+
+def _on_location(state: JournalState, entry: dict[str, Any]):
+    state.location = entry["StarSystem"]
+
+
+def _on_rank(state: JournalState, entry: dict[str, Any]):
+    state.combat_rank = entry["Combat"]
+
+
+def _on_promotion(state: JournalState, entry: dict[str, Any]):
+    # Promotion Events only contain the Rank that changed
+    if "Combat" in entry:
+        state.combat_rank = entry["Combat"]
+
+
+def _on_loadout(state: JournalState, entry: dict[str, Any]):
+    # Lowercase, like EDMC does it
+    state.ship = str(entry["Ship"]).lower()
+
+
+def _on_suit_loadout(state: JournalState, _entry: dict[str, Any]):
+    state.ship = "on_foot"
+    # state.ship = entry["SuitName"] # Can be reactivated later.
+    # For now, all on-foot kills are just treated as "on_foot"
+
+
+_handlers: dict[str, Callable[[JournalState, dict[str, Any]], None]] = {
+    "Fileheader": _on_fileheader,
+    "LoadGame": _on_load_game,
+    "Location": _on_location,
+    "FSDJump": _on_location,
+    "CarrierJump": _on_location,
+    "Rank": _on_rank,
+    "Promotion": _on_promotion,
+    "Loadout": _on_loadout,
+    "SuitLoadout": _on_suit_loadout,
+}
+
+STATE_EVENTS = frozenset(_handlers)
+"""
+All Events that change the State
+"""
+
+
+class JournalStateTracker:
+
+    def __init__(self, state: Optional[JournalState] = None):
+        self.state = state or JournalState()
+
+    def feed(self, entry: dict[str, Any]) -> str:
+        """
+        Updates the State with the Event, if it is one that changes the State. Returns the Name of the Event.
+        Raises a KeyError if the Event lacks a Field it should have.
+        """
+        event = entry["event"]
+        # Most Events do not change the State. For those, the Set Lookup is all that happens.
+        if event in STATE_EVENTS:
+            _handlers[event](self.state, entry)
+        return event
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        A JSON-serializable Copy of the State, e.g. to continue reading a Journal later with restore()
+        """
+        return dataclasses.asdict(self.state)
+
+    @staticmethod
+    def restore(snapshot: dict[str, Any]) -> "JournalStateTracker":
+        """
+        Continues from a snapshot(). Fields the snapshot does not know (e.g. from an older Version) stay unset.
+        """
+        fields = {field.name for field in dataclasses.fields(JournalState)}
+        return JournalStateTracker(JournalState(**{k: v for k, v in snapshot.items() if k in fields}))
@@ -0,0 +1,120 @@
+"""
+EDMC calls journal_entry on its Main (Tk) Thread for every Line of the Journal. All that happens there is one Set
+Lookup. Events that matter (State Changes, Kills and Deaths) are handed to this Worker together with the Parts of
+EDMCs state-Dict that are needed, and everything else (State Tracking, Commander Filter, Conversion, Killboard,
+Queueing) happens here, in the Order the Events came in.
+"""
+import queue
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from classes.journal_state import STATE_EVENTS, JournalStateTracker
+from classes.lifecycle import lifecycle
+from classes.logger_factory import logger
+from classes.plugin_settings import configuration
+
+KILL_EVENTS = frozenset(("Died", "PVPKill"))
+RELEVANT_EVENTS = STATE_EVENTS | KILL_EVENTS
+"""
+Everything else is dropped on the Main Thread right away
+"""
+
+
+@dataclass
+class JournalWork:
+    entry: dict[str, Any]
+    cmdr: str
+    """
+    Empty if not known (headless). The Commander of the last LoadGame is used then.
+    """
+    system: str
+    ship: Optional[str]
+    """
+    From EDMCs state-Dict at the Time of the Event, only used as long as the Tracker has not seen a Loadout
+    """
+    rank: Optional[int]
+    received: float
+
+
+class JournalWorker:
+
+    def __init__(self):
+        self.__queue: "queue.SimpleQueue[JournalWork]" = queue.SimpleQueue()
+        self.__thread = None
+        self.__stopping = False
+        self.tracker = JournalStateTracker()
+        """
+        Same Tracking as for historic Data. EDMCs state-Dict is only used for what the Tracker has not seen yet,
+        e.g. if the Plugin was loaded in the middle of a Session.
+        """
+
+    def submit(self, work: JournalWork):
+        """
+        Only called from one Thread: EDMCs Main Thread, or the Journal Follower when running headless
+        """
+        self.__queue.put(work)
+        if self.__thread is None:
+            self.__thread = lifecycle.start_thread("journal-worker", self.__loop)
+
+    def __loop(self):
+        while True:
+            try:
+                work = self.__queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.__stopping:
+                    return
+                continue
+            try:
+                self.__handle(work)
+            except Exception as e:
+                # Catchall just in Case
+                logger.exception(e)
+                from classes.event_handling import write_ui_message
+                write_ui_message(str(e), "ERROR", 10_000)
+
+    @staticmethod
+    def __is_cmdr_valid(cmdr: str) -> bool:
+        if not configuration.has_commander_filter_enabled:
+            return True
+        return cmdr.upper() in map(str.upper, configuration.allowed_cmdrs)
+
+    def __handle(self, work: JournalWork):
+        entry = work.entry
+        try:
+            event = self.tracker.feed(entry)
+        except KeyError:
+            logger.warning("Journal Event %s is missing a Field. Ignoring it for the State.", entry.get("event"))
+            event = entry.get("event")
+        if event not in KILL_EVENTS:
+            return
+        tracked = self.tracker.state
+        # Headless, there is no CMDR from EDMC. The Journal names it.
+        cmdr = work.cmdr or tracked.commander
+        if cmdr is None:
+            logger.warning("Ignoring %s Event before any LoadGame Event", event)
+            return
+        # Now check if the CMDR should be skipped due to settings
+        if not self.__is_cmdr_valid(cmdr):
+            return
+        # Aggregate some additional data
+        ship_current_flying = tracked.ship or work.ship
+        own_rank = tracked.combat_rank if tracked.combat_rank is not None else work.rank
+        system = tracked.location or work.system
+        from classes.latency_trace import EventTrace
+        trace = EventTrace(entry.get("timestamp", ""), work.received)
+        # At this point only "valid" CMDRs are remaining.
+        import classes.event_handling as events
+        if event == "Died":
+            events.handle_died_event(cmdr, own_rank, entry, ship_current_flying, system, trace)
+        elif event == "PVPKill":
+            events.handle_kill_event(cmdr, own_rank, entry, ship_current_flying, system, trace)
+
+    def stop(self, deadline: float):
+        """
+        Works off what is left before the HTTP Thread stops, so those Events are sent or saved to the Spool.
+        Has to be registered with the Lifecycle before the HTTP Thread is started.
+        """
+        self.__stopping = True
+        if self.__thread is not None:
+            self.__thread.join(max(0.0, deadline - time.monotonic()))
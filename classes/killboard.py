@@ -0,0 +1,175 @@
+"""
+A local Killboard in SQLite. Every PVPKill and Died Event the Plugin sees (live and historic) is stored here,
+so Questions like "how many Kills do I have on X" or "what is my K/D this Month" can be answered right away,
+without asking the Discord Bot.
+"""
+import pathlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from classes.data import PvpKillEventData
+from classes.logger_factory import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL,
+    commander TEXT NOT NULL COLLATE NOCASE,
+    commander_ship TEXT,
+    commander_rank INTEGER,
+    opponent TEXT NOT NULL COLLATE NOCASE,
+    opponent_ship TEXT,
+    opponent_rank INTEGER,
+    is_kill INTEGER NOT NULL,
+    system TEXT COLLATE NOCASE,
+    UNIQUE (timestamp, commander, opponent, is_kill)
+);
+CREATE INDEX IF NOT EXISTS idx_events_commander_time ON events (commander, timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_opponent ON events (commander, opponent);
+CREATE INDEX IF NOT EXISTS idx_events_ship ON events (commander, commander_ship);
+CREATE INDEX IF NOT EXISTS idx_events_opponent_ship ON events (opponent_ship);
+CREATE INDEX IF NOT EXISTS idx_events_system ON events (system);
+CREATE INDEX IF NOT EXISTS idx_events_time ON events (timestamp);
+"""
+
+
+@dataclass
+class KillDeathStats:
+    kills: int
+    deaths: int
+
+    @property
+    def ratio(self) -> float:
+        if self.deaths == 0:
+            return float(self.kills)
+        return self.kills / self.deaths
+
+    def __str__(self):
+        return f"{self.kills} K / {self.deaths} D (K/D {self.ratio:.2f})"
+
+
+_revision = 0
+"""
+Counts up with every Write, so Readers can tell if what they computed earlier is still up to date
+"""
+
+
+def revision() -> int:
+    return _revision
+
+
+def _as_row(data: PvpKillEventData, is_kill: bool) -> tuple:
+    own, other = (data.killer, data.victim) if is_kill else (data.victim, data.killer)
+    return (data.timestamp, own.name, own.ship, own.rank, other.name, other.ship, other.rank,
+            1 if is_kill else 0, data.location)
+
+
+class Killboard:
+
+    def __init__(self, db_path: pathlib.Path):
+        # One Connection shared by all Threads, guarded by the Mutex. The Writes are tiny, so this never waits long.
+        self.__connection = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.executescript(_SCHEMA)
+        self.__mutex = threading.Lock()
+
+    def add(self, data: PvpKillEventData, is_kill: bool):
+        """
+        is_kill is True for Events where the own CMDR is the Killer (PVPKill), False for Died Events.
+        Events already in the Killboard are ignored.
+        """
+        self.add_many([data], is_kill)
+
+    def add_many(self, events: list[PvpKillEventData], is_kill: bool):
+        global _revision
+        rows = [_as_row(data, is_kill) for data in events]
+        with self.__mutex, self.__connection:
+            self.__connection.executemany(
+                "INSERT OR IGNORE INTO events (timestamp, commander, commander_ship, commander_rank, opponent, "
+                "opponent_ship, opponent_rank, is_kill, system) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            _revision += 1
+
+    def __query(self, sql: str, parameters: tuple) -> list[tuple]:
+        with self.__mutex:
+            return self.__connection.execute(sql, parameters).fetchall()
+
+    def stats(self, commander: str, since: Optional[int] = None, opponent: Optional[str] = None) -> KillDeathStats:
+        """
+        Kills and Deaths of the CMDR, optionally only since a Unix Timestamp and/or only against one Opponent
+        """
+        sql = "SELECT COALESCE(SUM(is_kill), 0), COUNT(*) - COALESCE(SUM(is_kill), 0) FROM events WHERE commander = ?"
+        parameters: list = [commander]
+        if since is not None:
+            sql += " AND timestamp >= ?"
+            parameters.append(since)
+        if opponent is not None:
+            sql += " AND opponent = ?"
+            parameters.append(opponent)
+        kills, deaths = self.__query(sql, tuple(parameters))[0]
+        return KillDeathStats(int(kills), int(deaths))
+
+    def top_opponents(self, commander: str, since: Optional[int] = None, limit: int = 5) -> list[tuple[str, KillDeathStats]]:
+        sql = "SELECT opponent, SUM(is_kill), COUNT(*) - SUM(is_kill) FROM events WHERE commander = ?"
+        parameters: list = [commander]
+        if since is not None:
+            sql += " AND timestamp >= ?"
+            parameters.append(since)
+        sql += " GROUP BY opponent ORDER BY COUNT(*) DESC LIMIT ?"
+        parameters.append(limit)
+        return [(name, KillDeathStats(int(kills), int(deaths)))
+                for name, kills, deaths in self.__query(sql, tuple(parameters))]
+
+    def latest_event(self, commanders: Optional[list[str]] = None) -> Optional[tuple[str, str]]:
+        """
+        (commander, opponent) of the most recent Event, or None if the Killboard is empty.
+        With commanders, only Events of these CMDRs count (e.g. the allowed CMDRs, so Alts do not show up).
+        """
+        sql = "SELECT commander, opponent FROM events"
+        parameters: tuple = ()
+        if commanders is not None:
+            if len(commanders) == 0:
+                return None
+            sql += f" WHERE commander IN ({', '.join('?' * len(commanders))})"
+            parameters = tuple(commanders)
+        rows = self.__query(sql + " ORDER BY timestamp DESC LIMIT 1", parameters)
+        if len(rows) == 0:
+            return None
+        return rows[0][0], rows[0][1]
+
+
+def start_of_today() -> int:
+    """
+    Unix Timestamp of the last local Midnight
+    """
+    now = time.localtime()
+    return int(time.mktime((now.tm_year, now.tm_mon, now.tm_mday, 0, 0, 0, 0, 0, -1)))
+
+
+def start_of_month() -> int:
+    now = time.localtime()
+    return int(time.mktime((now.tm_year, now.tm_mon, 1, 0, 0, 0, 0, 0, -1)))
+
+
+_killboard: Optional[Killboard] = None
+_killboard_failed = False
+_killboard_mutex = threading.Lock()
+
+
+def get_killboard() -> Optional[Killboard]:
+    """
+    Returns the Killboard, or None if it could not be opened. The Plugin works without it.
+    """
+    global _killboard, _killboard_failed
+    with _killboard_mutex:
+        if _killboard is None and not _killboard_failed:
+            from classes.plugin_settings import configuration
+            try:
+                _killboard = Killboard(configuration.data_dir / "killboard.sqlite")
+            except sqlite3.Error as e:
+                logger.error(f"Could not open the local Killboard: {e}")
+                _killboard_failed = True
+        return _killboard
@@ -0,0 +1,147 @@
+"""
+Follows every live Event from the Journal to the Server's Answer, to tell where the Time goes:
+
+    journal     Timestamp in the Journal -> journal_entry was called (how late EDMC saw the Line)
+    processing  journal_entry -> queued in the HTTP Thread
+    queue       queued -> sent (waiting behind other Requests and for the Rate Limit, including 429 Retries)
+    network     sent -> Server answered
+    total       Timestamp in the Journal -> Server answered
+
+Journal Timestamps only have whole Seconds, so "journal" and "total" are off by up to a Second.
+The last few hundred Traces are kept in Memory. Percentiles over them are shown in the Settings Tab, and they can be
+exported as NDJSON (one Trace per Line).
+"""
+import collections
+import datetime as dt
+import json
+import pathlib
+import threading
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from classes.logger_factory import logger
+
+_MAX_TRACES = 500
+
+STAGES = ("journal", "processing", "queue", "network", "total")
+
+
+@dataclass
+class EventTrace:
+    journal_timestamp: str
+    """
+    As written in the Journal. Only parsed once the Trace is done, so journal_entry does not pay for it.
+    """
+    received: float
+    enqueued: Optional[float] = None
+    sent: Optional[float] = None
+    responded: Optional[float] = None
+    retries: int = 0
+    outcome: Optional[str] = None
+    """
+    The HTTP Status Code, or what happened instead (e.g. "spooled", "error")
+    """
+
+    def __journal_time(self) -> Optional[float]:
+        try:
+            return dt.datetime.strptime(self.journal_timestamp, "%Y-%m-%dT%H:%M:%SZ")\
+                .replace(tzinfo=dt.timezone.utc).timestamp()
+        except ValueError:
+            return None
+
+    def stages(self) -> dict[str, Optional[float]]:
+        """
+        Seconds spent in each Stage. None if the Event never got there.
+        """
+        def between(start: Optional[float], end: Optional[float]) -> Optional[float]:
+            if start is None or end is None:
+                return None
+            return end - start
+
+        journal_time = self.__journal_time()
+        return {
+            "journal": between(journal_time, self.received),
+            "processing": between(self.received, self.enqueued),
+            "queue": between(self.enqueued, self.sent),
+            "network": between(self.sent, self.responded),
+            "total": between(journal_time, self.responded),
+        }
+
+
+def _percentile(ordered: list[float], percent: float) -> float:
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class LatencyTracer:
+
+    def __init__(self, max_traces: int = _MAX_TRACES):
+        self.__traces: collections.deque[EventTrace] = collections.deque(maxlen=max_traces)
+        self.__mutex = threading.Lock()
+
+    def finish(self, trace: EventTrace, outcome: str):
+        with self.__mutex:
+            if trace.outcome is not None:
+                # Already finished, e.g. the Response was handled and then handling it failed
+                return
+            trace.outcome = outcome
+            self.__traces.append(trace)
+
+    def __len__(self) -> int:
+        return len(self.__traces)
+
+    def percentiles(self, percents: tuple[float, ...] = (50, 90, 99)) -> dict[str, Optional[tuple[float, ...]]]:
+        """
+        Per Stage, the Percentiles in Seconds over the kept Traces. None for a Stage no Trace got through.
+        """
+        with self.__mutex:
+            traces = list(self.__traces)
+        durations: dict[str, list[float]] = {stage: [] for stage in STAGES}
+        for trace in traces:
+            for stage, duration in trace.stages().items():
+                if duration is not None:
+                    durations[stage].append(duration)
+        result: dict[str, Optional[tuple[float, ...]]] = {}
+        for stage, values in durations.items():
+            values.sort()
+            result[stage] = tuple(_percentile(values, p) for p in percents) if len(values) > 0 else None
+        return result
+
+    def summary(self, stages: tuple[str, ...] = STAGES) -> str:
+        """
+        One Line per Stage, e.g. for the Settings Tab
+        """
+        if len(self) == 0:
+            return "No Events were sent yet."
+        lines = [f"Latency of the last {len(self)} Events (p50 / p90 / p99):"]
+        for stage, values in self.percentiles().items():
+            if values is None or stage not in stages:
+                continue
+            lines.append(f"{stage}: " + " / ".join(f"{v * 1000:.0f} ms" for v in values))
+        return "\n".join(lines)
+
+    def export_ndjson(self, path: pathlib.Path) -> int:
+        """
+        Writes all kept Traces to path. Returns how many were written.
+        """
+        with self.__mutex:
+            traces = list(self.__traces)
+        with path.open("w", encoding="utf8") as file:
+            for trace in traces:
+                line = asdict(trace)
+                line["stages"] = trace.stages()
+                file.write(json.dumps(line, separators=(",", ":")) + "\n")
+        logger.info(f"Exported {len(traces)} Latency Traces to {path}")
+        return len(traces)
+
+
+_tracer: Optional[LatencyTracer] = None
+_tracer_mutex = threading.Lock()
+
+
+def get_latency_tracer() -> LatencyTracer:
+    global _tracer
+    with _tracer_mutex:
+        if _tracer is None:
+            _tracer = LatencyTracer()
+        return _tracer
@@ -0,0 +1,167 @@
+"""
+Owns every Thread the Plugin starts, so they can all be stopped together when EDMC shuts down (see load.py::plugin_stop).
+
+ - Long running Workers (the HTTP Sender, the historic Aggregation) get their own Thread through start_thread()
+ - Short Jobs (Version Check, API Key Check, Spool Upload) run on a small shared Pool through submit()
+ - Delayed Calls (e.g. hiding a UI Message after some Seconds) run on one Scheduler Thread through call_later()
+
+Components that hold Data which must not be lost register a Stop Hook with on_stop(). The Hooks are run in Order
+of Registration and get the Deadline until which they have to be done.
+All Threads are named "pvpbot-...", so thread_names() can tell how many the Plugin uses.
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from classes.logger_factory import logger, start_log_writer
+
+THREAD_PREFIX = "pvpbot-"
+_BACKGROUND_WORKERS = 2
+
+
+class ScheduledCall:
+    def __init__(self, when: float, callback: Callable[[], Any]):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _Scheduler:
+    """
+    One Thread for all delayed Calls, instead of one sleeping Thread per Call
+    """
+
+    def __init__(self):
+        self.__calls: list[tuple[float, int, ScheduledCall]] = []
+        self.__counter = itertools.count()
+        self.__condition = threading.Condition()
+        self.__thread: Optional[threading.Thread] = None
+        self.__stopped = False
+
+    def call_later(self, seconds: float, callback: Callable[[], Any]) -> ScheduledCall:
+        call = ScheduledCall(time.monotonic() + seconds, callback)
+        with self.__condition:
+            if self.__stopped:
+                call.cancel()
+                return call
+            heapq.heappush(self.__calls, (call.when, next(self.__counter), call))
+            if self.__thread is None:
+                start_log_writer()
+                self.__thread = threading.Thread(name=f"{THREAD_PREFIX}scheduler", target=self.__loop, daemon=True)
+                self.__thread.start()
+            self.__condition.notify()
+        return call
+
+    def __loop(self):
+        while True:
+            with self.__condition:
+                while not self.__stopped and (len(self.__calls) == 0 or self.__calls[0][0] > time.monotonic()):
+                    timeout = None if len(self.__calls) == 0 else self.__calls[0][0] - time.monotonic()
+                    self.__condition.wait(timeout)
+                if self.__stopped:
+                    return
+                _, _, call = heapq.heappop(self.__calls)
+            if call.cancelled:
+                continue
+            try:
+                call.callback()
+            except Exception as e:
+                logger.exception(e)
+
+    def stop(self):
+        with self.__condition:
+            self.__stopped = True
+            self.__calls.clear()
+            self.__condition.notify()
+
+
+class Lifecycle:
+
+    def __init__(self):
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__scheduler = _Scheduler()
+        self.__stop_hooks: list[tuple[str, Callable[[float], None]]] = []
+        self.__stopping = threading.Event()
+        self.__mutex = threading.Lock()
+
+    @property
+    def is_stopping(self) -> bool:
+        return self.__stopping.is_set()
+
+    def start_thread(self, name: str, target: Callable[[], Any]) -> threading.Thread:
+        """
+        Starts a long running Worker. It should return once is_stopping is True, or register a Stop Hook.
+        """
+        start_log_writer()
+        thread = threading.Thread(name=f"{THREAD_PREFIX}{name}", target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def submit(self, function: Callable[..., Any], *args) -> Future:
+        """
+        Runs a short Job on the shared Background Pool
+        """
+        with self.__mutex:
+            if self.__executor is None:
+                start_log_writer()
+                self.__executor = ThreadPoolExecutor(max_workers=_BACKGROUND_WORKERS,
+                                                     thread_name_prefix=f"{THREAD_PREFIX}background")
+            executor = self.__executor
+        return executor.submit(self.__run_logged, function, *args)
+
+    @staticmethod
+    def __run_logged(function: Callable[..., Any], *args):
+        try:
+            return function(*args)
+        except Exception as e:
+            logger.exception(e)
+            raise
+
+    def call_later(self, seconds: float, callback: Callable[[], Any]) -> ScheduledCall:
+        return self.__scheduler.call_later(seconds, callback)
+
+    def on_stop(self, name: str, hook: Callable[[float], None]):
+        """
+        hook is called with the Deadline (in time.monotonic()) until which it has to be done
+        """
+        with self.__mutex:
+            self.__stop_hooks.append((name, hook))
+
+    @staticmethod
+    def thread_names() -> list[str]:
+        return sorted(t.name for t in threading.enumerate() if t.name.startswith(THREAD_PREFIX))
+
+    def stop(self, timeout_seconds: float):
+        """
+        Runs all Stop Hooks, then stops the Pool and the Scheduler. Returns after timeout_seconds at the latest.
+        """
+        deadline = time.monotonic() + timeout_seconds
+        self.__stopping.set()
+        logger.info(f"Stopping. Threads in use: {', '.join(self.thread_names())}")
+        index = 0
+        while True:
+            # A Hook may start something that registers a Hook of its own (e.g. the Journal Worker still sending its
+            # last Events starts the HTTP Thread). Those are run as well.
+            with self.__mutex:
+                if index >= len(self.__stop_hooks):
+                    break
+                name, hook = self.__stop_hooks[index]
+            index += 1
+            try:
+                hook(deadline)
+            except Exception as e:
+                logger.error(f"Stopping {name} failed: {e}")
+        self.__scheduler.stop()
+        with self.__mutex:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=False, cancel_futures=True)
+        logger.info(f"Stopped after {timeout_seconds - max(deadline - time.monotonic(), 0):.2f}s")
+
+
+lifecycle = Lifecycle()
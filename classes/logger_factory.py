@@ -1,29 +1,125 @@
 from pathlib import Path
+import atexit
+import itertools
+import json
 import logging
+import logging.handlers
+import queue
+import threading
 from os.path import basename, dirname
-import config
+from typing import Any, Optional
+
+try:
+    from config import appname
+except ImportError:
+    # Not running inside EDMC (e.g. cli.py)
+    from classes.headless_config import config as _headless_config
+    appname = _headless_config.appname
 
 _plugin_name = basename(Path(dirname(__file__)).parent)
 
+_MAX_PAYLOAD_LOG_CHARS = 2000
+_PAYLOAD_SAMPLE_EVERY = 10
+"""
+Only every n-th Payload is logged (shortened) at INFO. Full Payloads are only logged if enabled in the Settings.
+"""
+
+
+class _WriterQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts Records into the Queue of the Log Writer. The Message (and a Traceback) is formatted here, on the Thread
+    that logs, while its Arguments are still what they were. The Writer Thread then only does the I/O.
+    As long as the Plugin has not started any Thread (see start_log_writer), Records are written right away instead,
+    so loading the Plugin does not start one just for logging.
+    """
+
+    def __init__(self, record_queue: queue.SimpleQueue, target: logging.Handler):
+        super().__init__(record_queue)
+        self.__target = target
+
+    def emit(self, record: logging.LogRecord):
+        if _log_writer is None:
+            self.__target.handle(record)
+        else:
+            super().emit(record)
+
+
+class _ForwardToParentHandler(logging.Handler):
+    """
+    Inside EDMC, the Records are handed to the Handlers of EDMCs own Logger from the Writer Thread, so they end up where
+    they always did. callHandlers() is the same Path Propagation takes: the Filters of EDMCs Logger are not run again
+    on the Writer Thread. The ones of the Plugin's Logger already ran on the Thread that logged.
+    """
+
+    def __init__(self, parent: logging.Logger):
+        super().__init__()
+        self.__parent = parent
+
+    def emit(self, record: logging.LogRecord):
+        self.__parent.callHandlers(record)
+
+
+class _LogWriter(logging.handlers.QueueListener):
+
+    def start(self):
+        # Same as QueueListener.start, but with a Name, so the Thread can be told apart from the others
+        self._thread = threading.Thread(name="pvpbot-log-writer", target=self._monitor, daemon=True)
+        self._thread.start()
+
+
+def __build_stream_handler() -> logging.Handler:
+    logger_channel = logging.StreamHandler()
+    # noinspection SpellCheckingInspection
+    logger_formatter = logging.Formatter(
+        f'%(asctime)s - %(name)s - %(levelname)s - %(module)s:%(lineno)d:%(funcName)s: %(message)s')
+    logger_formatter.default_time_format = '%Y-%m-%d %H:%M:%S'
+    logger_formatter.default_msec_format = '%s.%03d'
+    logger_channel.setFormatter(logger_formatter)
+    return logger_channel
+
+
+_record_queue: queue.SimpleQueue = queue.SimpleQueue()
+_target: logging.Handler
+_log_writer: Optional[_LogWriter] = None
+_log_writer_mutex = threading.Lock()
+
+
+def start_log_writer():
+    """
+    Called by the Lifecycle before it starts a Thread. From then on, Records are written by the Log Writer Thread.
+    """
+    global _log_writer
+    if _log_writer is not None:
+        return
+    with _log_writer_mutex:
+        if _log_writer is not None:
+            return
+        writer = _LogWriter(_record_queue, _target, respect_handler_level=True)
+        writer.start()
+        # Write out what is still queued when the Process exits
+        atexit.register(writer.stop)
+        _log_writer = writer
+
 
 def __build_logger_for_module() -> logging.Logger:
     """
-    Create the logger for this Plugin in accordance with the EDMC Docs
+    Create the logger for this Plugin in accordance with the EDMC Docs.
+    Once the Plugin runs Threads, Records are put into a Queue and written by a QueueListener on its own Thread,
+    so logging never waits for I/O.
     """
-    logger_name = f'{config.appname}.{_plugin_name}'
+    global _target
+    logger_name = f'{appname}.{_plugin_name}'
     _logger = logging.getLogger(logger_name)
 
     if not _logger.hasHandlers():
         _logger.setLevel(logging.INFO)
-        logger_channel = logging.StreamHandler()
-        # noinspection SpellCheckingInspection
-        logger_formatter = logging.Formatter(
-            f'%(asctime)s - %(name)s - %(levelname)s - %(module)s:%(lineno)d:%(funcName)s: %(message)s')
-        logger_formatter.default_time_format = '%Y-%m-%d %H:%M:%S'
-        logger_formatter.default_msec_format = '%s.%03d'
-        logger_channel.setFormatter(logger_formatter)
-        _logger.addHandler(logger_channel)
+        _target = __build_stream_handler()
+    else:
+        _target = _ForwardToParentHandler(_logger.parent)
+        # The Writer hands the Records to EDMC. Propagating them as well would log every Line twice.
+        _logger.propagate = False
 
+    _logger.addHandler(_WriterQueueHandler(_record_queue, _target))
     return _logger
 
 
@@ -31,3 +127,37 @@ logger = __build_logger_for_module()
 """
 Logger for this Plugin.
 """
+
+
+class _PayloadForLog:
+    """
+    Only turned into JSON if the Record is actually written
+    """
+
+    def __init__(self, payload: Any, max_chars: int | None):
+        self.__payload = payload
+        self.__max_chars = max_chars
+
+    def __str__(self):
+        as_str = json.dumps(self.__payload)
+        if self.__max_chars is not None and len(as_str) > self.__max_chars:
+            return f"{as_str[:self.__max_chars]}... ({len(as_str)} chars)"
+        return as_str
+
+
+_payload_counter = itertools.count()
+
+
+def log_payload(description: str, payload: Any):
+    """
+    Logs a Request Body. By default only every n-th Body is logged, and shortened. If "log_full_payloads" is turned
+    on, every Body is logged in full at DEBUG.
+    """
+    from classes.plugin_settings import configuration
+    if configuration.log_full_payloads:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s: %s", description, _PayloadForLog(payload, None), stacklevel=2)
+        return
+    if next(_payload_counter) % _PAYLOAD_SAMPLE_EVERY == 0 and logger.isEnabledFor(logging.INFO):
+        logger.info("%s (every %d. Body is logged): %s", description, _PAYLOAD_SAMPLE_EVERY,
+                    _PayloadForLog(payload, _MAX_PAYLOAD_LOG_CHARS), stacklevel=2)
@@ -2,12 +2,21 @@
 A wrapper around EDMCs Configuration. The pattern seen here has been taken from the EDMC-Massacre plugin
 See https://github.com/CMDR-WDX/EDMC-Massacres/blob/master/classes/massacre_settings.py
 """
+from __future__ import annotations
 import os.path
-import tkinter as tk
-import myNotebook as nb
+import pathlib
+from typing import Callable
 
-from config import Callable, config
-from ttkHyperlinkLabel import HyperlinkLabel
+try:
+    import tkinter as tk
+    import myNotebook as nb
+    from config import config
+    from ttkHyperlinkLabel import HyperlinkLabel
+except ImportError:
+    # Not running inside EDMC (e.g. cli.py). Settings are only kept in memory then.
+    from classes.headless_config import config
+
+DEFAULT_SERVER_URL = "http://api.gankers.org"
 
 
 class Configuration:
@@ -22,6 +31,25 @@ class Configuration:
     def send_location(self, val: bool):
         config.set(f"{self.plugin_name}.send_location", val)
 
+    @property
+    def offline_mode(self):
+        """
+        In Offline Mode Events are only saved to the Spool and uploaded later
+        """
+        return config.get_bool(f"{self.plugin_name}.offline_mode", default=False)
+
+    @offline_mode.setter
+    def offline_mode(self, val: bool):
+        config.set(f"{self.plugin_name}.offline_mode", val)
+
+    @property
+    def show_killboard_stats(self):
+        return config.get_bool(f"{self.plugin_name}.show_killboard_stats", default=True)
+
+    @show_killboard_stats.setter
+    def show_killboard_stats(self, val: bool):
+        config.set(f"{self.plugin_name}.show_killboard_stats", val)
+
     @property
     def check_updates(self):
         return config.get_bool(f"{self.plugin_name}.check_updates", default=True)
@@ -30,6 +58,28 @@ class Configuration:
     def check_updates(self, value: bool):
         config.set(f"{self.plugin_name}.check_updates", value)
 
+    @property
+    def version_check_interval_hours(self) -> int:
+        """
+        How long the last Version Check is trusted before GitHub is asked again
+        """
+        return config.get_int(f"{self.plugin_name}.version_check_interval_hours", default=24)
+
+    @version_check_interval_hours.setter
+    def version_check_interval_hours(self, val: int):
+        config.set(f"{self.plugin_name}.version_check_interval_hours", val)
+
+    @property
+    def log_full_payloads(self) -> bool:
+        """
+        Log every Request Body in full at DEBUG. Off by default, as historic Uploads produce a lot of them.
+        """
+        return config.get_bool(f"{self.plugin_name}.log_full_payloads", default=False)
+
+    @log_full_payloads.setter
+    def log_full_payloads(self, val: bool):
+        config.set(f"{self.plugin_name}.log_full_payloads", val)
+
     @property
     def allowed_cmdrs(self):
         as_str = config.get_str(f"{self.plugin_name}.allowed_cmdrs", default="")
@@ -45,6 +95,135 @@ class Configuration:
     def has_commander_filter_enabled(self):
         return len(self.allowed_cmdrs) > 0
 
+    @property
+    def server_url(self) -> str:
+        url = config.get_str(f"{self.plugin_name}.server_url", default=DEFAULT_SERVER_URL)
+        if url is None or len(url.strip()) == 0:
+            return DEFAULT_SERVER_URL
+        return url.strip().rstrip("/")
+
+    @server_url.setter
+    def server_url(self, val: str):
+        config.set(f"{self.plugin_name}.server_url", val)
+
+    @property
+    def compact_bulk_format(self) -> bool:
+        """
+        Use the compact Bulk Format for Uploads if the Server supports it
+        """
+        return config.get_bool(f"{self.plugin_name}.compact_bulk_format", default=True)
+
+    @compact_bulk_format.setter
+    def compact_bulk_format(self, val: bool):
+        config.set(f"{self.plugin_name}.compact_bulk_format", val)
+
+    @property
+    def rate_limit_per_minute(self) -> int:
+        """
+        How many Requests per Minute are sent to the Server at most. Adjusts itself if the Server tells its Limit.
+        """
+        return config.get_int(f"{self.plugin_name}.rate_limit_per_minute", default=60)
+
+    @rate_limit_per_minute.setter
+    def rate_limit_per_minute(self, val: int):
+        config.set(f"{self.plugin_name}.rate_limit_per_minute", val)
+
+    @property
+    def rate_limit_burst(self) -> int:
+        """
+        How many Requests can be sent right after each other before the Rate Limit kicks in
+        """
+        return config.get_int(f"{self.plugin_name}.rate_limit_burst", default=10)
+
+    @rate_limit_burst.setter
+    def rate_limit_burst(self, val: int):
+        config.set(f"{self.plugin_name}.rate_limit_burst", val)
+
+    @property
+    def api_key_cache_hours(self) -> int:
+        """
+        How long a successful API Key Check is trusted on Startup before the Key has to be checked first again
+        """
+        return config.get_int(f"{self.plugin_name}.api_key_cache_hours", default=24)
+
+    @api_key_cache_hours.setter
+    def api_key_cache_hours(self, val: int):
+        config.set(f"{self.plugin_name}.api_key_cache_hours", val)
+
+    @property
+    def bulk_chunk_min_events(self) -> int:
+        """
+        Bulk Uploads adjust their Chunk Size to the Server. It always stays between min and max Events.
+        """
+        return config.get_int(f"{self.plugin_name}.bulk_chunk_min_events", default=10)
+
+    @bulk_chunk_min_events.setter
+    def bulk_chunk_min_events(self, val: int):
+        config.set(f"{self.plugin_name}.bulk_chunk_min_events", val)
+
+    @property
+    def bulk_chunk_max_events(self) -> int:
+        return config.get_int(f"{self.plugin_name}.bulk_chunk_max_events", default=1000)
+
+    @bulk_chunk_max_events.setter
+    def bulk_chunk_max_events(self, val: int):
+        config.set(f"{self.plugin_name}.bulk_chunk_max_events", val)
+
+    @property
+    def bulk_chunk_target_bytes(self) -> int:
+        """
+        A Bulk Chunk is kept below this many Bytes
+        """
+        return config.get_int(f"{self.plugin_name}.bulk_chunk_target_bytes", default=256_000)
+
+    @bulk_chunk_target_bytes.setter
+    def bulk_chunk_target_bytes(self, val: int):
+        config.set(f"{self.plugin_name}.bulk_chunk_target_bytes", val)
+
+    @property
+    def backfill_cpu_percent(self) -> int:
+        """
+        While the Game is running, the historic Aggregation only works this Share of the Time
+        """
+        return config.get_int(f"{self.plugin_name}.backfill_cpu_percent", default=50)
+
+    @backfill_cpu_percent.setter
+    def backfill_cpu_percent(self, val: int):
+        config.set(f"{self.plugin_name}.backfill_cpu_percent", val)
+
+    @property
+    def backfill_max_mb_per_second(self) -> int:
+        """
+        While the Game is running, the historic Aggregation reads at most this much from Disk
+        """
+        return config.get_int(f"{self.plugin_name}.backfill_max_mb_per_second", default=10)
+
+    @backfill_max_mb_per_second.setter
+    def backfill_max_mb_per_second(self, val: int):
+        config.set(f"{self.plugin_name}.backfill_max_mb_per_second", val)
+
+    @property
+    def backfill_only_while_idle(self) -> bool:
+        """
+        If set, the historic Aggregation waits entirely while the Game is running
+        """
+        return config.get_bool(f"{self.plugin_name}.backfill_only_while_idle", default=False)
+
+    @backfill_only_while_idle.setter
+    def backfill_only_while_idle(self, val: bool):
+        config.set(f"{self.plugin_name}.backfill_only_while_idle", val)
+
+    @property
+    def coordinate_instances(self) -> bool:
+        """
+        If set, several EDMC Instances with the same API Key let one of them send for all (see instance_coordination.py)
+        """
+        return config.get_bool(f"{self.plugin_name}.coordinate_instances", default=True)
+
+    @coordinate_instances.setter
+    def coordinate_instances(self, val: bool):
+        config.set(f"{self.plugin_name}.coordinate_instances", val)
+
     @property
     def journal_dir(self):
         response = config.get_str("journaldir")
@@ -52,6 +231,17 @@ class Configuration:
             response = config.default_journal_dir
         return response
 
+    @property
+    def data_dir(self) -> pathlib.Path:
+        """
+        Directory where this plugin keeps its own Files between Runs (e.g. the Journal Catalog)
+        """
+        app_dir = getattr(config, "app_dir_path", None) or config.app_dir
+        # self.plugin_name is the Name of the classes-Package, which is not very telling on its own
+        path = pathlib.Path(app_dir) / "EDMC-PvPBot"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
     @property
     def api_key(self):
         key = str.strip(config.get_str(f"{self.plugin_name}.api_key", default=""))
@@ -82,14 +272,24 @@ class Configuration:
             self.send_location = data["send_location"].get()
         if "check_updates" in keys:
             self.check_updates = data["check_updates"].get()
+        if "show_killboard_stats" in keys:
+            self.show_killboard_stats = data["show_killboard_stats"].get()
+        if "offline_mode" in keys:
+            self.offline_mode = data["offline_mode"].get()
         if "allowed_cmdrs" in keys:
             as_str = data["allowed_cmdrs"].get()
             new_list = [f.strip() for f in as_str.split(",") if len(f.strip()) > 0]
             self.allowed_cmdrs = new_list
         if "api_key" in keys:
-            self.api_key = data["api_key"].get()
+            new_api_key = str.strip(data["api_key"].get())
+            if new_api_key != (self.api_key or ""):
+                from classes.auth_cache import get_auth_cache
+                get_auth_cache().invalidate()
+            self.api_key = new_api_key
         if "historic.run_on_next_startup" in keys:
             self.run_historic_aggregation_on_next_startup = data["historic.run_on_next_startup"].get()
+        if "backfill_only_while_idle" in keys:
+            self.backfill_only_while_idle = data["backfill_only_while_idle"].get()
 
 
 # Quasi Singleton Pattern-ish
@@ -117,16 +317,22 @@ def build_settings_ui(root: nb.Notebook) -> tk.Frame:
     __settings_changes.clear()
     __settings_changes["check_updates"] = tk.BooleanVar(value=configuration.check_updates)
     __settings_changes["send_location"] = tk.BooleanVar(value=configuration.send_location)
+    __settings_changes["offline_mode"] = tk.BooleanVar(value=configuration.offline_mode)
+    __settings_changes["show_killboard_stats"] = tk.BooleanVar(value=configuration.show_killboard_stats)
     __settings_changes["allowed_cmdrs"] = tk.StringVar(value=",".join(configuration.allowed_cmdrs))
     __settings_changes["api_key"] = tk.StringVar(value=configuration.api_key)
     __settings_changes["historic.run_on_next_startup"] = \
         tk.BooleanVar(value=configuration.run_historic_aggregation_on_next_startup)
+    __settings_changes["backfill_only_while_idle"] = tk.BooleanVar(value=configuration.backfill_only_while_idle)
 
     nb.Label(frame, text="PVP Bot Settings", pady=10, padx=title_offset).grid(sticky=tk.W)
     nb.Checkbutton(frame, text="Look for Updates on Startup", variable=__settings_changes["check_updates"])\
         .grid(columnspan=2, padx=input_offset, sticky=tk.W)
     nb.Checkbutton(frame, text="Add Location of Kills to Event", variable=__settings_changes["send_location"])\
         .grid(columnspan=2, padx=input_offset, sticky=tk.W)
+    nb.Checkbutton(frame, text="Show Kill Statistics from the local Killboard",
+                   variable=__settings_changes["show_killboard_stats"])\
+        .grid(columnspan=2, padx=input_offset, sticky=tk.W)
     nb.Label(frame, justify=tk.LEFT, text="Allowed CMDRs:").grid(column=0, padx=input_offset, sticky=tk.W)
     allowed_cmdrs_edit_text = nb.Entry(frame, textvariable=__settings_changes["allowed_cmdrs"])
     allowed_cmdrs_edit_text.grid(columnspan=2, padx=input_offset, sticky=tk.EW)
@@ -141,6 +347,22 @@ def build_settings_ui(root: nb.Notebook) -> tk.Frame:
     api_key_edit_text.grid(columnspan=2, padx=input_offset, sticky=tk.EW)
 
 
+    nb.Label(frame, justify=tk.LEFT, text="Offline Mode:").grid(column=0, padx=input_offset, sticky=tk.W)
+    nb.Checkbutton(frame, text="Do not send Events, save them for later",
+                   variable=__settings_changes["offline_mode"])\
+        .grid(columnspan=2, padx=input_offset, sticky=tk.W)
+    nb.Label(frame, justify=tk.LEFT, text="If you are on a bad Connection, Events can be saved on your PC instead.\n"
+                                          "They are uploaded in one go when you turn Offline Mode off and restart,\n"
+                                          "or when you press the Button below. Events that could not be sent\n"
+                                          "because the Server was not reachable are saved the same way.") \
+        .grid(columnspan=2, padx=input_offset, sticky=tk.W, pady=0)
+
+    def flush_spool():
+        from classes.event_handling import flush_spool_in_background
+        flush_spool_in_background()
+    nb.Button(frame, text="Upload saved Events now", command=flush_spool)\
+        .grid(columnspan=2, padx=input_offset, sticky=tk.W)
+
     nb.Label(frame, justify=tk.LEFT, text="Historic Data:").grid(column=0, padx=input_offset, sticky=tk.W)
     nb.Checkbutton(frame, text="Aggregate Historic Data on next Startup",
                    variable=__settings_changes["historic.run_on_next_startup"])\
@@ -150,8 +372,30 @@ def build_settings_ui(root: nb.Notebook) -> tk.Frame:
                                           "search for PVP and Died Events. Make sure the API Key is set. This\n"
                                           "feature respects your 'Allowed CMDRs'-Filter.") \
         .grid(columnspan=2, padx=input_offset, sticky=tk.W, pady=0)
+    nb.Checkbutton(frame, text="Only read historic Data while I am not playing",
+                   variable=__settings_changes["backfill_only_while_idle"])\
+        .grid(columnspan=2, padx=input_offset, sticky=tk.W)
+
+    from classes.lifecycle import lifecycle
+    nb.Label(frame, text=f"The Plugin currently uses {len(lifecycle.thread_names())} Threads.", pady=10)\
+        .grid(columnspan=2, padx=input_offset, sticky=tk.W)
 
-    nb.Label(frame, text="", pady=10).grid()
+    from classes.latency_trace import get_latency_tracer
+    nb.Label(frame, justify=tk.LEFT, text=get_latency_tracer().summary())\
+        .grid(columnspan=2, padx=input_offset, sticky=tk.W)
+    export_status = tk.StringVar(value="")
+
+    def export_latency_traces():
+        path = configuration.data_dir / "latency_traces.ndjson"
+        try:
+            count = get_latency_tracer().export_ndjson(path)
+            export_status.set(f"Saved {count} Traces to {path}")
+        except OSError as e:
+            export_status.set(f"Could not save the Traces: {e}")
+    nb.Button(frame, text="Export Latency Traces", command=export_latency_traces)\
+        .grid(columnspan=2, padx=input_offset, sticky=tk.W)
+    nb.Label(frame, justify=tk.LEFT, textvariable=export_status)\
+        .grid(columnspan=2, padx=input_offset, sticky=tk.W)
     nb.Label(frame, text="Made by WDX").grid(sticky=tk.W, padx=input_offset)
     HyperlinkLabel(frame, text="View the Code on Github", background=nb.Label().cget("background"),
                    url=download_url, underline=True).grid(columnspan=2, sticky=tk.W, padx=input_offset)
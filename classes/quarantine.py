@@ -0,0 +1,41 @@
+"""
+Events the Server rejected on their own (see event_handling.upload_bulk) are moved here instead of stopping the
+whole Upload. Every Line of the Quarantine File is one JSON Object with the Event and the Reason the Server gave,
+so they can be looked at (and fixed and uploaded again) later.
+"""
+import json
+import pathlib
+import threading
+import time
+from typing import Optional
+
+from classes.logger_factory import logger
+
+
+class Quarantine:
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.__mutex = threading.Lock()
+
+    def add(self, event: dict, status_code: int, reason: str):
+        entry = {"quarantined_at": int(time.time()), "status": status_code, "reason": reason, "event": event}
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self.__mutex:
+            with self.path.open("a", encoding="utf8") as file:
+                file.write(line)
+        logger.warning("Event from %s was rejected by the Server and quarantined: %s", event.get("timestamp"),
+                       reason)
+
+
+_quarantine: Optional[Quarantine] = None
+_quarantine_mutex = threading.Lock()
+
+
+def get_quarantine() -> Quarantine:
+    global _quarantine
+    with _quarantine_mutex:
+        if _quarantine is None:
+            from classes.plugin_settings import configuration
+            _quarantine = Quarantine(configuration.data_dir / "quarantine.ndjson")
+        return _quarantine
@@ -0,0 +1,176 @@
+"""
+A client-side Token Bucket in front of all Requests to the Backend.
+Instead of sending as fast as possible and then being blocked by the Server with a 429, Requests are paced to stay
+just below the Server's Limit. If the Server tells us its Limit (X-RateLimit-* Headers) or when to come back
+(Retry-After), the Bucket adjusts itself to that.
+"""
+import email.utils
+import threading
+import time
+from typing import Mapping, Optional
+
+from classes.logger_factory import logger
+
+_SAFETY_FACTOR = 0.9
+"""
+Use only this fraction of what the Server allows, so small Clock Differences do not end in a 429
+"""
+
+_LIMIT_WINDOW_SECONDS = 60.0
+"""
+X-RateLimit-Limit is understood as Requests per Minute
+"""
+
+_DEFAULT_PENALTY_SECONDS = 60.0
+"""
+How long to wait after a 429 if the Server did not send a Retry-After Header
+"""
+
+_RECOVERY_STEPS = 10
+"""
+After a 429 slowed the Bucket down, every successful Response gives back this fraction of the Rate it is aiming for,
+so the Bucket is back at full Speed after this many Requests went through
+"""
+
+
+def _parse_retry_after(value: str) -> Optional[float]:
+    """
+    Retry-After is either a number of seconds, or an HTTP Date
+    """
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
+
+
+def _parse_reset(value: str) -> Optional[float]:
+    """
+    X-RateLimit-Reset is either the seconds until the Window resets, or a Unix Timestamp
+    """
+    try:
+        reset = float(value)
+    except ValueError:
+        return None
+    if reset > 1_000_000_000:
+        reset -= time.time()
+    return max(reset, 0.0)
+
+
+class TokenBucket:
+
+    def __init__(self, requests_per_minute: float, burst: int):
+        self.__rate = max(requests_per_minute, 1.0) / 60.0
+        # What the Bucket goes back to after a 429 slowed it down: the configured Rate, or what the Server allows
+        self.__target_rate = self.__rate
+        self.__burst = max(burst, 1)
+        self.__tokens = float(self.__burst)
+        self.__last_refill = time.monotonic()
+        self.__paused_until = 0.0
+        self.__mutex = threading.Lock()
+
+    @property
+    def requests_per_minute(self) -> float:
+        return self.__rate * 60.0
+
+    def __refill(self, now: float):
+        elapsed = now - self.__last_refill
+        self.__tokens = min(self.__burst, self.__tokens + elapsed * self.__rate)
+        self.__last_refill = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until a Request may be sent. Returns False if that would take longer than timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.__mutex:
+                now = time.monotonic()
+                self.__refill(now)
+                if now >= self.__paused_until and self.__tokens >= 1.0:
+                    self.__tokens -= 1.0
+                    return True
+                wait_for_token = (1.0 - self.__tokens) / self.__rate if self.__tokens < 1.0 else 0.0
+                wait = max(self.__paused_until - now, wait_for_token, 0.001)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """
+        No Requests will be allowed for the given Time.
+        """
+        with self.__mutex:
+            self.__paused_until = max(self.__paused_until, time.monotonic() + seconds)
+            self.__tokens = 0.0
+
+    def update_from_response(self, status_code: int, headers: Mapping[str, str]) -> float:
+        """
+        Adjusts the Bucket to what the Server told us.
+        Returns how many seconds nothing will be sent because of this Response (0 if there is no Pause).
+        """
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        retry_after = headers.get("Retry-After")
+
+        reset_seconds = _parse_reset(reset) if reset is not None else None
+        pause_seconds = 0.0
+
+        with self.__mutex:
+            if limit is not None:
+                try:
+                    new_rate = max(float(limit) * _SAFETY_FACTOR / _LIMIT_WINDOW_SECONDS, 1.0 / 60.0)
+                    if abs(new_rate - self.__rate) > 1e-6:
+                        logger.info(f"Server allows {limit} Requests. Pacing to {new_rate * 60.0:.1f} Requests/min")
+                    self.__rate = new_rate
+                    self.__target_rate = new_rate
+                except ValueError:
+                    pass
+            if remaining is not None:
+                try:
+                    self.__tokens = min(self.__tokens, float(remaining))
+                except ValueError:
+                    pass
+                if remaining.strip() == "0" and reset_seconds is not None:
+                    pause_seconds = reset_seconds
+
+        if retry_after is not None:
+            parsed = _parse_retry_after(retry_after)
+            if parsed is not None:
+                pause_seconds = max(pause_seconds, parsed)
+
+        if status_code == 429:
+            if pause_seconds <= 0:
+                pause_seconds = _DEFAULT_PENALTY_SECONDS
+            if limit is None:
+                # The Server does not tell us its Limit. Slow down until we do not hit it anymore.
+                with self.__mutex:
+                    self.__rate = max(self.__rate * 0.5, 1.0 / 60.0)
+                logger.info(f"Got a 429. Pacing to {self.requests_per_minute:.1f} Requests/min")
+        elif status_code < 400 and limit is None:
+            self.__recover()
+
+        if pause_seconds > 0:
+            self.pause(pause_seconds)
+        return pause_seconds
+
+    def __recover(self):
+        """
+        Steps back up towards the Target Rate. Halving on a 429 and adding a bit on every Success finds the Limit of a
+        Server that does not tell us about it, instead of staying at the slowest Rate ever needed.
+        """
+        with self.__mutex:
+            if self.__rate >= self.__target_rate:
+                return
+            self.__rate = min(self.__rate + self.__target_rate / _RECOVERY_STEPS, self.__target_rate)
+            if self.__rate >= self.__target_rate:
+                logger.info(f"No 429 anymore. Back at {self.requests_per_minute:.1f} Requests/min")
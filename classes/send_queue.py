@@ -0,0 +1,100 @@
+"""
+The Queue in front of the HTTP Thread. All Messages to the Backend go through here, so the different kinds of
+Messages can be prioritized against each other: an API Key Check goes before a live Kill, and a live Kill always
+goes before the Chunks of a historic Upload. Background Checks go last.
+
+Every Priority has its own Capacity. If it is reached, put() blocks (or fails when not blocking) until the
+HTTP Thread has caught up. This way the Queue cannot grow without limit while the Server is down.
+"""
+import threading
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class SendPriority(IntEnum):
+    """
+    Lower Values are sent first
+    """
+    AUTH_CHECK = 0
+    LIVE_EVENT = 1
+    HISTORIC_BULK = 2
+    BACKGROUND = 3
+
+
+DEFAULT_CAPACITIES = {
+    SendPriority.AUTH_CHECK: 8,
+    SendPriority.LIVE_EVENT: 1000,
+    SendPriority.HISTORIC_BULK: 4,
+    SendPriority.BACKGROUND: 8,
+}
+
+
+class SendQueue(Generic[T]):
+
+    def __init__(self, capacities: Optional[dict[SendPriority, int]] = None):
+        self.__capacities = dict(DEFAULT_CAPACITIES)
+        if capacities is not None:
+            self.__capacities.update(capacities)
+        self.__queues: dict[SendPriority, deque[T]] = {priority: deque() for priority in SendPriority}
+        self.__mutex = threading.Lock()
+        self.__not_empty = threading.Condition(self.__mutex)
+        self.__not_full = threading.Condition(self.__mutex)
+
+    def put(self, item: T, priority: SendPriority, block: bool = True, timeout: Optional[float] = None) -> bool:
+        """
+        Adds the Item to the end of its Priority Class.
+        Returns False if the Item could not be queued because the Priority Class is full.
+        """
+        queue = self.__queues[priority]
+        capacity = self.__capacities[priority]
+        with self.__not_full:
+            if len(queue) >= capacity:
+                if not block:
+                    return False
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while len(queue) >= capacity:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self.__not_full.wait(remaining)
+            queue.append(item)
+            self.__not_empty.notify()
+            return True
+
+    def put_front(self, item: T, priority: SendPriority):
+        """
+        Puts the Item back to the front of its Priority Class, e.g. to retry it. This ignores the Capacity,
+        as the Item was already accounted for when it was first queued.
+        """
+        with self.__mutex:
+            self.__queues[priority].appendleft(item)
+            self.__not_empty.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[T]:
+        """
+        Blocks until there is an Item and returns the oldest Item of the most important Priority Class.
+        Returns None if the timeout ran out.
+        """
+        with self.__not_empty:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                for priority in SendPriority:
+                    queue = self.__queues[priority]
+                    if len(queue) > 0:
+                        item = queue.popleft()
+                        self.__not_full.notify_all()
+                        return item
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.__not_empty.wait(remaining)
+
+    def qsize(self, priority: Optional[SendPriority] = None) -> int:
+        with self.__mutex:
+            if priority is not None:
+                return len(self.__queues[priority])
+            return sum(map(len, self.__queues.values()))
@@ -0,0 +1,143 @@
+"""
+The Spool stores Events that could not be sent (or should not be sent yet, in Offline Mode) on Disk.
+Events are appended as compact JSON, one per Line, to Spool Files. Once a File is big enough a new one is started.
+Later, the Spool is flushed through the Bulk Endpoint in large Batches.
+
+Spool Files are self-contained, so they can be copied to another Machine and uploaded from there (see cli.py).
+
+Several EDMC Instances can share one Spool Directory. A File that is still written to ends with ".open" and is
+locked by its Writer, so nobody uploads (and deletes) it while Events are still added. It gets its final Name once
+it is closed. If the Writer crashed, the Lock is gone, and whoever flushes the Spool next closes the File instead.
+"""
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Iterator, Optional
+
+from classes.file_lock import try_lock
+from classes.logger_factory import logger
+
+_SPOOL_FILE_GLOB = "spool-*.ndjson"
+_OPEN_SUFFIX = ".open"
+_OPEN_FILE_GLOB = _SPOOL_FILE_GLOB + _OPEN_SUFFIX
+# A Writer creates its File before it locks it. A File this young is never taken as left behind.
+_ORPHAN_MIN_AGE_SECONDS = 60.0
+_MAX_FILE_BYTES = 1_000_000
+
+
+class Spool:
+
+    def __init__(self, directory: pathlib.Path, max_file_bytes: int = _MAX_FILE_BYTES):
+        self.directory = directory
+        self.__max_file_bytes = max_file_bytes
+        self.__current_file = None
+        self.__current_path: Optional[pathlib.Path] = None
+        self.__files_created = 0
+        self.__mutex = threading.Lock()
+
+    def __new_path(self) -> pathlib.Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Sorting by Name sorts by Time, down to the Nanosecond. The Counter keeps Files of this Process in Order even
+        # if the Clock did not move in between.
+        now_ns = time.time_ns()
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.localtime(now_ns // 1_000_000_000))
+        self.__files_created += 1
+        name = f"spool-{stamp}.{now_ns % 1_000_000_000:09d}-{os.getpid()}-{self.__files_created:06d}.ndjson"
+        return self.directory / name
+
+    def __open_new_file(self):
+        self.__current_path = self.__new_path()
+        self.__current_file = _open_path(self.__current_path).open("a", encoding="utf8")
+        try_lock(self.__current_file)
+
+    def __close_current_file(self):
+        if self.__current_file is not None:
+            self.__current_file.close()
+            os.replace(_open_path(self.__current_path), self.__current_path)
+        self.__current_file = None
+        self.__current_path = None
+
+    def append(self, payload: dict):
+        """
+        Thread-safe. Writes one Event (in the Format the Server expects) to the Spool.
+        """
+        line = json.dumps(payload, separators=(",", ":")) + "\n"
+        with self.__mutex:
+            if self.__current_file is None:
+                self.__open_new_file()
+            self.__current_file.write(line)
+            self.__current_file.flush()
+            if self.__current_file.tell() >= self.__max_file_bytes:
+                self.__close_current_file()
+
+    def append_closed(self, payloads: list[dict]):
+        """
+        Writes the Events to a new File that is closed right away. The File only shows up under its Name once it is
+        complete, so another Process flushing this Spool never reads half of it.
+        """
+        lines = "".join(json.dumps(payload, separators=(",", ":")) + "\n" for payload in payloads)
+        with self.__mutex:
+            path = self.__new_path()
+            temp_file = path.with_suffix(".tmp")
+            with temp_file.open("w", encoding="utf8") as file:
+                file.write(lines)
+            os.replace(temp_file, path)
+
+    def rotate(self):
+        """
+        Closes the current Spool File so it can be flushed. New Events go into a new File.
+        """
+        with self.__mutex:
+            self.__close_current_file()
+
+    def __close_orphans(self):
+        """
+        Gives Files left open by a Process that ended without closing them their final Name
+        """
+        with self.__mutex:
+            current = None if self.__current_path is None else _open_path(self.__current_path)
+        for path in self.directory.glob(_OPEN_FILE_GLOB):
+            try:
+                if path == current or time.time() - path.stat().st_mtime < _ORPHAN_MIN_AGE_SECONDS:
+                    continue
+                with path.open("a", encoding="utf8") as file:
+                    if not try_lock(file):
+                        # Its Writer is still running
+                        continue
+                os.replace(path, path.with_suffix(""))
+                logger.info(f"Closed the Spool File {path.name}, which was left open")
+            except OSError:
+                # E.g. another Process closed it at the same Time
+                continue
+
+    def closed_files(self) -> list[pathlib.Path]:
+        """
+        All Spool Files that are not written to anymore, oldest first
+        """
+        if not self.directory.is_dir():
+            return []
+        self.__close_orphans()
+        return sorted(self.directory.glob(_SPOOL_FILE_GLOB))
+
+    def has_pending_events(self) -> bool:
+        self.rotate()
+        return len(self.closed_files()) > 0
+
+    @staticmethod
+    def read_file(path: pathlib.Path) -> Iterator[dict]:
+        with path.open("r", encoding="utf8") as file:
+            for line in file:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Most likely the last Line of a File that was being written when EDMC crashed
+                    logger.warning(f"Skipping broken Line in Spool File {path.name}")
+
+
+def _open_path(path: pathlib.Path) -> pathlib.Path:
+    return path.with_name(path.name + _OPEN_SUFFIX)
@@ -0,0 +1,93 @@
+"""
+The Transport actually talks to the Backend. It runs an asyncio Event Loop on one dedicated Thread and keeps
+several Requests in flight at once, each with its own Timeout, so a slow Request does not hold up the others.
+
+EDMC does not ship an asyncio HTTP Client, so the Requests themselves are made with requests on a small Pool of
+Threads owned by the Event Loop. Each of these Threads keeps its own Session to reuse Connections.
+Both the Event Loop Thread and the Pool are started through the Lifecycle and stopped with it.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import threading
+from typing import Any, Optional
+
+import requests
+
+from classes.lifecycle import THREAD_PREFIX, lifecycle
+from classes.logger_factory import logger
+
+DEFAULT_TIMEOUT_SECONDS = 30.0
+
+
+class AsyncTransport:
+
+    def __init__(self, max_in_flight: int = 4):
+        self.max_in_flight = max_in_flight
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.__stop_hook_registered = False
+        self.__executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self.__sessions = threading.local()
+        self.__mutex = threading.Lock()
+
+    def __ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self.__mutex:
+            if self.__loop is None:
+                loop = asyncio.new_event_loop()
+                self.__executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_in_flight, thread_name_prefix=f"{THREAD_PREFIX}http-worker")
+                loop.set_default_executor(self.__executor)
+                self.__thread = lifecycle.start_thread("http-event-loop", loop.run_forever)
+                self.__loop = loop
+                if not self.__stop_hook_registered:
+                    # Registered after the HTTP Thread's Hook, which still sends through the Transport
+                    lifecycle.on_stop("HTTP Transport", lambda deadline: self.stop())
+                    self.__stop_hook_registered = True
+            return self.__loop
+
+    def __session(self) -> requests.Session:
+        # Runs on one of the Worker Threads. Sessions are not shared between Threads.
+        session = getattr(self.__sessions, "session", None)
+        if session is None:
+            session = requests.Session()
+            self.__sessions.session = session
+        return session
+
+    def __blocking_request(self, method: str, url: str, body: Any, headers: dict, timeout: float):
+        if method == "post" and isinstance(body, bytes):
+            return self.__session().post(url, data=body, headers=headers, timeout=timeout)
+        if method == "post":
+            return self.__session().post(url, json=body, headers=headers, timeout=timeout)
+        if method == "get":
+            return self.__session().get(url, headers=headers, timeout=timeout)
+        raise ValueError(f"Unsupported HTTP Method {method}")
+
+    async def __request(self, method: str, url: str, body: Any, headers: dict, timeout: float):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.__blocking_request, method, url, body, headers, timeout)
+        # requests itself times out on connect and on each read. wait_for additionally bounds the total Time.
+        return await asyncio.wait_for(loop.run_in_executor(None, call), timeout * 2)
+
+    def submit(self, method: str, url: str, body: Any = None, headers: Optional[dict] = None,
+               timeout: float = DEFAULT_TIMEOUT_SECONDS) -> concurrent.futures.Future:
+        """
+        Thread-safe. Starts the Request and returns right away. The Future resolves to the requests.Response,
+        or to the Exception. Cancelling the Future cancels the Request, as far as that is possible.
+        """
+        loop = self.__ensure_started()
+        return asyncio.run_coroutine_threadsafe(self.__request(method, url, body, headers or {}, timeout), loop)
+
+    def stop(self):
+        with self.__mutex:
+            if self.__loop is None:
+                return
+            logger.info("Stopping HTTP Transport")
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__loop = None
+            self.__executor = None
+
+
+transport = AsyncTransport()
@@ -15,12 +15,17 @@ import threading
 import time
 
 from classes.logger_factory import logger
+from classes.lifecycle import ScheduledCall, lifecycle
+from classes.plugin_settings import configuration
 from classes.version_check import open_download_page
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 import tkinter as tk
 from theme import theme
 from typing import Callable
 
+if TYPE_CHECKING:
+    from classes.backfill_governor import BackfillGovernor
+
 
 class GenericUiMessageType(Enum):
     INFO = 1
@@ -65,41 +70,101 @@ def _display_outdated_version(frame: tk.Frame, row_counter: int) -> int:
     return row_counter+1
 
 
+def _build_killboard_stats() -> Optional[str]:
+    """
+    Kills and Deaths from the local Killboard for the CMDR of the most recent Event. Runs several Queries (and opens
+    the Database on first Use), so this is never called on the Main Thread.
+    """
+    from classes.killboard import get_killboard, start_of_month, start_of_today
+    killboard = get_killboard()
+    if killboard is None:
+        return None
+    commanders = configuration.allowed_cmdrs if configuration.has_commander_filter_enabled else None
+    latest = killboard.latest_event(commanders)
+    if latest is None:
+        return None
+    commander, opponent = latest
+    lines = [
+        f"CMDR {commander}",
+        f"Today: {killboard.stats(commander, start_of_today())}",
+        f"This Month: {killboard.stats(commander, start_of_month())}",
+        f"All Time: {killboard.stats(commander)}",
+        f"vs. {opponent}: {killboard.stats(commander, opponent=opponent)}",
+    ]
+    top_opponents = killboard.top_opponents(commander, start_of_month(), 3)
+    if len(top_opponents) > 0:
+        lines.append("Top this Month: " + ", ".join(f"{name} ({stats.kills}/{stats.deaths})"
+                                                    for name, stats in top_opponents))
+    return "\n".join(lines)
+
+
+class _KillboardStatsCache:
+    """
+    The UI only ever shows the last computed Stats. They are computed again on a Background Worker once the Killboard
+    changed (or a new Day started), and the UI is refreshed when they are ready.
+    """
+
+    def __init__(self, on_updated: Callable[[], None]):
+        self.__text: Optional[str] = None
+        self.__key: Optional[tuple] = None
+        self.__pending = False
+        self.__mutex = threading.Lock()
+        self.__on_updated = on_updated
+
+    def get(self) -> Optional[str]:
+        from classes.killboard import revision, start_of_today
+        key = (revision(), start_of_today(), tuple(configuration.allowed_cmdrs))
+        with self.__mutex:
+            if key != self.__key and not self.__pending:
+                self.__pending = True
+                lifecycle.submit(self.__compute, key)
+            return self.__text
+
+    def __compute(self, key: tuple):
+        try:
+            text = _build_killboard_stats()
+        except Exception as e:
+            logger.error(f"Could not read the local Killboard: {e}")
+            text = None
+        with self.__mutex:
+            self.__pending = False
+            changed = text != self.__text
+            self.__text = text
+            self.__key = key
+        if changed:
+            self.__on_updated()
+
+
+def _display_killboard_stats(frame: tk.Frame, row_counter: int, stats: _KillboardStatsCache) -> int:
+    text = stats.get()
+    if text is None:
+        return row_counter
+    tk.Label(frame, text=text, justify=tk.LEFT).grid(row=row_counter, sticky=tk.W)
+    return row_counter+1
+
+
 class _ResettableTimer:
     def __init__(self, callback: Callable):
-        self.__current_valid_thread = 0
         self.__callback = callback
-        self.__thread : Optional[threading.Thread] = None
+        self.__scheduled: Optional[ScheduledCall] = None
         self.__mutex = threading.Lock()
 
     def reset_timer(self):
         """
-        This "invalidates" the Thread as it does a check if its own ID is still the active one.
-        Is also used to stop the current thread without a re-emit - which is useful if you want for a message to stay indefinetely.
+        Cancels the pending Call, if there is one.
+        Is also used to stop the current timer without a re-emit - which is useful if you want for a message to stay indefinetely.
         """
-        self.__current_valid_thread += 1
+        with self.__mutex:
+            if self.__scheduled is not None:
+                self.__scheduled.cancel()
+                self.__scheduled = None
 
     def emit_after_millis(self, millis: int):
-        self.__mutex.acquire()
-        try:
-            self.reset_timer()
-
-            thread_id = self.__current_valid_thread
-
-            def thread_loop():
-                time.sleep(millis / 1000)
-                self.__mutex.acquire()
-                try:
-                    if thread_id == self.__current_valid_thread:
-                        if self.__callback is not None:
-                            self.__callback()
-                finally:
-                    self.__mutex.release()
-
-            self.__thread = threading.Thread(target=thread_loop, daemon=True, name=f"edmc-pvpbot-timer-{thread_id}")
-            self.__thread.start()
-        finally:
-            self.__mutex.release()
+        with self.__mutex:
+            if self.__scheduled is not None:
+                self.__scheduled.cancel()
+            # All Timers share the one Scheduler Thread of the Lifecycle, instead of a sleeping Thread each
+            self.__scheduled = lifecycle.call_later(millis / 1000, self.__callback)
 
 
 
@@ -113,6 +178,8 @@ class HistoryAggregatorUI:
         """
         This UI will go through these States
         IDLE -> FINDING LOGS -> READING LOGS -> SENDING TO SERVER -> FAILED | FINISHED -> IDLE
+        The Logs are read on while SENDING TO SERVER, Events are uploaded as they are found.
+        The User can cancel anywhere between FINDING LOGS and SENDING TO SERVER -> CANCELLED -> IDLE
         """
         IDLE = 0
         FINDING_LOGS = 1
@@ -120,6 +187,7 @@ class HistoryAggregatorUI:
         SENDING_TO_SERVER = 3
         FAILED = 4
         FINISHED = 5
+        CANCELLED = 6
 
 
     def __init__(self, refreshCallback: Callable) -> None:
@@ -130,7 +198,11 @@ class HistoryAggregatorUI:
         self.__status: HistoryAggregatorUI.__State = HistoryAggregatorUI.__State.IDLE
         self.__current_parsed: int = -1
         self.__total_logs: int = -1
+        self.__uploaded_events: int = 0
+        self.__total_events: int = 0
+        self.__quarantined_events: int = 0
         self.__refreshCallback = refreshCallback
+        self.__governor: Optional["BackfillGovernor"] = None
  
     def __build_progress_string(self) -> str:
         if self.__total_logs <= 0 or self.__current_parsed < 0:
@@ -144,22 +216,51 @@ class HistoryAggregatorUI:
         return f"{progressbar} ({self.__current_parsed}/{self.__total_logs})"
 
     ### The Methods below are in order of when they are invoked
+    def notify_governor(self, governor: "BackfillGovernor"):
+        """
+        The Governor of the running Job. Pause, Resume and Cancel go through it.
+        """
+        self.__governor = governor
+        governor.on_waiting_changed = self.__refreshCallback
+
     def notify_start(self):
+        self.__errored_logs = []
         self.__status = HistoryAggregatorUI.__State.FINDING_LOGS
         self.__refreshCallback()
 
     def notify_progress(self, current: int, total: int):
-        self.__status = HistoryAggregatorUI.__State.READING_LOGS
+        # Journals are still read while their Events are uploaded
+        if self.__status != HistoryAggregatorUI.__State.SENDING_TO_SERVER:
+            self.__status = HistoryAggregatorUI.__State.READING_LOGS
         self.__current_parsed = current
         self.__total_logs = total
         self.__refreshCallback()
 
-    def notify_failed_log_file(self, filename: str):
-        self.__errored_logs.append(filename)
+    def notify_failed_log_file(self, filename: str, broken_lines: Optional[int] = None):
+        """
+        Without broken_lines, the File could not be read at all
+        """
+        if broken_lines is None:
+            self.__errored_logs.append(f"{filename} (could not be read)")
+        else:
+            self.__errored_logs.append(f"{filename} ({broken_lines} broken Lines)")
 
 
     def notify_submitting(self):
         self.__status = HistoryAggregatorUI.__State.SENDING_TO_SERVER
+        self.__uploaded_events = 0
+        self.__total_events = 0
+        self.__quarantined_events = 0
+        self.__refreshCallback()
+
+    def notify_uploaded(self, uploaded: int, total: int, quarantined: int = 0):
+        """
+        uploaded only counts Events the Server accepted. The ones it rejected were quarantined.
+        """
+        self.__uploaded_events = uploaded
+        self.__total_events = total
+        self.__quarantined_events = quarantined
+        self.__refreshCallback()
 
 
     def notify_finished(self, was_succesful: bool):
@@ -176,6 +277,16 @@ class HistoryAggregatorUI:
         else:
             self.__status = HistoryAggregatorUI.__State.FAILED
             self.__refreshCallback()
+
+    def notify_cancelled(self):
+        """
+        Like notify_finished, this sleeps and blocks
+        """
+        self.__status = HistoryAggregatorUI.__State.CANCELLED
+        self.__refreshCallback()
+        time.sleep(5.0)
+        self.__status = HistoryAggregatorUI.__State.IDLE
+        self.__refreshCallback()
                     
     ###
 
@@ -199,7 +310,7 @@ class HistoryAggregatorUI:
                 self.__refreshCallback()
             tk.Button(frame, text="Close Error", fg="red", command=lambda : close_callback())\
                 .grid(column=0, columnspan=1, row=current_counter+1)
-            return current_counter+2
+            return self.__display_errored_logs(frame, current_counter+2)
         else:
             message: str = ""
             colour: str = "yellow"
@@ -208,14 +319,64 @@ class HistoryAggregatorUI:
             elif self.__status == HistoryAggregatorUI.__State.READING_LOGS:
                 message = self.__build_progress_string()
             elif self.__status == HistoryAggregatorUI.__State.SENDING_TO_SERVER:
-                message = "Uploading Logs to Server..."
+                message = "Uploading Logs to Server... if you have\nmany logs this can take longer."
+                if self.__total_events > 0:
+                    message += f" ({self.__uploaded_events}/{self.__total_events} Events found so far)"
+                progress = self.__build_progress_string()
+                if progress != "":
+                    message += "\n" + progress
+                if self.__quarantined_events > 0:
+                    message += f"\n{self.__quarantined_events} Events were rejected (see quarantine.ndjson)"
             elif self.__status == HistoryAggregatorUI.__State.FINISHED:
                 message = "Uploaded Logs to Server successfully."
                 colour = "green"
+            elif self.__status == HistoryAggregatorUI.__State.CANCELLED:
+                message = "Historic Data was cancelled."
             # TODO: Add Statements here
+            governor = self.__governor
+            is_active = self.__status in (HistoryAggregatorUI.__State.FINDING_LOGS,
+                                          HistoryAggregatorUI.__State.READING_LOGS,
+                                          HistoryAggregatorUI.__State.SENDING_TO_SERVER)
+            if is_active and governor is not None:
+                if governor.is_paused:
+                    message += "\nPaused."
+                elif governor.is_waiting_for_idle:
+                    message += "\nWaiting until you stop playing..."
             tk.Label(frame, text=message, fg=colour)\
                 .grid(column=0, columnspan=1, row=current_counter)
-            return current_counter+1
+            current_counter += 1
+            if is_active and governor is not None:
+                current_counter = self.__display_controls(frame, current_counter, governor)
+            return self.__display_errored_logs(frame, current_counter)
+
+    def __display_errored_logs(self, frame: tk.Frame, current_counter: int) -> int:
+        max_shown = 5
+        errored_logs = list(self.__errored_logs)
+        if len(errored_logs) == 0:
+            return current_counter
+        message = f"{len(errored_logs)} Journal Files had Problems (see the EDMC Logs):\n"
+        message += "\n".join(errored_logs[:max_shown])
+        if len(errored_logs) > max_shown:
+            message += f"\n...and {len(errored_logs) - max_shown} more"
+        tk.Label(frame, text=message, fg="orange", justify=tk.LEFT)\
+            .grid(column=0, columnspan=1, row=current_counter)
+        return current_counter+1
+
+    def __display_controls(self, frame: tk.Frame, current_counter: int, governor: "BackfillGovernor") -> int:
+        sub_frame = tk.Frame(frame)
+        sub_frame.grid(row=current_counter, sticky=tk.W)
+
+        def toggle_pause():
+            if governor.is_paused:
+                governor.resume()
+            else:
+                governor.pause()
+            self.__refreshCallback()
+
+        tk.Button(sub_frame, text="Resume" if governor.is_paused else "Pause", command=toggle_pause)\
+            .grid(row=0, column=0)
+        tk.Button(sub_frame, text="Cancel", command=governor.cancel).grid(row=0, column=1)
+        return current_counter+1
 
         
       
@@ -236,6 +397,7 @@ class UI:
         self.__current_message: Optional[GenericUiMessage] = None
         self.__timer = _ResettableTimer(lambda: self.notify_about_new_message(None, True))
         self.__historic_data_ui: Optional[HistoryAggregatorUI] = None
+        self.__killboard_stats = _KillboardStatsCache(self.__refresh)
 
     def update_ui(self):
         """
@@ -253,6 +415,8 @@ class UI:
         historic_ui = self.get_historic_ui()
         if historic_ui is not None:
             row_pointer = historic_ui.update_ui(self.__frame, 0)
+        if configuration.show_killboard_stats:
+            row_pointer = _display_killboard_stats(self.__frame, row_pointer, self.__killboard_stats)
         if self.__display_outdated_version:
             row_pointer = _display_outdated_version(self.__frame, row_pointer)
         if self.__current_message is not None:
@@ -301,6 +465,11 @@ class UI:
         if self.__frame is not None and refresh_ui:
             self.__frame.event_generate("<<Refresh>>")
 
+    # is thread-safe
+    def __refresh(self):
+        if self.__frame is not None:
+            self.__frame.event_generate("<<Refresh>>")
+
     # is thread-safe
     def notify_version_outdated(self):
         self.__display_outdated_version = True
@@ -3,12 +3,12 @@ This Module contains logic to check for new Updates in a separate Thread
 Most of the code here was taken from the EDMC-Massacre plugin.
 You can find the original here: https://github.com/CMDR-WDX/EDMC-Massacres/blob/master/classes/version_check.py
 """
+import json
 import os
 import subprocess
 import sys
-import threading
+import time
 
-from requests import get
 from classes.logger_factory import logger
 from pathlib import Path
 from typing import Callable, Optional
@@ -17,67 +17,158 @@ _version_url = "https://raw.githubusercontent.com/CMDR-WDX/EDMC-PvPBot/master/ve
 download_url = "https://github.com/CMDR-WDX/EDMC-PvPBot/releases"
 
 
-def __is_current_version_outdated(current_version: str, callback: Callable[[bool], None]) -> None:
+_VERSION_CACHE_FILE = "version_cache.json"
+_CONNECT_TIMEOUT_SECONDS = 5
+_HARD_TIMEOUT_SECONDS = 15
+"""
+The whole Check (connect, wait for the Response and read it) never takes longer than this
+"""
+_MAX_VERSION_BYTES = 1024
+
+
+def _load_version_cache(cache_file: Path) -> dict:
+    try:
+        with cache_file.open("r", encoding="utf8") as file:
+            cache = json.load(file)
+        if isinstance(cache, dict):
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _save_version_cache(cache_file: Path, cache: dict):
+    try:
+        temp_file = cache_file.with_suffix(".tmp")
+        with temp_file.open("w", encoding="utf8") as file:
+            json.dump(cache, file)
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        logger.warning(f"Could not save the Version Cache: {e}")
+
+
+def __fetch_remote_version(cache: dict) -> Optional[str]:
     """
-    **RUN THIS IN A THREAD!**
+    Asks GitHub for the newest Version. If the cached ETag still matches, GitHub replies with a 304 and the cached
+    Version is used. Updates the cache-dict in place. Returns None if the Version could not be fetched.
+    """
+    # Imported here so loading the Plugin does not have to wait for requests
+    from requests import get
+    headers = {}
+    if cache.get("etag") and cache.get("version"):
+        headers["If-None-Match"] = cache["etag"]
+
+    deadline = time.monotonic() + _HARD_TIMEOUT_SECONDS
+    with get(_version_url, headers=headers, stream=True,
+             timeout=(_CONNECT_TIMEOUT_SECONDS, _HARD_TIMEOUT_SECONDS)) as response:
+        if response.status_code == 304:
+            logger.info("Remote Version did not change since the last Check")
+            cache["checked_at"] = time.time()
+            return cache["version"]
+        if response.status_code != 200:
+            logger.error(f"Failed to get Version from Remote. Status {response.status_code}")
+            return None
+        content = b""
+        for chunk in response.iter_content(256):
+            content += chunk
+            if time.monotonic() > deadline or len(content) > _MAX_VERSION_BYTES:
+                logger.error("Version from Remote took too long or is too big. Ignoring...")
+                return None
+
+    version = content.decode("utf8").strip()
+    cache.update({"version": version, "etag": response.headers.get("ETag"), "checked_at": time.time()})
+    return version
+
+
+def _get_remote_version() -> Optional[str]:
+    """
+    Returns the newest Version. It is only fetched from Remote if the cached one is older than the configured
+    Interval, so most Startups do not make a Request at all.
+    """
+    from classes.plugin_settings import configuration
+    cache_file = configuration.data_dir / _VERSION_CACHE_FILE
+    cache = _load_version_cache(cache_file)
+    age = time.time() - cache.get("checked_at", 0)
+    if cache.get("version") and 0 <= age < configuration.version_check_interval_hours * 3600:
+        logger.info("Using cached Remote Version")
+        return cache["version"]
 
-    Gets the String located at _version_url and compares to the local string.
-    If the Version URL is invalid, or some other Error occurs, false is returned.
+    try:
+        version = __fetch_remote_version(cache)
+    except IOError:
+        logger.error("Failed to get Version from Remote. Ignoring...")
+        version = None
+    if version is None:
+        return cache.get("version")
+    _save_version_cache(cache_file, cache)
+    return version
 
+
+def _is_outdated(current_version: str, remote_version: str) -> bool:
+    """
     A Version looks like this: 1.0.3
 
     If there is a length-mismatch, the shorter string gets filled with 0s
     """
+    current_version_split = list(map(lambda x: int(x), current_version.split(".")))
+    response_version_split = list(map(lambda x: int(x), remote_version.split(".")))
+
+    longer_len = max([len(current_version_split), len(response_version_split)])
+
+    current_delta = longer_len - len(current_version_split)
+    response_delta = longer_len - len(response_version_split)
+    """
+    Example:
+    current:  1.0.0.1
+    response: 0.1.0.1
+    -----------------
+              ^- current > response -> current is more recent
+
+    Example2:
+    current:  1.0.1
+    response: 1.0.1
+    ---------------
+              ^-equal, go to next
+                ^- equal, go to next
+                  ^- equal, go to next
+                    | - is equal
+
+    Example3
+    current:  1.0.0
+    response: 1.0.2
+              ^- equal, go next
+                ^- equal, go next
+                  ^- response > current -> current is outdated.
+    """
+    while current_delta > 0:
+        current_version_split.append(0)
+        current_delta -= 1
+    while response_delta > 0:
+        response_version_split.append(0)
+        response_delta -= 1
+
+    for i in range(longer_len):
+        if response_version_split[i] > current_version_split[i]:
+            return True
+        if response_version_split[i] < current_version_split[i]:
+            return False
+    return False
+
+
+def __is_current_version_outdated(current_version: str, callback: Callable[[bool], None]) -> None:
+    """
+    **RUN THIS IN A THREAD!**
+
+    Gets the newest Version (see _get_remote_version) and compares to the local string.
+    If the Version URL is invalid, or some other Error occurs, false is returned.
+    """
     is_outdated = False
     try:
-        response = get(_version_url)
-
-        current_version_split = list(map(lambda x: int(x), current_version.split(".")))
-        response_version_split = list(map(lambda x: int(x), response.text.split(".")))
-
-        longer_len = max([len(current_version_split), len(response_version_split)])
-
-        current_delta = longer_len - len(current_version_split)
-        response_delta = longer_len - len(response_version_split)
-        """
-        Example:
-        current:  1.0.0.1
-        response: 0.1.0.1
-        -----------------
-                  ^- current > response -> current is more recent
-
-        Example2:
-        current:  1.0.1
-        response: 1.0.1
-        ---------------
-                  ^-equal, go to next
-                    ^- equal, go to next
-                      ^- equal, go to next
-                        | - is equal
-
-        Example3
-        current:  1.0.0
-        response: 1.0.2
-                  ^- equal, go next
-                    ^- equal, go next
-                      ^- response > current -> current is outdated.
-        """
-        while current_delta > 0:
-            current_version_split.append(0)
-            current_delta -= 1
-        while response_delta > 0:
-            response_version_split.append(0)
-            response_delta -= 1
-
-        for i in range(longer_len):
-            if response_version_split[i] > current_version_split[i]:
-                is_outdated = True
-                break
-            if response_version_split[i] < current_version_split[i]:
-                break
-
-    except IOError:
-        logger.error("Failed to get Version from Remote. Ignoring...")
+        remote_version = _get_remote_version()
+        if remote_version is not None:
+            is_outdated = _is_outdated(current_version.strip(), remote_version)
+    except ValueError:
+        logger.error("Failed to parse the Version from Remote. Ignoring...")
 
     callback(is_outdated)
 
@@ -96,25 +187,14 @@ def get_current_version_string():
     return own_version
 
 
-def __worker(cb: Callable[[bool], None]):
+def check_version(cb: Callable[[bool], None]):
     """
-    Function invoked by the new Thread used to check if the Version is outdated.
+    Checks if the Version is outdated and calls cb with the Result. Blocking, run it in the Background.
     """
     current_version = get_current_version_string()
     __is_current_version_outdated(current_version, cb)
 
 
-def build_worker(cb: Callable[[bool], None]) -> threading.Thread:
-    """
-    Creates a new Thread used to check version. Does not start the thread.
-    """
-    thread = threading.Thread(target=__worker, args=[cb])
-    thread.name = "Massacre Version Check"
-    thread.daemon = True
-
-    return thread
-
-
 def open_download_page():
     """
     Opens link to the Download URL in Browser
@@ -0,0 +1,270 @@
+"""
+Headless Entry Point for the PvpBot Plugin. This runs without EDMC and is meant for people who want to
+bulk-load Journal Archives from the command line, e.g. Squadron Admins uploading for many members.
+
+Example:
+    python3 cli.py backfill --journal-dir ./journals --api-key KEY --cmdr WDX --since 2022-01-01
+
+It can also stand in for EDMC's live Path on a Machine the Journal Folder is synced to:
+    python3 cli.py follow --journal-dir ./journals --api-key KEY
+"""
+import argparse
+import datetime as dt
+import logging
+import pathlib
+import sys
+import time
+from typing import Optional
+
+EXIT_OK = 0
+EXIT_UPLOAD_FAILED = 1
+EXIT_BAD_ARGUMENTS = 2
+
+
+class _ConsoleProgress:
+    """
+    Stands in for the HistoryAggregatorUI and prints the Progress to the Terminal instead
+    """
+
+    def __init__(self):
+        self.success: Optional[bool] = None
+        self.__failed_files: list[str] = []
+        self.__start_time = time.monotonic()
+        self.__upload_start_time: Optional[float] = None
+
+    @staticmethod
+    def __print(message: str):
+        print(message, flush=True)
+
+    def notify_governor(self, _governor):
+        pass
+
+    def notify_start(self):
+        self.__start_time = time.monotonic()
+        self.__print("Finding Journal Files to read...")
+
+    def notify_progress(self, current: int, total: int):
+        elapsed = max(time.monotonic() - self.__start_time, 0.001)
+        self.__print(f"Read {current}/{total} Journal Files ({current / elapsed:.1f} Files/s)")
+
+    def notify_failed_log_file(self, filename: str, broken_lines: Optional[int] = None):
+        if broken_lines is None:
+            self.__failed_files.append(f"Could not read {filename}")
+        else:
+            self.__failed_files.append(f"{filename} has {broken_lines} broken Lines")
+
+    def notify_submitting(self):
+        self.__upload_start_time = time.monotonic()
+        self.__print("Uploading Events to Server...")
+
+    def notify_uploaded(self, uploaded: int, total: int, quarantined: int = 0):
+        elapsed = max(time.monotonic() - (self.__upload_start_time or self.__start_time), 0.001)
+        self.__print(_upload_progress(uploaded, total, quarantined) + f" ({uploaded / elapsed:.1f} Events/s)")
+
+    def notify_finished(self, was_succesful: bool):
+        self.success = was_succesful
+        elapsed = time.monotonic() - self.__start_time
+        for failed_file in self.__failed_files:
+            self.__print(failed_file)
+        if was_succesful:
+            self.__print(f"Done after {elapsed:.1f}s")
+        else:
+            self.__print(f"Upload failed after {elapsed:.1f}s. See the Log Output for Details.")
+
+    def notify_cancelled(self):
+        self.success = False
+        self.__print("Cancelled")
+
+
+def _upload_progress(uploaded: int, total: int, quarantined: int) -> str:
+    message = f"Uploaded {uploaded}/{total} Events"
+    if quarantined > 0:
+        message += f", {quarantined} rejected and quarantined"
+    return message
+
+
+def _parse_date(value: str) -> int:
+    try:
+        date = dt.datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=dt.timezone.utc)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a Date in the Format YYYY-MM-DD")
+    return int(date.timestamp())
+
+
+def _run_backfill(args: argparse.Namespace) -> int:
+    if len(args.api_key.strip()) == 0:
+        print("The API Key must not be empty", file=sys.stderr)
+        return EXIT_BAD_ARGUMENTS
+    if not pathlib.Path(args.journal_dir).is_dir():
+        print(f"The Journal Directory {args.journal_dir} does not exist", file=sys.stderr)
+        return EXIT_BAD_ARGUMENTS
+
+    # The Headless Config has to be filled before anything reads from the Configuration
+    from classes.headless_config import config
+    config.set("journaldir", args.journal_dir)
+
+    from classes.plugin_settings import configuration
+    configuration.api_key = args.api_key
+    if args.server_url is not None:
+        configuration.server_url = args.server_url
+    if args.requests_per_minute is not None:
+        configuration.rate_limit_per_minute = args.requests_per_minute
+
+    import signal
+    from classes.historic_data import HistoricDataManager
+    from classes.lifecycle import lifecycle
+    upper_bound = args.until + 24 * 60 * 60 if args.until is not None else None
+    progress = _ConsoleProgress()
+    manager = HistoricDataManager(args.cmdr, args.since, upper_bound, progress, args.journal_dir)
+    # The Backfill stops at its next Checkpoint. Whatever was queued is then sent (or spooled) below.
+    signal.signal(signal.SIGINT, lambda *_: manager.governor.cancel())
+    signal.signal(signal.SIGTERM, lambda *_: manager.governor.cancel())
+    manager.join()
+    lifecycle.stop(3.0)
+
+    if progress.success:
+        return EXIT_OK
+    return EXIT_UPLOAD_FAILED
+
+
+def _run_flush_spool(args: argparse.Namespace) -> int:
+    if len(args.api_key.strip()) == 0:
+        print("The API Key must not be empty", file=sys.stderr)
+        return EXIT_BAD_ARGUMENTS
+
+    from classes.plugin_settings import configuration
+    configuration.api_key = args.api_key
+    if args.server_url is not None:
+        configuration.server_url = args.server_url
+
+    from classes.event_handling import flush_spool, get_spool
+    from classes.spool import Spool
+    spool = Spool(pathlib.Path(args.spool_dir)) if args.spool_dir is not None else get_spool()
+    files = spool.closed_files()
+    print(f"Uploading {len(files)} Spool Files from {spool.directory}", flush=True)
+
+    def print_progress(uploaded: int, total: int, quarantined: int):
+        print(_upload_progress(uploaded, total, quarantined), flush=True)
+
+    if flush_spool(spool, print_progress):
+        print("Done", flush=True)
+        return EXIT_OK
+    print("Upload failed. The remaining Spool Files are kept. See the Log Output for Details.", flush=True)
+    return EXIT_UPLOAD_FAILED
+
+
+def _run_follow(args: argparse.Namespace) -> int:
+    if len(args.api_key.strip()) == 0:
+        print("The API Key must not be empty", file=sys.stderr)
+        return EXIT_BAD_ARGUMENTS
+    if not pathlib.Path(args.journal_dir).is_dir():
+        print(f"The Journal Directory {args.journal_dir} does not exist", file=sys.stderr)
+        return EXIT_BAD_ARGUMENTS
+
+    from classes.plugin_settings import configuration
+    configuration.api_key = args.api_key
+    if args.server_url is not None:
+        configuration.server_url = args.server_url
+    if args.requests_per_minute is not None:
+        configuration.rate_limit_per_minute = args.requests_per_minute
+    configuration.allowed_cmdrs = args.cmdr
+
+    import signal
+    import threading
+    from classes.journal_follower import JournalFollower
+    from classes.journal_worker import RELEVANT_EVENTS, JournalWork, JournalWorker
+    from classes.lifecycle import lifecycle
+    import classes.event_handling as events
+
+    # The same Path the Events take inside EDMC, starting at the Journal Worker
+    worker = JournalWorker()
+    lifecycle.on_stop("Journal Worker", worker.stop)
+    events.check_api_key()
+
+    def on_entry(entry: dict):
+        if entry.get("event") in RELEVANT_EVENTS:
+            worker.submit(JournalWork(entry, "", "", None, None, time.time()))
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    follower = JournalFollower(args.journal_dir, on_entry, args.poll_seconds, not args.poll, args.from_start)
+    print(f"Following the newest Journal in {args.journal_dir}. Stop with Ctrl+C.", flush=True)
+    follower.run(stop)
+    print("Stopping. Events that could not be sent are saved to the Spool.", flush=True)
+    lifecycle.stop(3.0)
+    return EXIT_OK
+
+
+def _build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Headless Tools of the EDMC PvpBot Plugin")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="Print the Plugin's Log Output. Twice (-vv) to also print DEBUG Output.")
+    parser.add_argument("--data-dir", default=None,
+                        help="Use this Directory instead of EDMC's App Directory. The Plugin keeps its Files "
+                             "(Journal Catalog, Killboard, Spool) in DATA_DIR/EDMC-PvPBot.")
+    parser.add_argument("--log-full-payloads", action="store_true",
+                        help="Log every Request Body in full. Only printed together with -vv.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill = subparsers.add_parser("backfill", help="Read Journal Files and upload all PVP Events in them")
+    backfill.add_argument("--journal-dir", required=True, help="Directory containing the Journal Files")
+    backfill.add_argument("--api-key", required=True, help="API Key used to authenticate with the Server")
+    backfill.add_argument("--server-url", default=None, help="Base URL of the PvpBot Server")
+    backfill.add_argument("--requests-per-minute", type=int, default=None,
+                          help="Send at most this many Requests per Minute. Adjusts itself to the Server's Limit.")
+    backfill.add_argument("--cmdr", action="append", default=[],
+                          help="Only upload Events of this CMDR. Can be passed multiple times.")
+    backfill.add_argument("--since", type=_parse_date, default=None,
+                          help="Only read Journal Files last written on or after this Date (YYYY-MM-DD)")
+    backfill.add_argument("--until", type=_parse_date, default=None,
+                          help="Only read Journal Files last written on or before this Date (YYYY-MM-DD)")
+    backfill.set_defaults(run=_run_backfill)
+
+    follow = subparsers.add_parser("follow", help="Follow the newest Journal and send new PVP Events as they happen")
+    follow.add_argument("--journal-dir", required=True, help="Directory containing the Journal Files")
+    follow.add_argument("--api-key", required=True, help="API Key used to authenticate with the Server")
+    follow.add_argument("--server-url", default=None, help="Base URL of the PvpBot Server")
+    follow.add_argument("--requests-per-minute", type=int, default=None,
+                        help="Send at most this many Requests per Minute. Adjusts itself to the Server's Limit.")
+    follow.add_argument("--cmdr", action="append", default=[],
+                        help="Only send Events of this CMDR. Can be passed multiple times.")
+    follow.add_argument("--poll", action="store_true",
+                        help="Poll the Journal instead of using inotify (e.g. on Network Drives)")
+    follow.add_argument("--poll-seconds", type=float, default=0.5, help="Poll Interval (default: 0.5)")
+    follow.add_argument("--from-start", action="store_true",
+                        help="Also send the Events already in the newest Journal")
+    follow.set_defaults(run=_run_follow)
+
+    flush = subparsers.add_parser("flush-spool", help="Upload Events saved in the Spool (e.g. from Offline Mode)")
+    flush.add_argument("--api-key", required=True, help="API Key used to authenticate with the Server")
+    flush.add_argument("--server-url", default=None, help="Base URL of the PvpBot Server")
+    flush.add_argument("--spool-dir", default=None,
+                       help="Directory with Spool Files, e.g. copied from another Machine. "
+                            "Defaults to the Spool of this Machine.")
+    flush.set_defaults(run=_run_flush_spool)
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = _build_argument_parser().parse_args(argv)
+
+    if args.data_dir is not None:
+        from classes.headless_config import config
+        config.app_dir_path = pathlib.Path(args.data_dir)
+        config.app_dir = str(config.app_dir_path)
+
+    from classes.plugin_settings import configuration
+    # Instance Coordination is for several EDMC Instances on one Machine. A CLI Run is not one of them, it neither
+    # leads (and uploads their Inbox) nor forwards its Events to them.
+    configuration.coordinate_instances = False
+
+    from classes.logger_factory import logger
+    logger.setLevel({0: logging.WARNING, 1: logging.INFO}.get(args.verbose, logging.DEBUG))
+    if args.log_full_payloads:
+        configuration.log_full_payloads = True
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,47 @@
+"""
+Entry Point for EDMC. EDMC loads all Plugins one after another on Startup, so this Module only imports what it
+needs right away. Everything heavier (requests, the HTTP Threads, the historic Aggregation, ...) is imported and
+started once it is first needed.
+"""
+from __future__ import annotations
 import classes.plugin_settings as settings
-import classes.event_handling as events
 from classes.plugin_settings import configuration
 from classes.logger_factory import logger
-from classes.version_check import build_worker as build_version_check_logger
-from classes.ui import GenericUiMessage, GenericUiMessageType, ui
-from classes.historic_data import HistoricDataManager
+from classes.journal_worker import KILL_EVENTS, RELEVANT_EVENTS, JournalWork, JournalWorker
+from classes.lifecycle import lifecycle
+from classes.backfill_governor import notify_live_activity
 from os.path import basename, dirname
-import tkinter
+import time
 
-from typing import Any
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import tkinter
+
+
+_journal_worker = JournalWorker()
+
+
+_STOP_TIMEOUT_SECONDS = 3.0
+
+
+def _check_api_key_deferred():
+    """
+    Checking the API Key needs the HTTP Thread. Import and start it off the Main Thread.
+    """
+    def worker():
+        import classes.event_handling as events
+        events.check_api_key()
+
+    lifecycle.submit(worker)
 
 
 def plugin_app(parent: tkinter.Frame) -> tkinter.Frame:
+    from classes.ui import GenericUiMessage, GenericUiMessageType, ui
     ui.set_frame(parent)
 
     if configuration.run_historic_aggregation_on_next_startup:
+        from classes.historic_data import HistoricDataManager
         HistoricDataManager(configuration.allowed_cmdrs, None, None, ui.get_historic_ui())
 
     if len(configuration.api_key or "") == 0:
@@ -22,29 +49,39 @@ def plugin_app(parent: tkinter.Frame) -> tkinter.Frame:
         ui.notify_about_new_message(no_api_key_error, False) # This must be false, followed by an .update_ui() because we 
         ui.update_ui()                                       # cannot generate an Event from the main thread!
     else:
-        events.check_api_key()
+        _check_api_key_deferred()
 
     return parent
 
 
 def plugin_start3(_path: str) -> str:
     logger.info("Starting PVP Bot Plugin")
+    # Before the HTTP Thread registers its own Hook, so the Events still in the Worker are sent (or spooled) first
+    lifecycle.on_stop("Journal Worker", _journal_worker.stop)
 
     if configuration.check_updates:
         logger.info("Starting Update Check in new Thread...")
 
         def notify_ui_on_outdated(is_outdated: bool):
             if is_outdated:
+                from classes.ui import ui
                 ui.notify_version_outdated()
 
-        thread = build_version_check_logger(notify_ui_on_outdated)
-        thread.start()
+        from classes.version_check import check_version
+        lifecycle.submit(check_version, notify_ui_on_outdated)
     else:
         logger.info("Skipping Update Check. Disabled in Settings")
 
     return basename(dirname(__file__))
 
 
+def plugin_stop():
+    """
+    Called by EDMC on Shutdown. Gives queued Events a few Seconds to be sent, then saves the Rest for the next Start.
+    """
+    lifecycle.stop(_STOP_TIMEOUT_SECONDS)
+
+
 def plugin_prefs(parent: Any, _cmdr: str, _is_beta: bool):
     return settings.build_settings_ui(parent)
 
@@ -53,35 +90,21 @@ def prefs_changed(_cmdr: str, _is_beta: bool):
     settings.push_new_changes()
 
 
-def _is_cmdr_valid(cmdr: str) -> bool:
-    if not configuration.has_commander_filter_enabled:
-        return True
-    return cmdr.upper() in map(str.upper, configuration.allowed_cmdrs)
-
-
 def journal_entry(cmdr: str, _is_beta: bool, system: str,
                   _station: str, entry: dict[str, Any], state: dict[str, Any]):
-
-    # First Check if this is a PVPKill or Died event
-    if entry["event"] not in ["Died", "PVPKill"]:
+    """
+    Runs on EDMCs Main Thread for every Journal Line. Only decides if the Event is worth handing to the Journal Worker.
+    """
+    # Lets a running historic Aggregation know that the Game is being played
+    notify_live_activity()
+    event = entry.get("event")
+    if event not in RELEVANT_EVENTS:
         return
-    # Now check if the CMDR should be skipped due to settings
-    if not _is_cmdr_valid(cmdr):
-        return
-    # Aggregate some additional data
-    ship_current_flying: str | None = state["ShipType"]
-    own_rank, _ = state["Rank"]["Combat"]
-    # At this point only "valid" CMDRs are remaining.
-    try:
-        if entry["event"] == "Died":
-            events.handle_died_event(cmdr, own_rank, entry, ship_current_flying, system)
-        elif entry["event"] == "PVPKill":
-            events.handle_kill_event(cmdr, own_rank, entry, ship_current_flying, system)
-    except Exception as e:
-        # Catchall just in Case
-        logger.exception(e)
-        ui.notify_about_new_message(GenericUiMessage(str(e), GenericUiMessageType.ERROR, 10_000))
-
-
-
-
+    ship = None
+    rank = None
+    if event in KILL_EVENTS:
+        # EDMC keeps updating its state-Dict, so take what is needed right now
+        ship = state.get("ShipType")
+        combat = (state.get("Rank") or {}).get("Combat")
+        rank = combat[0] if combat else None
+    _journal_worker.submit(JournalWork(entry, cmdr, system, ship, rank, time.time()))
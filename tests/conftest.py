@@ -0,0 +1,19 @@
+"""
+The Tests run the Plugin headless (like cli.py does), with all of its Files in a temporary Directory
+"""
+import pathlib
+import sys
+import tempfile
+
+_ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_ROOT))
+sys.path.insert(0, str(_ROOT / "tools"))
+
+# Has to happen before anything reads from the Configuration
+from classes.headless_config import config  # noqa: E402
+
+_data_dir = pathlib.Path(tempfile.mkdtemp(prefix="pvpbot-tests-"))
+config.app_dir_path = _data_dir
+config.app_dir = str(_data_dir)
+config.set("classes.check_updates", False)
+config.set("classes.coordinate_instances", False)
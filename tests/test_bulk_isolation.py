@@ -0,0 +1,139 @@
+"""
+upload_bulk against the Stand-In Server, which rejects whole Chunks that contain a Kill of certain Victims.
+Only those Events may end up in the Quarantine, everything else has to arrive exactly once.
+"""
+import collections
+import json
+import math
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from standin_server import StandInState, build_handler
+from classes.data import create_pvpkill_event
+from classes.plugin_settings import configuration
+from classes.quarantine import get_quarantine
+import classes.event_handling as events
+
+_CHUNK_SIZE = 100
+
+
+@pytest.fixture(scope="module", autouse=True)
+def server():
+    state = StandInState("test-key", True)
+    state.verbose = False
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), build_handler(state))
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+
+    configuration.server_url = f"http://127.0.0.1:{http_server.server_address[1]}"
+    configuration.api_key = "test-key"
+    # Bisection sends many small Requests. The Rate Limit is not what is tested here.
+    configuration.rate_limit_per_minute = 100_000
+    configuration.rate_limit_burst = 10_000
+    # A fixed Chunk Size, so the Number of Requests is known up front
+    configuration.bulk_chunk_min_events = _CHUNK_SIZE
+    configuration.bulk_chunk_max_events = _CHUNK_SIZE
+    yield state
+    http_server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(server: StandInState):
+    quarantine_path = get_quarantine().path
+    quarantine_path.unlink(missing_ok=True)
+    with server.mutex:
+        server.events.clear()
+        server.requests = 0
+    server.rejected_victims = set()
+    yield
+    quarantine_path.unlink(missing_ok=True)
+
+
+def _kills(victims: list[str]) -> list[dict]:
+    payloads = []
+    for i, victim in enumerate(victims):
+        entry = {"timestamp": f"2023-01-01T{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}Z", "event": "PVPKill",
+                 "Victim": victim, "CombatRank": 3}
+        payloads.append(create_pvpkill_event(entry, "Tester", "FerDeLance", 5, "Deciat").as_dict())
+    return payloads
+
+
+def _quarantined_victims() -> list[str]:
+    path = get_quarantine().path
+    if not path.exists():
+        return []
+    with path.open("r", encoding="utf8") as file:
+        return [json.loads(line)["event"]["victim"]["name"] for line in file]
+
+
+def _accepted_victims(server: StandInState) -> collections.Counter:
+    with server.mutex:
+        return collections.Counter(event["victim"]["name"] for event in server.events)
+
+
+def test_only_rejected_events_are_quarantined(server: StandInState):
+    victims = [f"Victim{i}" for i in range(250)]
+    server.rejected_victims = {"Victim7", "Victim130"}
+
+    assert events.upload_bulk(_kills(victims))
+
+    assert sorted(_quarantined_victims()) == ["Victim130", "Victim7"]
+    accepted = _accepted_victims(server)
+    assert set(accepted) == set(victims) - server.rejected_victims
+    assert all(count == 1 for count in accepted.values())
+
+
+def test_every_event_of_a_rejected_victim_is_quarantined(server: StandInState):
+    # Victims repeat, like in real Journals. Every Kill of a rejected Victim is a bad Event on its own.
+    victims = [f"Victim{i % 20}" for i in range(250)]
+    server.rejected_victims = {"Victim7", "Victim13"}
+    rejected_count = sum(1 for victim in victims if victim in server.rejected_victims)
+
+    progress = []
+    assert events.upload_bulk(_kills(victims), lambda *counts: progress.append(counts))
+
+    # Quarantined Events are not counted as uploaded
+    assert progress[-1] == (len(victims) - rejected_count, len(victims), rejected_count)
+    assert len(_quarantined_victims()) == rejected_count
+    assert set(_quarantined_victims()) == server.rejected_victims
+    assert sum(_accepted_victims(server).values()) == len(victims) - rejected_count
+
+
+@pytest.mark.parametrize("bad_positions", [[0], [37], [5, 90], [10, 11, 12]])
+def test_bisection_stays_within_its_request_budget(server: StandInState, bad_positions: list[int]):
+    victims = [f"Victim{i}" for i in range(_CHUNK_SIZE)]
+    server.rejected_victims = {victims[i] for i in bad_positions}
+
+    assert events.upload_bulk(_kills(victims))
+
+    # One Request for the Chunk itself, then about 2k*log2(n) to find the k bad Events in it
+    budget = 1 + 2 * len(bad_positions) * math.ceil(math.log2(_CHUNK_SIZE))
+    assert server.requests <= budget
+    assert sorted(_quarantined_victims()) == sorted(server.rejected_victims)
+    assert sum(_accepted_victims(server).values()) == _CHUNK_SIZE - len(bad_positions)
+
+
+def test_payloads_can_be_a_generator(server: StandInState):
+    # The historic Upload hands over the Merge of all Journals without putting it into a List first
+    victims = [f"Victim{i}" for i in range(250)]
+    server.rejected_victims = {"Victim42"}
+
+    progress = []
+    assert events.upload_bulk(iter(_kills(victims)), lambda *counts: progress.append(counts), total=len(victims))
+
+    assert progress[-1] == (len(victims) - 1, len(victims), 1)
+    assert _quarantined_victims() == ["Victim42"]
+    assert sum(_accepted_victims(server).values()) == len(victims) - 1
+
+
+def test_in_order_upload_keeps_the_order_of_the_events(server: StandInState):
+    # Historic Uploads send one Chunk at a Time, and the Halves of a rejected Chunk before the next one
+    victims = [f"Victim{i}" for i in range(450)]
+    server.rejected_victims = {"Victim5", "Victim250"}
+
+    assert events.upload_bulk(iter(_kills(victims)), in_order=True)
+
+    with server.mutex:
+        arrived = [event["victim"]["name"] for event in server.events]
+    assert arrived == [victim for victim in victims if victim not in server.rejected_victims]
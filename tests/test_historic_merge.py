@@ -0,0 +1,42 @@
+"""
+merge_in_time_order reads the Journals lazily. A File is only started once the Merge got to the Time it starts at.
+"""
+from classes.data import CommanderEntry, PvpKillEventData
+from classes.historic_data import merge_in_time_order
+
+
+def _event(timestamp: int) -> PvpKillEventData:
+    return PvpKillEventData(timestamp, CommanderEntry("Victim", None, 1), CommanderEntry("Killer", None, 1), "Deciat")
+
+
+def test_events_come_in_order_of_time():
+    files = {10: [10, 15, 40], 20: [20, 30], 0: [5, 50]}
+
+    def stream(timestamps: list[int]):
+        yield from (_event(timestamp) for timestamp in timestamps)
+
+    streams = [(start, lambda timestamps=timestamps: stream(timestamps)) for start, timestamps in files.items()]
+    merged = [event.timestamp for event in merge_in_time_order(streams)]
+
+    assert merged == [5, 10, 15, 20, 30, 40, 50]
+
+
+def test_files_are_only_read_once_the_merge_gets_to_them():
+    open_files = set()
+    most_open_files = 0
+
+    def stream(name: int, timestamps: list[int]):
+        nonlocal most_open_files
+        open_files.add(name)
+        most_open_files = max(most_open_files, len(open_files))
+        yield from (_event(timestamp) for timestamp in timestamps)
+        open_files.discard(name)
+
+    # One File per Day, none of them overlap
+    streams = [(day * 100, lambda day=day: stream(day, [day * 100 + 1, day * 100 + 2])) for day in range(50)]
+    merged = [event.timestamp for event in merge_in_time_order(streams)]
+
+    assert merged == sorted(merged)
+    assert len(merged) == 100
+    # The next File is started once the previous one ran out of Events, before it was closed
+    assert most_open_files <= 2
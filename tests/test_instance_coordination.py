@@ -0,0 +1,55 @@
+"""
+Followers only forward to a Leader whose Heartbeat in leader.json is fresh. The File outlives the Leader.
+What they forward ends up in the shared Inbox, for the Leader to upload.
+"""
+import json
+import pathlib
+import time
+
+import pytest
+
+from classes.instance_coordination import InstanceCoordinator, _hash_key
+from classes.spool import Spool
+import classes.event_handling as events
+
+
+def _write_leader(data_dir: pathlib.Path, key: str, heartbeat: float):
+    with (data_dir / "leader.json").open("w", encoding="utf8") as file:
+        json.dump({"pid": 1, "key_hash": _hash_key(key), "heartbeat": heartbeat}, file)
+
+
+@pytest.fixture
+def follower(tmp_path: pathlib.Path) -> InstanceCoordinator:
+    # Never started, so it never takes the Lock itself
+    return InstanceCoordinator(tmp_path)
+
+
+def test_forwards_to_a_live_leader_with_the_same_key(follower: InstanceCoordinator, tmp_path: pathlib.Path):
+    _write_leader(tmp_path, "key", time.time())
+    assert follower.should_forward("key")
+    assert not follower.should_forward("other-key")
+
+
+def test_does_not_forward_to_a_stale_leader(follower: InstanceCoordinator, tmp_path: pathlib.Path):
+    _write_leader(tmp_path, "key", time.time() - 60)
+    assert not follower.should_forward("key")
+
+
+def test_does_not_forward_without_a_leader(follower: InstanceCoordinator, tmp_path: pathlib.Path):
+    assert not follower.should_forward("key")
+    # Written by an older Version, without a Heartbeat
+    with (tmp_path / "leader.json").open("w", encoding="utf8") as file:
+        json.dump({"pid": 1, "key_hash": _hash_key("key")}, file)
+    assert not follower.should_forward("key")
+
+
+def test_historic_events_are_forwarded_in_batches(follower: InstanceCoordinator):
+    payloads = [{"n": i} for i in range(2500)]
+    progress = []
+
+    assert events._forward_bulk(follower, iter(payloads), len(payloads), lambda *counts: progress.append(counts))
+
+    files = follower.inbox.closed_files()
+    assert len(files) == 3
+    assert [payload for file in files for payload in Spool.read_file(file)] == payloads
+    assert progress[-1] == (len(payloads), len(payloads), 0)
@@ -0,0 +1,44 @@
+"""
+A Resume continues from a Snapshot of the JournalStateTracker, which may have been written to Disk as JSON
+"""
+import json
+
+from classes.journal_state import JournalState, JournalStateTracker
+
+
+def _feed(tracker: JournalStateTracker, *entries: dict):
+    for entry in entries:
+        tracker.feed(entry)
+
+
+def test_snapshot_survives_a_json_round_trip():
+    tracker = JournalStateTracker()
+    _feed(tracker,
+          {"event": "Fileheader", "gameversion": "4.0.0.1500"},
+          {"event": "LoadGame", "Commander": "WDX"},
+          {"event": "Loadout", "Ship": "FerDeLance"},
+          {"event": "Rank", "Combat": 5},
+          {"event": "FSDJump", "StarSystem": "Deciat"})
+
+    restored = JournalStateTracker.restore(json.loads(json.dumps(tracker.snapshot())))
+
+    assert restored.state == tracker.state
+    assert restored.state == JournalState("WDX", "ferdelance", 5, "Deciat", "4.0.0.1500")
+
+
+def test_restored_tracker_goes_on_from_the_snapshot():
+    tracker = JournalStateTracker()
+    _feed(tracker, {"event": "LoadGame", "Commander": "WDX"}, {"event": "Location", "StarSystem": "Deciat"})
+    restored = JournalStateTracker.restore(tracker.snapshot())
+
+    _feed(restored, {"event": "FSDJump", "StarSystem": "Sol"})
+
+    assert restored.state.commander == "WDX"
+    assert restored.state.location == "Sol"
+    # The Snapshot is a Copy, the original Tracker did not move
+    assert tracker.state.location == "Deciat"
+
+
+def test_unknown_fields_in_a_snapshot_are_ignored():
+    restored = JournalStateTracker.restore({"commander": "WDX", "no_longer_tracked": 1})
+    assert restored.state == JournalState(commander="WDX")
@@ -0,0 +1,51 @@
+"""
+Without X-RateLimit Headers the Bucket halves its Rate on every 429 and has to find its way back up on its own
+"""
+from classes.rate_limiter import TokenBucket
+
+
+def _slow_down(bucket: TokenBucket, times: int):
+    for _ in range(times):
+        bucket.update_from_response(429, {"Retry-After": "0"})
+
+
+def test_rate_recovers_after_successful_responses():
+    bucket = TokenBucket(60, 10)
+    _slow_down(bucket, 6)
+    assert bucket.requests_per_minute == 1.0
+
+    for _ in range(100):
+        bucket.update_from_response(200, {})
+
+    assert bucket.requests_per_minute == 60.0
+
+
+def test_rate_recovers_step_by_step():
+    bucket = TokenBucket(60, 10)
+    _slow_down(bucket, 1)
+    assert bucket.requests_per_minute == 30.0
+
+    bucket.update_from_response(200, {})
+    assert 30.0 < bucket.requests_per_minute < 60.0
+    # A 429 in between slows it down again
+    _slow_down(bucket, 1)
+    assert bucket.requests_per_minute < 30.0
+
+
+def test_failed_responses_do_not_speed_up():
+    bucket = TokenBucket(60, 10)
+    _slow_down(bucket, 2)
+    for _ in range(20):
+        bucket.update_from_response(500, {})
+    assert bucket.requests_per_minute == 15.0
+
+
+def test_rate_recovers_only_up_to_what_the_server_allows():
+    bucket = TokenBucket(600, 10)
+    bucket.update_from_response(200, {"X-RateLimit-Limit": "100"})
+    _slow_down(bucket, 3)
+
+    for _ in range(100):
+        bucket.update_from_response(200, {})
+
+    assert abs(bucket.requests_per_minute - 90.0) < 1e-6
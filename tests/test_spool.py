@@ -0,0 +1,54 @@
+"""
+Several Instances share one Spool Directory. A File must not be flushed while its Writer still adds to it.
+"""
+import os
+import pathlib
+import time
+
+from classes.spool import Spool
+
+
+def _age(path: pathlib.Path, seconds: float):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_rotate_closes_the_current_file(tmp_path: pathlib.Path):
+    spool = Spool(tmp_path)
+    spool.append({"n": 1})
+    assert spool.closed_files() == []
+
+    spool.rotate()
+    closed = spool.closed_files()
+    assert len(closed) == 1
+    assert list(Spool.read_file(closed[0])) == [{"n": 1}]
+
+
+def test_file_of_a_live_writer_is_skipped(tmp_path: pathlib.Path):
+    writer = Spool(tmp_path)
+    flusher = Spool(tmp_path)
+    writer.append({"n": 1})
+    # Old enough to be taken as left behind, if it was not locked
+    for path in tmp_path.glob("*.open"):
+        _age(path, 3600)
+
+    assert flusher.closed_files() == []
+    writer.append({"n": 2})
+    writer.rotate()
+    closed = flusher.closed_files()
+    assert len(closed) == 1
+    assert list(Spool.read_file(closed[0])) == [{"n": 1}, {"n": 2}]
+
+
+def test_file_left_open_by_a_crash_is_closed(tmp_path: pathlib.Path):
+    left_open = tmp_path / "spool-20230101T000000-1-000000.ndjson.open"
+    left_open.write_text('{"n":1}\n', encoding="utf8")
+    young = tmp_path / "spool-20230101T000001-2-000000.ndjson.open"
+    young.write_text('{"n":2}\n', encoding="utf8")
+    _age(left_open, 3600)
+
+    closed = Spool(tmp_path).closed_files()
+
+    # The young one may belong to a Writer that did not lock it yet
+    assert closed == [tmp_path / "spool-20230101T000000-1-000000.ndjson"]
+    assert young.exists()
@@ -0,0 +1,225 @@
+"""
+Small Benchmarks for the Parts of the Plugin that run on EDMCs Main Thread. They run headless (without EDMC),
+each in a fresh Python Process so Imports are not cached between Runs.
+
+    python3 tools/benchmarks.py startup
+    python3 tools/benchmarks.py journal-state
+    python3 tools/benchmarks.py journal-entry
+
+Every Benchmark has a Budget. If the Median is over Budget, the Script exits with 1, so it can guard against
+Regressions.
+"""
+import argparse
+import json
+import pathlib
+import statistics
+import subprocess
+import sys
+import time
+
+_ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+_STARTUP_PROBE = """
+import json, sys, threading, time
+sys.path.insert(0, {root!r})
+from classes.headless_config import config
+config.set("classes.check_updates", False)
+threads_before = threading.active_count()
+start = time.perf_counter()
+import load
+imported = time.perf_counter()
+load.plugin_start3({root!r})
+started = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "plugin_start3_ms": (started - imported) * 1000,
+    "new_threads": threading.active_count() - threads_before,
+    "eager_modules": [m for m in ("requests", "classes.event_handling", "classes.historic_data",
+                                  "classes.transport", "classes.killboard") if m in sys.modules],
+}}))
+"""
+
+
+def _run_probe(probe: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", probe.format(root=str(_ROOT))],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark_startup(runs: int, budget_ms: float) -> bool:
+    """
+    Time of "import load" plus plugin_start3. Also checks that nothing heavy was imported and no Thread was started.
+    """
+    results = [_run_probe(_STARTUP_PROBE) for _ in range(runs)]
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    start_ms = statistics.median(r["plugin_start3_ms"] for r in results)
+    total_ms = import_ms + start_ms
+    print(f"import load:   {import_ms:8.2f} ms (median of {runs})")
+    print(f"plugin_start3: {start_ms:8.2f} ms (median of {runs})")
+    print(f"total:         {total_ms:8.2f} ms (budget {budget_ms:.0f} ms)")
+
+    ok = total_ms <= budget_ms
+    eager_modules = results[0]["eager_modules"]
+    if len(eager_modules) > 0:
+        print(f"Imported on Startup, but should be deferred: {', '.join(eager_modules)}")
+        ok = False
+    if results[0]["new_threads"] > 0:
+        print(f"{results[0]['new_threads']} Thread(s) started on Startup")
+        ok = False
+    return ok
+
+
+def _synthetic_journal_entries(count: int) -> list[dict]:
+    """
+    Roughly the Mix of a real Journal: mostly Events nobody here cares about, some State Changes, few Kills.
+    The Weight is how many out of 100 Events are of that Kind.
+    """
+    weighted_templates = [
+        (24, {"event": "Music", "MusicTrack": "Exploration"}),
+        (16, {"event": "ReceiveText", "From": "", "Message": "o7", "Channel": "npc"}),
+        (16, {"event": "ShipTargeted", "TargetLocked": False}),
+        (16, {"event": "Scan", "BodyName": "A 1"}),
+        (16, {"event": "FuelScoop", "Scooped": 5.0}),
+        (3, {"event": "FSDJump", "StarSystem": "Shinrarta Dezhra"}),
+        (1, {"event": "Location", "StarSystem": "Deciat"}),
+        (1, {"event": "Loadout", "Ship": "FerDeLance"}),
+        (1, {"event": "Rank", "Combat": 5}),
+        (1, {"event": "Fileheader", "gameversion": "4.0.0.1500"}),
+        (1, {"event": "LoadGame", "Commander": "WDX"}),
+        (1, {"event": "SuitLoadout", "SuitName": "flightsuit"}),
+        (2, {"event": "PVPKill", "Victim": "Victim", "CombatRank": 3}),
+    ]
+    templates = [template for weight, template in weighted_templates for _ in range(weight)]
+    # 37 and 100 have no common Divisor, so this goes through all 100 Templates, but not Kind by Kind
+    return [dict(templates[i * 37 % len(templates)]) for i in range(count)]
+
+
+def _if_elif_chain(entries: list[dict]):
+    """
+    The State Tracking of historic_data.py before JournalStateTracker, as the Reference
+    """
+    location = None
+    cmdr_name = None
+    current_ship = 'unknown'
+    current_rank = None
+    game_version = None
+    for line_as_json in entries:
+        if line_as_json["event"] == "Fileheader":
+            game_version = line_as_json.get("gameversion")
+        elif line_as_json["event"] == "LoadGame":
+            cmdr_name = str(line_as_json["Commander"])
+        elif line_as_json["event"] == "Location" or line_as_json["event"] == "FSDJump":
+            location = line_as_json["StarSystem"]
+        elif line_as_json["event"] == "Rank":
+            current_rank = line_as_json["Combat"]
+        elif line_as_json["event"] == "Loadout":
+            current_ship = line_as_json["Ship"]
+        elif line_as_json["event"] == "SuitLoadout":
+            current_ship = "on_foot"
+        elif line_as_json["event"] == "Died":
+            pass
+        elif line_as_json["event"] == "PVPKill":
+            pass
+    return location, cmdr_name, current_ship, current_rank, game_version
+
+
+def _tracker(entries: list[dict]):
+    from classes.journal_state import JournalStateTracker
+    tracker = JournalStateTracker()
+    for entry in entries:
+        event = tracker.feed(entry)
+        if event == "Died":
+            pass
+        elif event == "PVPKill":
+            pass
+    return tracker.state
+
+
+def benchmark_journal_state(events: int, runs: int, min_ratio: float) -> bool:
+    """
+    Events per Second of JournalStateTracker against the old if/elif Chain, on already parsed Events
+    """
+    sys.path.insert(0, str(_ROOT))
+    entries = _synthetic_journal_entries(events)
+
+    # Both take well under a Second, so a Hiccup of the Machine easily skews one of them. Each Run times the two
+    # right after each other, so a Hiccup mostly hits both alike, and the Median of the Ratios ignores the rest.
+    chain_timings = []
+    tracker_timings = []
+    ratios = []
+    for _ in range(runs):
+        for function, timings in ((_if_elif_chain, chain_timings), (_tracker, tracker_timings)):
+            start = time.perf_counter()
+            function(entries)
+            timings.append(time.perf_counter() - start)
+        ratios.append(chain_timings[-1] / tracker_timings[-1])
+    chain_rate = events / min(chain_timings)
+    tracker_rate = events / min(tracker_timings)
+    ratio = statistics.median(ratios)
+    print(f"if/elif Chain:       {chain_rate / 1e6:6.2f} M Events/s (best of {runs})")
+    print(f"JournalStateTracker: {tracker_rate / 1e6:6.2f} M Events/s (best of {runs}, "
+          f"median {ratio:.2f}x as fast, budget {min_ratio:.2f}x)")
+    return ratio >= min_ratio
+
+
+def benchmark_journal_entry(calls: int, runs: int, budget_us: float) -> bool:
+    """
+    Cost per Call of load.journal_entry on the Main Thread for Events the Plugin does not care about.
+    Events that change the State are only handed to the Journal Worker. Their Cost is shown, but has no Budget.
+    """
+    sys.path.insert(0, str(_ROOT))
+    from classes.headless_config import config
+    config.set("classes.check_updates", False)
+    import load
+    state = {"ShipType": "ferdelance", "Rank": {"Combat": (5, 0)}}
+    irrelevant = [entry for entry in _synthetic_journal_entries(1000)
+                  if entry["event"] in ("Music", "ReceiveText", "ShipTargeted", "Scan", "FuelScoop")]
+    state_changes = [entry for entry in _synthetic_journal_entries(1000)
+                     if entry["event"] in ("FSDJump", "Location", "Loadout", "Rank")]
+
+    def per_call_us(entries: list[dict]) -> float:
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            for i in range(calls):
+                load.journal_entry("WDX", False, "Deciat", "", entries[i % len(entries)], state)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) / calls * 1e6
+
+    irrelevant_us = per_call_us(irrelevant)
+    state_change_us = per_call_us(state_changes)
+    print(f"irrelevant Event:  {irrelevant_us:6.2f} us per Call (median of {runs}, budget {budget_us:.2f} us)")
+    print(f"State Change:      {state_change_us:6.2f} us per Call (handed to the Journal Worker)")
+    return irrelevant_us <= budget_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the PvpBot Plugin")
+    commands = parser.add_subparsers(dest="command", required=True)
+    startup = commands.add_parser("startup", help="Import Time of load.py and Duration of plugin_start3")
+    startup.add_argument("--runs", type=int, default=15)
+    startup.add_argument("--budget-ms", type=float, default=50.0)
+    journal_state = commands.add_parser("journal-state", help="Throughput of the Journal State Tracking")
+    journal_state.add_argument("--events", type=int, default=200_000)
+    journal_state.add_argument("--runs", type=int, default=15)
+    journal_state.add_argument("--min-ratio", type=float, default=1.0,
+                               help="Fail if the Tracker is slower than this Factor of the old if/elif Chain")
+    journal_entry = commands.add_parser("journal-entry", help="Main Thread Cost of journal_entry per Call")
+    journal_entry.add_argument("--calls", type=int, default=100_000)
+    journal_entry.add_argument("--runs", type=int, default=5)
+    journal_entry.add_argument("--budget-us", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.command == "startup":
+        ok = benchmark_startup(args.runs, args.budget_ms)
+    elif args.command == "journal-state":
+        ok = benchmark_journal_state(args.events, args.runs, args.min_ratio)
+    elif args.command == "journal-entry":
+        ok = benchmark_journal_entry(args.calls, args.runs, args.budget_us)
+    else:
+        ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
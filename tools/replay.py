@@ -0,0 +1,308 @@
+"""
+Load Generator for the live Path. Replays Journals through load.py::journal_entry, exactly like EDMC would call it,
+with a matching state-Dict. From there the Events take the real Path through event_handling, the HTTP Thread and
+the UI Notifications, to a local Stand-In of the Backend (tools/standin_server.py).
+
+Tk is replaced by a Stub, so this runs without a Display. The Stub still counts how often the UI would be refreshed.
+
+    python3 tools/replay.py --synthetic 500 --speed 0
+    python3 tools/replay.py --journal ./journals --speed 10
+
+--speed 1 replays in real Time (using the Timestamps of the Journal), --speed 10 ten Times as fast, --speed 0 as
+fast as possible. At the End, Throughput, Queue Growth and the Latency from journal_entry until the Event arrived at
+the Stand-In are reported. Against the Stand-In, the client-side Rate Limit is lifted unless --requests-per-minute
+is given, so the Plugin's own Cost is measured and not the Pacing. The Exit Code is 1 if Events were still waiting to
+be sent when --drain-timeout ran out.
+"""
+import argparse
+import collections
+import datetime as dt
+import json
+import pathlib
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from http.server import ThreadingHTTPServer
+from typing import Any, Iterator, Optional
+
+_ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_ROOT))
+sys.path.insert(0, str(_ROOT / "tools"))
+
+
+class _StubWidget:
+    """
+    Accepts everything Tk Widgets are asked to do in classes/ui.py and does nothing, except for Refresh Events
+    """
+    refreshes = 0
+    _mutex = threading.Lock()
+
+    def __init__(self, *_args, **_kwargs):
+        self.__bindings: dict[str, Any] = {}
+
+    def bind(self, sequence: str, callback, *_args):
+        self.__bindings[sequence] = callback
+
+    def event_generate(self, sequence: str, *_args, **_kwargs):
+        with _StubWidget._mutex:
+            _StubWidget.refreshes += 1
+            # Tk would run this later on the Main Thread. Running it right here still costs what update_ui costs.
+            callback = self.__bindings.get(sequence)
+            if callback is not None:
+                callback(None)
+
+    def winfo_children(self) -> list:
+        return []
+
+    def cget(self, _key: str) -> str:
+        return ""
+
+    def __getattr__(self, _name: str):
+        # grid, pack, destroy, config, ...
+        return lambda *args, **kwargs: None
+
+
+def _install_tk_stub():
+    tkinter = types.ModuleType("tkinter")
+    for name in ("Frame", "Label", "Button", "Tk", "Variable", "BooleanVar", "StringVar", "IntVar"):
+        setattr(tkinter, name, _StubWidget)
+    for name in ("W", "E", "N", "S", "EW", "NS", "LEFT", "RIGHT", "TOP", "BOTTOM", "END"):
+        setattr(tkinter, name, name.lower())
+    theme = types.ModuleType("theme")
+    theme.theme = _StubWidget()
+    sys.modules["tkinter"] = tkinter
+    sys.modules["theme"] = theme
+
+
+def _synthetic_journal(kills: int, interval_seconds: float) -> Iterator[dict]:
+    # Starts now, so that with --speed 1 the Timestamps match when the Events are fed, like in a live Journal
+    start = dt.datetime.now(dt.timezone.utc).replace(microsecond=0)
+
+    def stamp(offset: float) -> str:
+        return (start + dt.timedelta(seconds=offset)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    yield {"timestamp": stamp(0), "event": "Fileheader", "gameversion": "4.0.0.1500"}
+    yield {"timestamp": stamp(0), "event": "LoadGame", "Commander": "Replay"}
+    yield {"timestamp": stamp(0), "event": "Rank", "Combat": 5}
+    yield {"timestamp": stamp(0), "event": "Loadout", "Ship": "FerDeLance"}
+    yield {"timestamp": stamp(0), "event": "Location", "StarSystem": "Deciat"}
+    for i in range(kills):
+        offset = (i + 1) * interval_seconds
+        if i % 10 == 9:
+            yield {"timestamp": stamp(offset), "event": "Died", "KillerName": f"Cmdr Killer{i}",
+                   "KillerShip": "anaconda", "KillerRank": "Elite"}
+        else:
+            yield {"timestamp": stamp(offset), "event": "PVPKill", "Victim": f"Victim{i}", "CombatRank": i % 9}
+        yield {"timestamp": stamp(offset), "event": "Music", "MusicTrack": "Combat_Dogfight"}
+
+
+def _recorded_journals(path: pathlib.Path) -> Iterator[dict]:
+    files = sorted(path.glob("Journal*.log")) if path.is_dir() else [path]
+    for file in files:
+        with file.open("r", encoding="utf8") as journal:
+            for line in journal:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def _unix_timestamp(entry: dict) -> Optional[float]:
+    try:
+        return dt.datetime.strptime(entry["timestamp"], "%Y-%m-%dT%H:%M:%SZ")\
+            .replace(tzinfo=dt.timezone.utc).timestamp()
+    except (KeyError, ValueError):
+        return None
+
+
+class _EdmcState:
+    """
+    The Part of EDMCs state-Dict that journal_entry reads, kept up to date like EDMC does it
+    """
+
+    def __init__(self):
+        self.cmdr = ""
+        self.system = ""
+        self.state: dict[str, Any] = {"ShipType": None, "Rank": {"Combat": (0, 0)}}
+
+    def update(self, entry: dict):
+        event = entry.get("event")
+        if event == "LoadGame":
+            self.cmdr = entry.get("Commander", "")
+        elif event == "Loadout":
+            self.state["ShipType"] = str(entry.get("Ship", "")).lower()
+        elif event == "Rank":
+            self.state["Rank"]["Combat"] = (entry.get("Combat", 0), 0)
+        elif event in ("Location", "FSDJump", "CarrierJump"):
+            self.system = entry.get("StarSystem", "")
+
+
+class _LatencyRecorder:
+    """
+    Matches Events arriving at the Stand-In to the Time journal_entry was called for them, by Timestamp
+    """
+
+    def __init__(self):
+        self.__sent: dict[int, collections.deque] = collections.defaultdict(collections.deque)
+        self.latencies: list[float] = []
+        self.last_arrival = time.perf_counter()
+        self.__mutex = threading.Lock()
+
+    def sent(self, timestamp: int):
+        with self.__mutex:
+            self.__sent[timestamp].append(time.perf_counter())
+
+    def on_events(self, events: list[dict]):
+        now = time.perf_counter()
+        with self.__mutex:
+            self.last_arrival = now
+            for event in events:
+                sent_times = self.__sent.get(event["timestamp"])
+                if sent_times:
+                    self.latencies.append(now - sent_times.popleft())
+
+
+_UNLIMITED_REQUESTS_PER_MINUTE = 1_000_000
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replays Journals through the live Path of the Plugin")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--journal", type=pathlib.Path, help="Journal File or Directory of Journal Files")
+    source.add_argument("--synthetic", type=int, metavar="KILLS", help="Generate a Journal with this many Kills")
+    parser.add_argument("--interval", type=float, default=5.0,
+                        help="Journal Seconds between synthetic Kills (default: 5)")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="1 = real Time, 10 = ten Times as fast, 0 = as fast as possible (default)")
+    parser.add_argument("--server-url", default=None,
+                        help="Use this Server instead of starting a Stand-In. Latencies are then not measured.")
+    parser.add_argument("--requests-per-minute", type=int, default=None,
+                        help="Client-side Rate Limit (default: none against the Stand-In, the Plugin's Setting "
+                             "against --server-url)")
+    parser.add_argument("--drain-timeout", type=float, default=60.0,
+                        help="Seconds to wait for the Queue to drain after the last Event")
+    parser.add_argument("--data-dir", type=pathlib.Path, default=None,
+                        help="App Directory for Killboard, Spool, ... (default: a temporary Directory)")
+    args = parser.parse_args()
+
+    _install_tk_stub()
+    from classes.headless_config import config
+    data_dir = args.data_dir or pathlib.Path(tempfile.mkdtemp(prefix="pvpbot-replay-"))
+    config.app_dir_path = data_dir
+    config.app_dir = str(data_dir)
+    config.set("classes.check_updates", False)
+    config.set("classes.api_key", "replay")
+    if args.requests_per_minute is not None:
+        config.set("classes.rate_limit_per_minute", args.requests_per_minute)
+    elif args.server_url is None:
+        # The Stand-In has no Limit. Pacing to the real Server's Limit would only measure the Token Bucket.
+        config.set("classes.rate_limit_per_minute", _UNLIMITED_REQUESTS_PER_MINUTE)
+        config.set("classes.rate_limit_burst", _UNLIMITED_REQUESTS_PER_MINUTE)
+
+    recorder = _LatencyRecorder()
+    server = None
+    if args.server_url is None:
+        import standin_server
+        state = standin_server.StandInState(None, True)
+        state.verbose = False
+        state.on_events = recorder.on_events
+        server = ThreadingHTTPServer(("127.0.0.1", 0), standin_server.build_handler(state))
+        threading.Thread(name="replay-standin", target=server.serve_forever, daemon=True).start()
+        config.set("classes.server_url", f"http://127.0.0.1:{server.server_port}")
+    else:
+        config.set("classes.server_url", args.server_url)
+
+    import load
+    from classes.logger_factory import logger
+    import logging
+    logger.setLevel(logging.WARNING)
+    load.plugin_start3(str(_ROOT))
+    load.plugin_app(_StubWidget())
+    import classes.event_handling as events
+    http_handler = events._get_http_handler()
+
+    queue_samples: list[int] = []
+    feeding = threading.Event()
+    feeding.set()
+
+    def sample_queue():
+        while feeding.is_set():
+            queue_samples.append(http_handler.pending_requests())
+            time.sleep(0.05)
+
+    sampler = threading.Thread(name="replay-queue-sampler", target=sample_queue, daemon=True)
+    sampler.start()
+
+    journal = _synthetic_journal(args.synthetic, args.interval) if args.synthetic is not None \
+        else _recorded_journals(args.journal)
+    edmc_state = _EdmcState()
+    call_durations: list[float] = []
+    kills_fed = 0
+    first_journal_time: Optional[float] = None
+    start = time.perf_counter()
+    for entry in journal:
+        journal_time = _unix_timestamp(entry)
+        if args.speed > 0 and journal_time is not None:
+            if first_journal_time is None:
+                first_journal_time = journal_time
+            delay = (journal_time - first_journal_time) / args.speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        edmc_state.update(entry)
+        if entry.get("event") in ("PVPKill", "Died") and journal_time is not None:
+            kills_fed += 1
+            recorder.sent(int(journal_time))
+        call_start = time.perf_counter()
+        load.journal_entry(edmc_state.cmdr, False, edmc_state.system, "", entry, edmc_state.state)
+        call_durations.append(time.perf_counter() - call_start)
+    fed_seconds = time.perf_counter() - start
+
+    # Wait until everything left the Queue and nothing arrived for a Moment
+    deadline = time.perf_counter() + args.drain_timeout
+    while time.perf_counter() < deadline:
+        if http_handler.pending_requests() == 0 and http_handler.in_flight_requests() == 0 \
+                and time.perf_counter() - recorder.last_arrival > 1.0:
+            break
+        time.sleep(0.1)
+    feeding.clear()
+    pending, in_flight = http_handler.pending_requests(), http_handler.in_flight_requests()
+    undelivered = pending + in_flight
+    total_seconds = max(recorder.last_arrival - start, fed_seconds)
+
+    print(f"Fed {len(call_durations)} Journal Events ({kills_fed} Kills/Deaths) in {fed_seconds:.2f}s")
+    print(f"journal_entry: median {statistics.median(call_durations) * 1e6:.0f} us, "
+          f"p99 {_percentile(call_durations, 99) * 1e6:.0f} us, max {max(call_durations) * 1e3:.1f} ms")
+    print(f"Send Queue: max {max(queue_samples, default=0)}, at the End {pending}, {in_flight} in flight")
+    print(f"UI Refreshes: {_StubWidget.refreshes}")
+    if server is not None:
+        latencies = recorder.latencies
+        print(f"Arrived at the Stand-In: {len(latencies)} Events, "
+              f"{len(latencies) / max(total_seconds, 0.001):.1f} Events/s end-to-end")
+        if len(latencies) > 0:
+            print(f"Latency: p50 {_percentile(latencies, 50) * 1e3:.1f} ms, "
+                  f"p90 {_percentile(latencies, 90) * 1e3:.1f} ms, "
+                  f"p99 {_percentile(latencies, 99) * 1e3:.1f} ms, max {max(latencies) * 1e3:.1f} ms")
+        server.shutdown()
+    from classes.latency_trace import STAGES, get_latency_tracer
+    # "journal" and "total" start at the Journal Timestamps. Unless those are replayed in real Time, they only show
+    # how old the Journal is.
+    stages = STAGES if args.speed == 1 else tuple(stage for stage in STAGES if stage not in ("journal", "total"))
+    print(get_latency_tracer().summary(stages))
+    if undelivered > 0:
+        print(f"NOT DRAINED: {undelivered} Requests were still waiting after {args.drain_timeout:.0f}s "
+              f"(see --drain-timeout and --requests-per-minute)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+A local Stand-In for the PvpBot Backend. It is meant for development only: point the Plugin (or cli.py) at it
+with --server-url http://127.0.0.1:8080 and watch what would be sent to the real Server.
+
+It understands the same Endpoints as the Backend, including the compact Bulk Format, which is decoded with the
+reference Decoder from classes/compact_format.py.
+
+    python3 tools/standin_server.py --port 8080
+"""
+import argparse
+import json
+import pathlib
+import sys
+import threading
+from typing import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Allow importing the classes-Package when started from anywhere
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from classes import compact_format  # noqa: E402
+
+
+class StandInState:
+    def __init__(self, api_key: str | None, supports_compact: bool, rejected_victims: list[str] | None = None):
+        self.api_key = api_key
+        self.supports_compact = supports_compact
+        self.rejected_victims = set(rejected_victims or [])
+        """
+        Requests containing a Kill of one of these Victims are rejected as a whole with a 400, like the Backend
+        does with a bad Event
+        """
+        self.verbose = True
+        """
+        Print a Line for every Request
+        """
+        self.events: list[dict] = []
+        self.requests = 0
+        self.bytes_received = 0
+        self.mutex = threading.Lock()
+        self.on_events: Callable[[list[dict]], None] | None = None
+        """
+        Called with every Batch of accepted Events, e.g. by tools/replay.py to measure Latencies
+        """
+
+
+def build_handler(state: StandInState):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def __reply(self, status: int, body: str = "", headers: dict | None = None):
+            encoded = body.encode("utf8")
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def __is_authorized(self) -> bool:
+            if state.api_key is None:
+                return True
+            return self.headers.get("Authorization") == f"Bearer {state.api_key}"
+
+        def __formats_header(self) -> dict:
+            if not state.supports_compact:
+                return {}
+            return {compact_format.FORMATS_HEADER: compact_format.COMPACT_FORMAT_NAME}
+
+        def do_GET(self):
+            if self.path != "/api/user":
+                self.__reply(404, "Unknown Endpoint")
+                return
+            if not self.__is_authorized():
+                self.__reply(401, "Bad API Key")
+                return
+            self.__reply(200, json.dumps({"name": "Stand-In User"}), self.__formats_header())
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length)
+            with state.mutex:
+                state.requests += 1
+                state.bytes_received += length
+            if not self.__is_authorized():
+                self.__reply(401, "Bad API Key")
+                return
+            try:
+                body = json.loads(raw)
+            except json.JSONDecodeError as e:
+                self.__reply(400, f"Body is not JSON: {e}")
+                return
+
+            if self.path == "/api/killboard/add/kill":
+                events = [body]
+            elif self.path == "/api/killboard/add/kill/bulk":
+                if self.headers.get(compact_format.FORMAT_REQUEST_HEADER) == compact_format.COMPACT_FORMAT_NAME:
+                    if not state.supports_compact:
+                        self.__reply(415, "Compact Format is not supported")
+                        return
+                    try:
+                        events = compact_format.decode(body)
+                    except (KeyError, ValueError) as e:
+                        self.__reply(400, f"Malformed compact Body: {e}")
+                        return
+                else:
+                    events = body["kills"]
+            else:
+                self.__reply(404, "Unknown Endpoint")
+                return
+
+            for event in events:
+                if event["victim"]["name"] in state.rejected_victims:
+                    self.__reply(400, f"Victim {event['victim']['name']} is not allowed")
+                    return
+
+            with state.mutex:
+                state.events.extend(events)
+                total = len(state.events)
+            if state.on_events is not None:
+                state.on_events(events)
+            if state.verbose:
+                print(f"{self.path}: {len(events)} Events in {length} Bytes. {total} Events received so far.",
+                      flush=True)
+            self.__reply(200, json.dumps({"accepted": len(events)}))
+
+        def log_message(self, format, *args):
+            # The default Handler logs every Request to stderr. The Summary printed in do_POST is enough.
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Stand-In for the PvpBot Backend")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--api-key", default=None, help="Only accept this API Key. Accepts any Key if not set.")
+    parser.add_argument("--no-compact", action="store_true", help="Do not announce the compact Bulk Format")
+    parser.add_argument("--reject-victim", action="append", default=[],
+                        help="Reject every Request with a Kill of this Victim. Can be passed multiple times.")
+    args = parser.parse_args()
+
+    state = StandInState(args.api_key, not args.no_compact, args.reject_victim)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), build_handler(state))
+    print(f"PvpBot Stand-In listening on http://127.0.0.1:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()